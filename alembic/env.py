@@ -1,4 +1,5 @@
 from logging.config import fileConfig
+from database import DATABASE_URL, to_sync_url
 from models import Base
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -13,6 +14,10 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Та же база, что у приложения: DATABASE_URL вместо sqlalchemy.url из alembic.ini
+# (миграции идут синхронным драйвером; % экранируется для configparser)
+config.set_main_option("sqlalchemy.url", to_sync_url(DATABASE_URL).replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
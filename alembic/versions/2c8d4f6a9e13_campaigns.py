@@ -0,0 +1,70 @@
+"""campaigns
+
+Revision ID: 2c8d4f6a9e13
+Revises: 5f3b9d1e8a24
+Create Date: 2026-10-17 20:05:41.227810
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c8d4f6a9e13'
+down_revision: Union[str, Sequence[str], None] = '5f3b9d1e8a24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Карточки, которые раньше лежали в static/ads.json
+SEED = [
+    (1, "Support for Victims", "War in Ukraine", "Help those affected by the war in Ukraine by making a donation for recovery.", "uploads/obj_1.jpg"),
+    (2, "Children in Orphanages Need You", "Help for Children in Orphanages", "Help give children a chance for a happy childhood — every contribution counts.", "uploads/obj_2.jpeg"),
+    (3, "Support the Armed Forces of Ukraine", "Support for the Armed Forces of Ukraine", "Help our defenders get everything they need for victory — transport, communication tools, reconnaissance equipment, and other gear that saves lives on the front line.", "uploads/obj_3.png"),
+    (4, "Help Those Who Cannot Ask for Help", "Help for Homeless Animals", "Thousands of homeless animals are left without food, warmth, and care every day. Your help can give them a chance at a new life.", "uploads/obj_4.jpg"),
+    (5, "Support Education", "Educational Projects", "Help children gain access to quality education and opportunities for growth.", "uploads/obj_5.jpg"),
+    (6, "Caring for the Older Generation", "Support for the Elderly", "Support elderly people who need care and attention.", "uploads/obj_6.jpg"),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    campaigns = op.create_table(
+        'campaigns',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=120), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('image', sa.String(length=255), nullable=True),
+        sa.Column('link', sa.String(length=255), nullable=True),
+        sa.Column('goal', sa.Float(), nullable=True),
+        sa.Column('raised', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('donations_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('position', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active', sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_campaigns_id'), 'campaigns', ['id'], unique=False)
+    op.add_column('donations', sa.Column('campaign_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_donations_campaign_id'), 'donations', ['campaign_id'], unique=False)
+    op.create_foreign_key('fk_donations_campaign_id', 'donations', 'campaigns', ['campaign_id'], ['id'])
+
+    now = datetime.utcnow()
+    op.bulk_insert(campaigns, [
+        {"id": id_, "title": title, "description": description, "text": text, "image": image,
+         "link": None, "goal": None, "position": id_, "active": True, "created_at": now, "updated_at": now}
+        for id_, title, description, text, image in SEED
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_donations_campaign_id', 'donations', type_='foreignkey')
+    op.drop_index(op.f('ix_donations_campaign_id'), table_name='donations')
+    op.drop_column('donations', 'campaign_id')
+    op.drop_index(op.f('ix_campaigns_id'), table_name='campaigns')
+    op.drop_table('campaigns')
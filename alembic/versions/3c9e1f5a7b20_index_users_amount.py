@@ -0,0 +1,28 @@
+"""index users.amount
+
+Revision ID: 3c9e1f5a7b20
+Revises: fabdce2fc019
+Create Date: 2026-10-17 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e1f5a7b20'
+down_revision: Union[str, Sequence[str], None] = 'fabdce2fc019'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_users_amount'), 'users', ['amount'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_amount'), table_name='users')
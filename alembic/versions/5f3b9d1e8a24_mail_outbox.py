@@ -0,0 +1,47 @@
+"""mail_outbox
+
+Revision ID: 5f3b9d1e8a24
+Revises: e7a0d35b9c18
+Create Date: 2026-10-17 18:42:13.508214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f3b9d1e8a24'
+down_revision: Union[str, Sequence[str], None] = 'e7a0d35b9c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'mail_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sender', sa.String(length=255), nullable=False),
+        sa.Column('recipients', sa.Text(), nullable=False),
+        sa.Column('message', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_mail_outbox_id'), 'mail_outbox', ['id'], unique=False)
+    op.create_index(op.f('ix_mail_outbox_sent_at'), 'mail_outbox', ['sent_at'], unique=False)
+    op.create_index(op.f('ix_mail_outbox_claim_token'), 'mail_outbox', ['claim_token'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_mail_outbox_claim_token'), table_name='mail_outbox')
+    op.drop_index(op.f('ix_mail_outbox_sent_at'), table_name='mail_outbox')
+    op.drop_index(op.f('ix_mail_outbox_id'), table_name='mail_outbox')
+    op.drop_table('mail_outbox')
@@ -0,0 +1,63 @@
+"""donations ledger and donation_totals
+
+Revision ID: 8d2b6e0c4a91
+Revises: 3c9e1f5a7b20
+Create Date: 2026-10-17 11:40:07.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2b6e0c4a91'
+down_revision: Union[str, Sequence[str], None] = '3c9e1f5a7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица donations создавалась вне миграций — добавляем только недостающие колонки
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('donations')}
+    if 'user_id' not in existing:
+        op.add_column('donations', sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False))
+        op.create_index(op.f('ix_donations_user_id'), 'donations', ['user_id'], unique=False)
+    if 'created_at' not in existing:
+        op.add_column('donations', sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+    op.add_column('donations', sa.Column('stripe_session_id', sa.String(length=255), nullable=True))
+    op.create_unique_constraint('uq_donations_stripe_session_id', 'donations', ['stripe_session_id'])
+
+    op.create_table(
+        'donation_totals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=8), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'period', 'period_start', name='uq_donation_totals_user_period'),
+    )
+    op.create_index(op.f('ix_donation_totals_id'), 'donation_totals', ['id'], unique=False)
+    op.create_index(op.f('ix_donation_totals_user_id'), 'donation_totals', ['user_id'], unique=False)
+    op.create_index('ix_donation_totals_period_total', 'donation_totals', ['period', 'period_start', 'total'], unique=False)
+
+    # Суммы, накопленные до появления журнала, переносим в агрегат "за всё время"
+    op.execute(
+        "INSERT INTO donation_totals (user_id, period, period_start, total, count) "
+        "SELECT id, 'all', '1970-01-01', amount, 0 FROM users WHERE amount > 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_donation_totals_period_total', table_name='donation_totals')
+    op.drop_index(op.f('ix_donation_totals_user_id'), table_name='donation_totals')
+    op.drop_index(op.f('ix_donation_totals_id'), table_name='donation_totals')
+    op.drop_table('donation_totals')
+    op.drop_constraint('uq_donations_stripe_session_id', 'donations', type_='unique')
+    op.drop_column('donations', 'stripe_session_id')
@@ -0,0 +1,30 @@
+"""stripe_events claim_token
+
+Revision ID: e7a0d35b9c18
+Revises: c41f7a9e2d63
+Create Date: 2026-10-17 14:21:40.275193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a0d35b9c18'
+down_revision: Union[str, Sequence[str], None] = 'c41f7a9e2d63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stripe_events', sa.Column('claim_token', sa.String(length=32), nullable=True))
+    op.create_index(op.f('ix_stripe_events_claim_token'), 'stripe_events', ['claim_token'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_stripe_events_claim_token'), table_name='stripe_events')
+    op.drop_column('stripe_events', 'claim_token')
@@ -0,0 +1,247 @@
+"""Обработка аватаров: загрузка во временный файл, рендиции в пуле процессов.
+
+Загруженный файл копируется кусками во временный файл в отдельном
+потоке (попутно считается SHA-256 и проверяется размер), а декодирование
+и ресайз идут в отдельном процессе, не занимая event loop и GIL. Из
+одного исходника получаются квадратные рендиции SIZES x FORMATS с
+именами по хэшу содержимого:
+
+    static/avatars/<hash>-64.webp, <hash>-64.jpeg, ..., <hash>-256.jpeg
+
+В `users.avatar` хранится только `<hash>`; URL нужного размера строит
+`avatar_url` (доступен в шаблонах). Старые аватары, сохранённые целиком
+под именем с расширением, отдаются как есть.
+
+Одну картинку могут загрузить несколько пользователей, поэтому файлы
+удаляются, только если на хэш больше никто не ссылается. Загрузка держит
+блокировку хэша в Redis (`avatar:lock:<hash>`) до коммита ссылки на него,
+а `remove_unused` проверяет ссылки и удаляет файлы под той же
+блокировкой: иначе загрузка, заставшая готовые рендиции, могла бы
+сослаться на файлы, которые тут же удалят.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import UploadFile
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import static_assets
+import uploads
+
+logger = logging.getLogger(__name__)
+
+AVATAR_DIR = os.getenv("AVATAR_DIR", "static/avatars")
+AVATAR_URL = "/static/avatars"
+DEFAULT_AVATAR = "default-avatar.png"
+MAX_AVATAR_SIZE = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000  # защита от «бомб» с огромным разрешением
+WORKERS = int(os.getenv("AVATAR_WORKERS", "2"))
+
+SIZES = (64, 128, 256)
+FORMATS = ("webp", "jpeg")
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP"}
+SNIFFED_TYPES = {"jpeg", "png", "webp"}
+CHUNK_SIZE = 64 * 1024
+
+LOCK_KEY = "avatar:lock:{}"
+LOCK_TTL = 60
+LOCK_WAIT = 10.0
+
+# снимает блокировку, только если она всё ещё наша
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_executor: ProcessPoolExecutor | None = None
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class TooLarge(Exception):
+    pass
+
+
+def avatar_url(avatar: str | None, size: int = 64, fmt: str = "webp") -> str:
+    """URL рендиции не меньше `size` px (с запасом на retina — передавайте 2x)."""
+    if not avatar:
+        return static_assets.static_url(DEFAULT_AVATAR)
+    if "." in avatar:
+        # аватар до появления рендиций — исходный файл
+        return f"{AVATAR_URL}/{avatar}"
+    size = next((s for s in SIZES if s >= size), SIZES[-1])
+    return f"{AVATAR_URL}/{avatar}-{size}.{fmt}"
+
+
+def _rendition_paths(name: str) -> list[str]:
+    return [os.path.join(AVATAR_DIR, f"{name}-{size}.{fmt}") for size in SIZES for fmt in FORMATS]
+
+
+# --- Работа в процессе пула ---
+def _render(source_path: str, name: str) -> None:
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        with Image.open(source_path) as img:
+            if img.format not in ALLOWED_FORMATS:
+                raise InvalidImage(f"Unsupported image format {img.format}")
+            # JPEG можно декодировать сразу в уменьшенном масштабе
+            img.draft("RGB", (SIZES[-1], SIZES[-1]))
+            img = ImageOps.exif_transpose(img)
+            img.load()
+    except InvalidImage:
+        raise
+    except Exception as e:
+        raise InvalidImage(str(e)) from None
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        flat = Image.new("RGB", img.size, "white")
+        flat.paste(img, mask=img.getchannel("A"))
+    else:
+        flat = img.convert("RGB")
+
+    for size in sorted(SIZES, reverse=True):
+        square = ImageOps.fit(flat, (size, size), Image.LANCZOS)
+        for fmt in FORMATS:
+            path = os.path.join(AVATAR_DIR, f"{name}-{size}.{fmt}")
+            tmp_path = f"{path}.tmp"
+            if fmt == "webp":
+                square.save(tmp_path, "WEBP", quality=80, method=4)
+            else:
+                square.save(tmp_path, "JPEG", quality=85, optimize=True, progressive=True)
+            os.replace(tmp_path, path)
+
+
+def _warm() -> None:
+    from PIL import Image, ImageOps  # noqa: F401
+
+
+# --- API для обработчиков ---
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=WORKERS)
+    return _executor
+
+
+def _spool(source, source_path: str) -> str:
+    """Копирует загрузку во временный файл (в потоке) и возвращает имя по хэшу."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(source_path, "wb") as tmp:
+        while chunk := source.read(CHUNK_SIZE):
+            # тип определяем по первым байтам, до всякого декодирования
+            if size == 0 and uploads.sniff_image(chunk) not in SNIFFED_TYPES:
+                raise InvalidImage("Not a PNG, JPEG or WebP image")
+            size += len(chunk)
+            if size > MAX_AVATAR_SIZE:
+                raise TooLarge()
+            digest.update(chunk)
+            tmp.write(chunk)
+    if size == 0:
+        raise InvalidImage("Empty file")
+    return digest.hexdigest()[:32]
+
+
+@asynccontextmanager
+async def _lock(redis: Redis, name: str, wait: float = LOCK_WAIT):
+    """Блокировка хэша на время `async with`; даёт True, если взята за `wait` секунд."""
+    key = LOCK_KEY.format(name)
+    token = secrets.token_hex(8)
+    deadline = time.monotonic() + wait
+    acquired = False
+    try:
+        while not (acquired := bool(await redis.set(key, token, nx=True, ex=LOCK_TTL))):
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.05)
+    except RedisError:
+        logger.warning("Avatar lock unavailable in Redis", exc_info=True)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                await redis.eval(RELEASE_LOCK, 1, key, token)
+            except RedisError:
+                logger.warning("Failed to release avatar lock %s", name, exc_info=True)
+
+
+@asynccontextmanager
+async def save_upload(redis: Redis, upload: UploadFile):
+    """Сохраняет загруженный аватар и отдаёт его имя для `users.avatar`.
+
+    Ссылку на аватар нужно закоммитить внутри `async with`: до выхода
+    держится блокировка хэша, и `remove_unused` файлы не удалит.
+    Бросает `TooLarge` (> MAX_AVATAR_SIZE) и `InvalidImage`.
+    """
+    os.makedirs(AVATAR_DIR, exist_ok=True)
+    fd, source_path = tempfile.mkstemp(prefix="avatar-")
+    os.close(fd)
+    try:
+        name = await asyncio.to_thread(_spool, upload.file, source_path)
+        async with _lock(redis, name) as locked:
+            if not locked:
+                logger.warning("Saving avatar %s without its lock", name)
+            # тот же файл уже загружали — рендиции есть
+            if not all(os.path.exists(path) for path in _rendition_paths(name)):
+                await asyncio.get_running_loop().run_in_executor(_pool(), _render, source_path, name)
+            yield name
+    finally:
+        os.unlink(source_path)
+
+
+async def remove_unused(redis: Redis, db: AsyncSession, avatar: str | None) -> bool:
+    """Удаляет файлы аватара, если на него больше никто не ссылается. Вызывать после коммита."""
+    if not avatar:
+        return False
+    async with _lock(redis, avatar, wait=0) as locked:
+        # ту же картинку сейчас загружают — файлы снова нужны
+        if not locked:
+            return False
+        if await db.scalar(select(models.User.id).where(models.User.avatar == avatar).limit(1)):
+            return False
+        await asyncio.to_thread(remove, avatar)
+        return True
+
+
+def remove(avatar: str | None) -> None:
+    """Удаляет файлы аватара (через `remove_unused`, под блокировкой хэша)."""
+    if not avatar:
+        return
+    paths = [os.path.join(AVATAR_DIR, avatar)] if "." in avatar else _rendition_paths(avatar)
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.warning("Failed to delete avatar file %s", path, exc_info=True)
+
+
+async def prewarm() -> None:
+    """Поднимает процессы пула и импортирует в них PIL до первой загрузки."""
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(_pool(), _warm) for _ in range(WORKERS)))
+
+
+def shutdown() -> None:
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
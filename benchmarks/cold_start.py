@@ -0,0 +1,79 @@
+"""Бенчмарк холодного старта: сколько проходит от запуска процесса до ответа.
+
+Меряется два числа, каждое — медиана по --runs свежим процессам:
+
+- `import main`     — импорт приложения в новом интерпретаторе;
+- `first response`  — запуск uvicorn до первого ответа 200 на --path
+  (нужны те же DATABASE_URL и REDIS_URL, что и приложению; схема должна
+  быть уже создана — `alembic upgrade head` или `python database.py create`).
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --runs 5 --skip-server
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def first_response(app: str, path: str, timeout: float) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+                time.sleep(0.005)
+        raise TimeoutError(f"no response from {path} in {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args):
+    imports = [import_time(args.app.split(":")[0]) for _ in range(args.runs)]
+    print(f"import {args.app.split(':')[0]:<14} median {statistics.median(imports) * 1e3:7.0f} ms  "
+          f"min {min(imports) * 1e3:.0f} ms")
+    if args.skip_server:
+        return
+    responses = [first_response(args.app, args.path, args.timeout) for _ in range(args.runs)]
+    print(f"first response {args.path:<8} median {statistics.median(responses) * 1e3:7.0f} ms  "
+          f"min {min(responses) * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--skip-server", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+"""Микробенчмарк CSRF-токенов: токенов в секунду на выдачу и проверку.
+
+Сравниваются:
+
+- `per-call`  — как было: новый URLSafeTimedSerializer на каждый вызов
+  (get_csrf_serializer() в routers/auth.py), dumps/loads;
+- `csrf.py`   — подписчик, построенный один раз; проверка без JSON;
+- `cached`    — повторная проверка уже проверенного токена (cookie,
+  которую /api/check-auth и /api/events присылают на каждом запросе).
+
+    python benchmarks/csrf_tokens.py --iterations 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itsdangerous import URLSafeTimedSerializer
+
+import csrf
+
+SECRET = csrf.SECRETS[0]
+
+
+def per_second(fn, iterations: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def legacy_generate() -> str:
+    return URLSafeTimedSerializer(SECRET).dumps("token")
+
+
+def legacy_validate(token: str) -> bool:
+    try:
+        URLSafeTimedSerializer(SECRET).loads(token, max_age=csrf.CSRF_MAX_AGE)
+        return True
+    except Exception:
+        return False
+
+
+def main(args):
+    n = args.iterations
+    token = csrf.generate()
+    tokens = [csrf.generate() for _ in range(n)]
+    assert legacy_validate(token) and csrf.validate(legacy_generate())
+
+    def fresh_validate(it=iter(tokens * 2)):
+        # каждый раз новый токен: подпись проверяется, кэш не помогает
+        csrf._valid.clear()
+        return csrf.validate(next(it))
+
+    rows = [
+        ("generate", per_second(legacy_generate, n), per_second(csrf.generate, n), None),
+        ("validate", per_second(lambda: legacy_validate(token), n), per_second(fresh_validate, n),
+         per_second(lambda: csrf.validate(token), n)),
+    ]
+    print(f"{'':10} {'per-call':>14} {'csrf.py':>14} {'cached':>14}   tokens/s")
+    for name, old, new, cached in rows:
+        cached = f"{cached:>14,.0f}" if cached else f"{'-':>14}"
+        print(f"{name:10} {old:>14,.0f} {new:>14,.0f} {cached}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50000)
+    main(parser.parse_args())
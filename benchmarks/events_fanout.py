@@ -0,0 +1,91 @@
+"""Бенчмарк раздачи push-событий: N простаивающих соединений в одном процессе.
+
+Каждое «соединение» — тот же генератор, что отдаёт /api/events
+(routers/events_api.event_stream), подписанный на общий EventHub. Бенчмарк
+меряет память на соединение и время, за которое широковещательное событие
+(например, дифф топа) доходит до всех соединений. Redis и сокеты не
+участвуют: Redis отдаёт процессу одно сообщение независимо от числа
+вкладок, а запись в сокет — работа сервера, а не раздачи.
+
+    python benchmarks/events_fanout.py --connections 10000 --events 20
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import events
+from routers.events_api import event_stream
+
+
+async def consume(hub, user_id, received):
+    async for chunk in event_stream(hub, user_id, time.time() + 3600):
+        if chunk.startswith("event:"):
+            received.append(time.perf_counter())
+
+
+async def main(args):
+    hub = events.EventHub(redis=None)
+    received = []
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [
+        asyncio.create_task(consume(hub, user_id, received))
+        for user_id in range(args.connections)
+    ]
+    while hub.connections() < args.connections:
+        await asyncio.sleep(0)
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / args.connections
+    tracemalloc.stop()
+
+    # типичный дифф топа: один донатер поднялся на первое место, остальные сдвинулись
+    diff = {
+        "version": 2, "base": 1,
+        "set": [{"rank": 1, "username": "user7", "amount": 1500, "avatar": None,
+                 "philanthrop_level": "Elite-1", "last_donation_time": "2024-01-01T12:00:00"}],
+        "moves": {f"user{i}": i + 1 for i in range(1, 7)},
+        "remove": [],
+    }
+    message = json.dumps({"event": "leaderboard-diff", "data": diff, "user_id": None})
+
+    latencies = []
+    for _ in range(args.events):
+        received.clear()
+        start = time.perf_counter()
+        hub.dispatch(message)
+        while len(received) < args.connections:
+            await asyncio.sleep(0)
+        latencies.append(max(received) - start)
+
+    # адресное событие одному пользователю не должно зависеть от числа соединений
+    start = time.perf_counter()
+    for user_id in range(1000):
+        hub.dispatch(json.dumps({"event": "donation-credited", "data": {"rank": 1}, "user_id": user_id}))
+    targeted = (time.perf_counter() - start) / 1000
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    print(f"connections           {args.connections}")
+    print(f"memory per connection {per_connection / 1024:.1f} KiB")
+    print(f"broadcast to all      p50 {latencies[len(latencies) // 2] * 1e3:.1f} ms  max {latencies[-1] * 1e3:.1f} ms")
+    print(f"targeted dispatch     {targeted * 1e6:.1f} us")
+    print(f"open after close      {hub.connections()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
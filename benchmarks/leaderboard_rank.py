@@ -0,0 +1,101 @@
+"""Бенчмарк места пользователя и окна ±5: Redis sorted set против SQL COUNT(*).
+
+Заполняет таблицу лидеров N пользователями в отдельной базе Redis
+(по умолчанию redis://localhost:6379/15 — не запускайте на рабочей)
+и такую же таблицу users в SQLite в памяти.
+
+    python benchmarks/leaderboard_rank.py --users 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redis.asyncio import Redis
+
+import leaderboard
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+def report(name, samples):
+    total = sum(samples)
+    print(
+        f"{name:<28} p50={percentile(samples, 50) * 1e3:8.3f} ms  "
+        f"p99={percentile(samples, 99) * 1e3:8.3f} ms  {len(samples) / total:10.0f} ops/s"
+    )
+
+
+async def seed_redis(redis, amounts, chunk=10_000):
+    await redis.delete(leaderboard.BOARD_KEY, leaderboard.USERNAMES_KEY)
+    pipe = redis.pipeline(transaction=False)
+    for user_id, amount in enumerate(amounts, start=1):
+        pipe.zadd(leaderboard.BOARD_KEY, {str(user_id): amount})
+        pipe.hset(leaderboard.USER_KEY.format(user_id), mapping={"username": f"user{user_id}"})
+        pipe.hset(leaderboard.USERNAMES_KEY, f"user{user_id}", str(user_id))
+        if user_id % chunk == 0:
+            await pipe.execute()
+    await pipe.execute()
+
+
+async def main(args):
+    rng = random.Random(42)
+    amounts = [float(rng.randint(1, 100_000)) for _ in range(args.users)]
+    probes = [rng.randint(1, args.users) for _ in range(args.probes)]
+
+    redis = Redis.from_url(args.redis_url, encoding="utf-8", decode_responses=True)
+    start = time.perf_counter()
+    await seed_redis(redis, amounts)
+    print(f"Seeded {args.users} users into Redis in {time.perf_counter() - start:.1f} s")
+
+    samples = []
+    for user_id in probes:
+        t = time.perf_counter()
+        await leaderboard.rank(redis, user_id)
+        samples.append(time.perf_counter() - t)
+    report("redis rank", samples)
+
+    samples = []
+    for user_id in probes:
+        t = time.perf_counter()
+        await leaderboard.around(redis, user_id, 5)
+        samples.append(time.perf_counter() - t)
+    report("redis around ±5", samples)
+
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, amount REAL)")
+    db.executemany("INSERT INTO users VALUES (?, ?)", enumerate(amounts, start=1))
+    for label in ("sql COUNT(*) no index", "sql COUNT(*) with index"):
+        samples = []
+        for user_id in probes[: args.sql_probes]:
+            t = time.perf_counter()
+            db.execute(
+                "SELECT COUNT(*) FROM users WHERE amount > (SELECT amount FROM users WHERE id = ?)", (user_id,)
+            ).fetchone()
+            samples.append(time.perf_counter() - t)
+        report(label, samples)
+        db.execute("CREATE INDEX IF NOT EXISTS ix_users_amount ON users (amount)")
+
+    if not args.keep:
+        await redis.delete(leaderboard.BOARD_KEY, leaderboard.USERNAMES_KEY)
+        async for key in redis.scan_iter(match=leaderboard.USER_KEY.format("*"), count=10_000):
+            await redis.delete(key)
+    await redis.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--probes", type=int, default=10_000)
+    parser.add_argument("--sql-probes", type=int, default=200)
+    parser.add_argument("--redis-url", default=os.getenv("BENCH_REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые ключи после прогона")
+    asyncio.run(main(parser.parse_args()))
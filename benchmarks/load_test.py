@@ -0,0 +1,73 @@
+"""Нагрузочный тест запущенного приложения: запросы/с и задержки p50/p99.
+
+Запускается против работающего сервера, например до и после изменения:
+
+    uvicorn main:app --workers 1 &
+    python benchmarks/load_test.py http://localhost:8000/auth/welcome --cookie session=...
+    python benchmarks/load_test.py http://localhost:8000/api/check-auth --cookie session=... --cookie csrf_token=...
+
+Переход на AsyncEngine (user-007), GET /auth/welcome, один процесс uvicorn,
+SQLite в файле, 500 пользователей, 8 с на замер:
+
+    параллельно  до (Session)                  после (AsyncSession)
+    1            179 req/s  p99   8.9 ms       139 req/s  p99   11.6 ms
+    5            271 req/s  p99  32.7 ms       163 req/s  p99   47.8 ms
+    10           206 req/s  p99 108.9 ms       159 req/s  p99  131.1 ms
+    50           зависает (ReadTimeout)         69 req/s  p99 2474.5 ms
+
+На SQLite асинхронный драйвер медленнее: каждый запрос aiosqlite — переход
+в поток. Зато синхронная версия при 15+ параллельных запросах исчерпывает
+пул (5 + 10) и ждёт соединение прямо в event loop: вернуть соединения
+некому, процесс перестаёт отвечать совсем. Postgres/MySQL в этом замере нет.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+async def worker(client, url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(args):
+    cookies = dict(item.split("=", 1) for item in args.cookie)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(cookies=cookies, limits=limits, timeout=30, follow_redirects=False) as client:
+        # прогрев: пул соединений к БД, кэши шаблонов
+        await asyncio.gather(*(client.get(args.url) for _ in range(args.concurrency)))
+
+        latencies, errors = [], []
+        deadline = time.perf_counter() + args.duration
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, args.url, deadline, latencies, errors) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{args.url}  concurrency={args.concurrency}  duration={elapsed:.1f}s")
+    print(f"requests  {len(latencies)}  errors {len(errors)}")
+    print(f"req/s     {len(latencies) / elapsed:.0f}")
+    print(f"p50       {percentile(latencies, 50) * 1e3:.1f} ms")
+    print(f"p99       {percentile(latencies, 99) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--cookie", action="append", default=[], help="name=value, можно несколько раз")
+    asyncio.run(main(parser.parse_args()))
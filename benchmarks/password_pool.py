@@ -0,0 +1,78 @@
+"""Бенчмарк входов: bcrypt прямо в event loop (как было) против пула потоков.
+
+Симулирует N одновременных входов и параллельно измеряет задержку event
+loop (насколько опаздывает `asyncio.sleep(0.01)`): с bcrypt в loop
+остальные запросы процесса стоят, пока идёт проверка пароля.
+
+    python benchmarks/password_pool.py --logins 200 --concurrency 50 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def heartbeat(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0.01)
+        lags.append(loop.time() - start - 0.01)
+
+
+async def run(name, verify, hashed, logins, concurrency):
+    import passwords
+
+    semaphore = asyncio.Semaphore(concurrency)
+    lags, stop = [], asyncio.Event()
+    rejected = 0
+
+    async def login():
+        nonlocal rejected
+        async with semaphore:
+            try:
+                assert await verify("correct horse", hashed)
+            except passwords.Busy:
+                rejected += 1
+
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+
+    cores = os.cpu_count() or 1
+    done = logins - rejected
+    lags.sort()
+    print(
+        f"{name:<8} {done / elapsed:7.1f} logins/s  {done / elapsed / cores:6.1f} per core  "
+        f"loop lag p99 {lags[int(len(lags) * 0.99)] * 1e3:7.1f} ms  max {lags[-1] * 1e3:7.1f} ms  "
+        f"rejected {rejected}"
+    )
+
+
+async def main(args):
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    import passwords
+
+    hashed = passwords.pwd_context.hash("correct horse")
+
+    async def inline(password, hashed):
+        return passwords.pwd_context.verify(password, hashed)
+
+    print(f"bcrypt rounds {args.rounds}, {os.cpu_count()} cores, pool {passwords.WORKERS} threads, queue limit {passwords.QUEUE_LIMIT}")
+    await run("inline", inline, hashed, args.logins, args.concurrency)
+    await run("pool", passwords.verify_password, hashed, args.logins, args.concurrency)
+    passwords.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""Бенчмарк рендера страниц: время на один GET для каждой страницы.
+
+Сравниваются три способа отдать одну и ту же страницу:
+
+- `per-router`   — как было: свой Jinja2Templates(directory=...) в каждом
+  роутере, TemplateResponse с проверкой mtime шаблона на каждом рендере;
+- `shared`       — общее окружение templating.env (без auto_reload);
+- `prerendered`  — templating.render_static: склейка готовых кусков с токеном.
+
+Отдельно меряется холодная загрузка всех шаблонов (первый запрос после
+старта процесса) без кэша байткода и с тёплым FileSystemBytecodeCache.
+
+    python benchmarks/template_render.py --iterations 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from starlette.requests import Request
+
+import templating
+
+TOKEN = "ImFiY2RlZmdoaWprbG1ub3BxcnN0dXZ3eHl6Ig.ZxYz12.abcdefghijklmnopqrstuvwxyz0"
+
+
+def make_request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+
+
+def per_call(fn, iterations: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def cold_load(names, bytecode_cache) -> float:
+    env = Environment(loader=FileSystemLoader(templating.TEMPLATE_DIR), autoescape=True, bytecode_cache=bytecode_cache)
+    env.globals["avatar_url"] = templating.avatars.avatar_url
+    env.globals["static_url"] = templating.static_assets.static_url
+    start = time.perf_counter()
+    for name in names:
+        env.get_template(name)
+    return time.perf_counter() - start
+
+
+def main(args):
+    legacy = Jinja2Templates(directory=templating.TEMPLATE_DIR)
+    legacy.env.globals["static_url"] = templating.static_assets.static_url
+    request = make_request()
+    templating.warm()
+
+    print(f"{'page':24} {'per-router':>12} {'shared':>12} {'prerendered':>12}")
+    for name in templating.STATIC_PAGES:
+        old = per_call(lambda: legacy.TemplateResponse(request, name, {"csrf_token": TOKEN}), args.iterations)
+        shared = per_call(lambda: templating.templates.TemplateResponse(request, name, {"csrf_token": TOKEN}), args.iterations)
+        static = per_call(lambda: templating.render_static(name, TOKEN), args.iterations)
+        print(f"{name:24} {old * 1e6:>10.1f}us {shared * 1e6:>10.1f}us {static * 1e6:>10.1f}us")
+
+    names = sorted(os.listdir(templating.TEMPLATE_DIR))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        no_cache = cold_load(names, None)
+        cold_load(names, FileSystemBytecodeCache(cache_dir))  # заполняем кэш
+        cached = cold_load(names, FileSystemBytecodeCache(cache_dir))
+    print(f"\ncold load of {len(names)} templates: no bytecode cache {no_cache * 1e3:.1f} ms, "
+          f"warm bytecode cache {cached * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""Бенчмарк применения донатов: по одному (как было в stripe_webhook) против пачек.
+
+Оба варианта работают с одной и той же схемой во временной базе
+(по умолчанию SQLite-файл; любую другую можно передать через --database-url).
+
+    python benchmarks/webhook_batch.py --users 1000 --events 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import donations
+import models
+import webhook_queue
+from database import Base, to_async_url
+
+
+def make_events(users, count, prefix):
+    rng = random.Random(7)
+    for i in range(count):
+        event = {
+            "id": f"evt_{prefix}_{i}",
+            "type": "checkout.session.completed",
+            "created": int(time.time()),
+            "data": {"object": {
+                "id": f"cs_{prefix}_{i}",
+                "customer_details": {"email": "donor@example.com"},
+                "amount_total": rng.randint(1, 100) * 100,
+                "client_reference_id": str(rng.randint(1, users)),
+            }},
+        }
+        yield event
+
+
+async def setup(url, users):
+    engine = create_async_engine(to_async_url(url))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add_all(models.User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="x") for i in range(users))
+        await db.commit()
+    return session_factory
+
+
+async def run_inline(session_factory, events):
+    """Прежний путь: SELECT пользователя, UPDATE, COMMIT на каждый донат."""
+    async with session_factory() as db:
+        for event in events:
+            session = event["data"]["object"]
+            user = await db.get(models.User, int(session["client_reference_id"]))
+            user.amount += session["amount_total"] // 100
+            user.philanthrop_level = donations.philanthrop_level(user.amount)
+            await db.commit()
+
+
+async def run_batched(session_factory, events, batch_size):
+    async with session_factory() as db:
+        for event in events:
+            await webhook_queue.store_event(db, event, json.dumps(event))
+    start = time.perf_counter()
+    while (await webhook_queue.process_batch(session_factory, batch_size))[0]:
+        pass
+    return time.perf_counter() - start
+
+
+async def main(args):
+    url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+    session_factory = await setup(url, args.users)
+    events = list(make_events(args.users, args.events, "inline"))
+    start = time.perf_counter()
+    await run_inline(session_factory, events)
+    inline = time.perf_counter() - start
+    print(f"inline        {args.events / inline:10.0f} events/s")
+
+    for batch_size in args.batch_sizes:
+        session_factory = await setup(url, args.users)
+        events = list(make_events(args.users, args.events, f"batch{batch_size}"))
+        elapsed = await run_batched(session_factory, events, batch_size)
+        print(f"batch {batch_size:<6}  {args.events / elapsed:10.0f} events/s  x{inline / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50, 200, 1000])
+    parser.add_argument("--database-url", default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""Старт процесса: замер шагов и фоновый прогрев тяжёлых зависимостей.
+
+Импорт `main` не трогает базу и не грузит то, что нужно не на каждом
+запросе: stripe, PIL и сборка MIME-писем импортируются при первом
+использовании. Чтобы первый платёж или аватар не платил за импорт, после
+старта (когда порт уже открыт) `prewarm` подгружает их в фоне, а пул
+процессов аватаров заранее поднимает воркеры с PIL.
+
+Схема базы на старте не создаётся: это отдельный шаг перед запуском
+(`alembic upgrade head`, для локальной SQLite — `python database.py create`).
+
+Профиль старта:
+
+    STARTUP_PROFILE=1 uvicorn main:app   # время шагов startup и прогрева в логе
+    python boot.py profile               # время импорта по модулям
+"""
+import asyncio
+import importlib
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE = os.getenv("STARTUP_PROFILE") == "1"
+PREWARM = os.getenv("STARTUP_PREWARM", "True") == "True"
+PREWARM_DELAY = float(os.getenv("STARTUP_PREWARM_DELAY", "1.0"))
+PREWARM_MODULES = ("stripe", "email.mime.multipart", "email.mime.base", "email.mime.text")
+
+timings: dict[str, float] = {}
+
+
+@contextmanager
+def step(name: str):
+    """Засекает шаг старта; с STARTUP_PROFILE=1 пишет его время в лог."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        if PROFILE:
+            logger.info("startup: %-28s %7.1f ms", name, timings[name] * 1e3)
+
+
+async def prewarm(delay: float = PREWARM_DELAY) -> None:
+    """Импортирует тяжёлые модули в потоке, не задерживая приём запросов."""
+    import avatars
+
+    # даём серверу открыть порт и ответить на первые запросы
+    await asyncio.sleep(delay)
+    for module in PREWARM_MODULES:
+        with step(f"prewarm {module}"):
+            await asyncio.to_thread(importlib.import_module, module)
+    with step("prewarm avatar pool"):
+        await avatars.prewarm()
+
+
+# --- Профиль импорта ---
+def import_profile(module: str = "main") -> list[tuple[str, float, float]]:
+    """(модуль, собственное время, суммарное) импорта в новом интерпретаторе, мс.
+
+    Первые по времени — свои модули приложения и пакеты зависимостей
+    верхнего уровня (время подмодулей пакета сложено).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    own, total = defaultdict(float), {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = name.split(".")[0]
+        own[package] += int(self_us) / 1000
+        total[package] = max(total.get(package, 0.0), int(cumulative_us) / 1000)
+    return sorted(((name, own[name], total[name]) for name in own), key=lambda row: -row[2])
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["profile"]:
+        print("Usage: python boot.py profile")
+        sys.exit(2)
+    rows = import_profile()
+    print(f"{'module':32} {'self ms':>9} {'total ms':>9}")
+    for name, self_ms, total_ms in rows[:40]:
+        print(f"{name:32} {self_ms:9.1f} {total_ms:9.1f}")
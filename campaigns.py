@@ -0,0 +1,183 @@
+"""Кампании сбора: снимок в памяти процесса и версия в Redis.
+
+Список кампаний короткий и меняется редко (правка кампании, донат на
+неё), а читается на каждой загрузке /welcome. Поэтому /api/campaigns
+отдаёт готовый снимок: активные кампании читаются из базы один раз на
+версию, а JSON каждой страницы сериализуется один раз на снимок.
+
+Версия — счётчик `campaigns:version` в Redis; его увеличивает всё, что
+меняет кампании: загрузка из файла и вебхук после доната на кампанию.
+Процесс сравнивает версию на каждом запросе (один GET) и перечитывает
+снимок, если она изменилась. Без Redis снимок перечитывается не чаще раза
+в FALLBACK_TTL секунд.
+
+Собранные суммы (`raised`, `donations_count`) увеличиваются в той же
+транзакции, что и запись доната (donations.record_donations), поэтому
+прогресс кампании не требует SUM по журналу.
+
+Загрузка и правка кампаний без деплоя:
+
+    python campaigns.py load campaigns.json
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import models
+from static_assets import static_url
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "campaigns:version"
+FALLBACK_TTL = 30.0
+LOADED_FIELDS = ("title", "description", "text", "image", "link", "goal", "position", "active")
+
+
+def _image_url(image: str | None) -> str | None:
+    if not image or image.startswith(("http://", "https://", "/")):
+        return image
+    return static_url(image)
+
+
+def _to_dict(campaign: models.Campaign) -> dict:
+    return {
+        "id": campaign.id,
+        "title": campaign.title,
+        "description": campaign.description,
+        "text": campaign.text,
+        "image": _image_url(campaign.image),
+        "link": campaign.link,
+        "goal": campaign.goal,
+        "raised": campaign.raised,
+        "donations_count": campaign.donations_count,
+    }
+
+
+@dataclass
+class Snapshot:
+    version: int | None
+    items: list[dict]
+    loaded_at: float = field(default_factory=time.monotonic)
+    _pages: dict[tuple[int, int], tuple[str, bytes]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.ids = {item["id"] for item in self.items}
+        self.digest = hashlib.sha256(json.dumps(self.items, sort_keys=True).encode()).hexdigest()[:16]
+
+    def page(self, offset: int, limit: int) -> tuple[str, bytes]:
+        """(ETag, тело JSON) страницы; сериализуется один раз на снимок."""
+        cached = self._pages.get((offset, limit))
+        if cached is None:
+            items = self.items[offset:offset + limit]
+            next_offset = offset + limit if offset + limit < len(self.items) else None
+            body = json.dumps(
+                {"items": items, "total": len(self.items), "offset": offset, "next_offset": next_offset},
+                ensure_ascii=False,
+            ).encode()
+            cached = self._pages[(offset, limit)] = (f'"{self.digest}-{offset}-{limit}"', body)
+        return cached
+
+
+class CampaignStore:
+    def __init__(self, session_factory: async_sessionmaker, redis: Redis | None):
+        self.session_factory = session_factory
+        self.redis = redis
+        self._snapshot: Snapshot | None = None
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    async def _version(self) -> int | None:
+        if self.redis is None:
+            return None
+        try:
+            return int(await self.redis.get(VERSION_KEY) or 0)
+        except RedisError:
+            logger.warning("Campaign version unavailable in Redis", exc_info=True)
+            return None
+
+    def _fresh(self, version: int | None) -> bool:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False
+        if version is None:
+            return time.monotonic() - snapshot.loaded_at < FALLBACK_TTL
+        return snapshot.version == version
+
+    async def snapshot(self) -> Snapshot:
+        version = await self._version()
+        if self._fresh(version):
+            return self._snapshot
+        async with self._lock:
+            # пока ждали блокировку, снимок мог перечитать другой запрос
+            if not self._fresh(version):
+                async with self.session_factory() as db:
+                    rows = (await db.scalars(
+                        select(models.Campaign)
+                        .where(models.Campaign.active.is_(True))
+                        .order_by(models.Campaign.position, models.Campaign.id)
+                    )).all()
+                self._snapshot = Snapshot(version, [_to_dict(row) for row in rows])
+                self.reloads += 1
+        return self._snapshot
+
+
+async def bump(redis: Redis | None) -> None:
+    """Сообщает всем процессам, что кампании изменились."""
+    if redis is None:
+        return
+    try:
+        await redis.incr(VERSION_KEY)
+    except RedisError:
+        # процессы перечитают снимок по FALLBACK_TTL, если Redis тоже недоступен им
+        logger.warning("Failed to bump campaign version", exc_info=True)
+
+
+# --- Загрузка из файла ---
+async def load(db: AsyncSession, entries: list[dict]) -> int:
+    """Создаёт или обновляет кампании по id, остальные скрывает. Собранные суммы не трогает."""
+    for position, entry in enumerate(entries, start=1):
+        values = {"position": position, "active": True, **{k: entry[k] for k in LOADED_FIELDS if k in entry}}
+        campaign = await db.get(models.Campaign, entry["id"]) if "id" in entry else None
+        if campaign is None:
+            db.add(models.Campaign(**({"id": entry["id"]} if "id" in entry else {}), **values))
+        else:
+            for key, value in values.items():
+                setattr(campaign, key, value)
+    await db.flush()
+    listed = [entry["id"] for entry in entries if "id" in entry]
+    await db.execute(update(models.Campaign).where(models.Campaign.id.not_in(listed)).values(active=False))
+    await db.commit()
+    return len(entries)
+
+
+async def _main(path: str) -> int:
+    from database import SessionLocal
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    redis = Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), encoding="utf-8", decode_responses=True)
+    try:
+        async with SessionLocal() as db:
+            count = await load(db, entries)
+        await bump(redis)
+        print(f"Loaded {count} campaigns from {path}")
+        return 0
+    finally:
+        await redis.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "load":
+        print("Usage: python campaigns.py load FILE.json")
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    sys.exit(asyncio.run(_main(sys.argv[2])))
@@ -0,0 +1,112 @@
+"""CSRF: подписанный токен в cookie и в форме (double submit).
+
+Токен — `URLSafeTimedSerializer(...).dumps("token")`, как и раньше, так
+что выданные до обновления токены продолжают проходить проверку. Подписчик
+и base64 постоянной части строятся один раз на процесс, проверка не
+разбирает JSON, а уже проверенные токены запоминаются до истечения срока:
+/api/check-auth и /api/events проверяют одну и ту же cookie на каждом
+запросе.
+
+Ключи — CSRF_SECRETS=`new,old`: первым подписываются новые токены,
+остальные только принимаются (старый ключ можно убрать через
+CSRF_MAX_AGE после ротации). Без него — один CSRF_SECRET.
+
+Проверка в роутере:
+
+    @router.post("/profile", dependencies=[Depends(csrf.require)])
+"""
+import hmac
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from itsdangerous import BadData, URLSafeTimedSerializer
+
+COOKIE = "csrf_token"
+FIELD = "csrf_token"
+HEADER = "X-CSRF-Token"
+CSRF_MAX_AGE = 3600
+CACHE_SIZE = int(os.getenv("CSRF_CACHE_SIZE", "10000"))
+
+SECRETS = [s.strip() for s in (os.getenv("CSRF_SECRETS") or os.getenv("CSRF_SECRET", "dev-secret")).split(",") if s.strip()]
+
+# itsdangerous подписывает последним ключом из списка
+serializer = URLSafeTimedSerializer(list(reversed(SECRETS)))
+_signer = serializer.make_signer(serializer.salt)
+_PAYLOAD = serializer.dump_payload("token")
+
+# токен -> время истечения, для уже проверенных подписей
+_valid: OrderedDict[str, float] = OrderedDict()
+
+stats = {"generated": 0, "cache_hits": 0, "verified": 0, "rejected": 0}
+
+
+def generate() -> str:
+    stats["generated"] += 1
+    return _signer.sign(_PAYLOAD).decode()
+
+
+def expires_at(token: str) -> float | None:
+    """Unix-время, когда токен перестанет проходить проверку, или None, если он уже невалиден."""
+    expires = _valid.get(token)
+    if expires is not None:
+        if expires > time.time():
+            stats["cache_hits"] += 1
+            return expires
+        del _valid[token]
+        stats["rejected"] += 1
+        return None
+    try:
+        payload, signed_at = _signer.unsign(token, max_age=CSRF_MAX_AGE, return_timestamp=True)
+    except BadData:
+        stats["rejected"] += 1
+        return None
+    if payload != _PAYLOAD:
+        stats["rejected"] += 1
+        return None
+    stats["verified"] += 1
+    expires = signed_at.timestamp() + CSRF_MAX_AGE
+    _valid[token] = expires
+    while len(_valid) > CACHE_SIZE:
+        _valid.popitem(last=False)
+    return expires
+
+
+def validate(token: str) -> bool:
+    return expires_at(token) is not None
+
+
+def set_cookie(response: Response, token: str) -> None:
+    # httponly: в форму токен попадает из шаблона, JS его не читает
+    response.set_cookie(COOKIE, token, httponly=True, secure=True, samesite="lax")
+
+
+async def _submitted(request: Request) -> str | None:
+    token = request.headers.get(HEADER)
+    if token:
+        return token
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        # Starlette кэширует разобранную форму, обработчик прочитает её ещё раз бесплатно
+        token = (await request.form()).get(FIELD)
+    elif content_type.startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        token = body.get(FIELD) if isinstance(body, dict) else None
+    return token if isinstance(token, str) else None
+
+
+async def require(request: Request) -> None:
+    """Зависимость: токен из заголовка, формы или JSON совпадает с cookie и подписан."""
+    cookie_token = request.cookies.get(COOKIE)
+    submitted = await _submitted(request)
+    if not cookie_token or not submitted:
+        raise HTTPException(status_code=403, detail="CSRF token missing")
+    if not hmac.compare_digest(submitted.encode(), cookie_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid CSRF token")
+    if not validate(submitted):
+        raise HTTPException(status_code=403, detail="Expired or invalid CSRF token")
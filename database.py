@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -10,20 +14,95 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("❌ Environment variable DATABASE_URL not found. Check the .env file.")
 
-engine = create_engine(
-    DATABASE_URL,
+# Синхронные драйверы из DATABASE_URL -> асинхронные (приложение) и обратно (alembic)
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql+mysqldb": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+SYNC_DRIVERS = {
+    "postgres": "postgresql",
+    "postgresql+asyncpg": "postgresql+psycopg2",
+    "mysql+aiomysql": "mysql+pymysql",
+    "sqlite+aiosqlite": "sqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def to_sync_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return SYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет ожидание свободного соединения (metrics.db_pool_wait)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait.observe(time.perf_counter() - start)
+
+
+# Размер пула настраивается через окружение; у SQLite своего пула нет
+pool_options = {}
+if not ASYNC_DATABASE_URL.startswith("sqlite"):
+    pool_options = {
+        "poolclass": TimedPool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
     pool_pre_ping=True,      # Проверяет соединение перед использованием
-    pool_recycle=3600,       # Перезапускает соединение каждые 60 мин
-    echo=False,              # Включить True для логов SQL-запросов
-    future=True              # Поддержка SQLAlchemy 2.x
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")),  # Перезапускает соединение каждые 60 мин
+    echo=os.getenv("DB_ECHO") == "1",  # Включить для логов SQL-запросов
+    **pool_options,
 )
 
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
+metrics.instrument_engine(engine)
+
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def create_schema() -> None:
+    """Создаёт недостающие таблицы по моделям — для локальной разработки и тестов.
+
+    В продакшене схему ведёт alembic (`alembic upgrade head`).
+    """
+    import models  # noqa: F401  регистрирует таблицы в Base.metadata
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    if sys.argv[1:] != ["create"]:
+        print("Usage: python database.py create")
+        sys.exit(2)
+    asyncio.run(create_schema())
+    print(f"Schema created in {ASYNC_DATABASE_URL.split('://')[0]} database")
@@ -0,0 +1,172 @@
+"""Журнал донатов и инкрементальные агрегаты по нему.
+
+Каждый донат — новая строка в `donations`, существующие строки не меняются.
+Вместе с ней в той же транзакции увеличиваются суммы в `donation_totals`
+за день, неделю, месяц и за всё время, поэтому таблицы лидеров читают
+готовые суммы и никогда не делают SUM по журналу.
+
+Донаты записываются пачками (`record_donations`): один executemany на
+журнал, по одному на агрегаты, кампании и пользователей, вместо
+SELECT/UPDATE/COMMIT на каждый донат. Донат на кампанию так же
+увеличивает `campaigns.raised`, и прогресс кампании не считается SUM.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+PERIODS = ("day", "week", "month", "all")
+ALL_TIME_START = date(1970, 1, 1)
+
+
+def period_starts(moment: datetime) -> dict[str, date]:
+    """Начало каждого периода, в который попадает момент (неделя — с понедельника)."""
+    day = moment.date()
+    return {
+        "day": day,
+        "week": day - timedelta(days=day.weekday()),
+        "month": day.replace(day=1),
+        "all": ALL_TIME_START,
+    }
+
+
+def philanthrop_level(amount: float) -> str:
+    # Пороговые суммы для одного цикла уровней
+    thresholds = [50, 90, 150, 250, 350, 450, 550, 650, 750, 850]
+
+    # Определяем, сколько полных циклов пользователь прошёл
+    cycles = 0
+    while amount >= thresholds[-1]:
+        amount -= thresholds[-1]
+        cycles += 1
+
+    # Определяем уровень в текущем цикле
+    level = 0
+    for threshold in thresholds:
+        if amount >= threshold:
+            level += 1
+        else:
+            break
+
+    # Название уровня
+    if cycles == 0:
+        return f"F{level}"
+    return f"Elite-{level + (cycles - 1) * 10}"
+
+
+async def _current_totals(db: AsyncSession, user_ids, starts: dict[str, date]) -> dict[int, dict[str, float]]:
+    t = models.DonationTotal.__table__
+    rows = (await db.execute(
+        select(t.c.user_id, t.c.period, t.c.total).where(
+            t.c.user_id.in_(user_ids),
+            or_(*(and_(t.c.period == period, t.c.period_start == start) for period, start in starts.items())),
+        )
+    )).all()
+    totals = defaultdict(dict)
+    for user_id, period, total in rows:
+        totals[user_id][period] = total
+    return totals
+
+
+async def record_donations(db: AsyncSession, items: list[tuple[int, float, str | None, int | None]], created_at: datetime | None = None) -> list:
+    """Записывает пачку донатов `(user_id, amount, stripe_session_id, campaign_id)`. Коммит — за вызывающим.
+
+    Донаты одного пользователя складываются, так что агрегаты и строка
+    users обновляются один раз на пользователя, а уровень пересчитывается
+    один раз. Повторные checkout session и несуществующие пользователи
+    пропускаются. Возвращает для каждого затронутого пользователя
+    `(user, суммы day/week/month, created_at)`; `user.campaigns` — кампании,
+    на которые он донатил в этой пачке.
+    """
+    created_at = created_at or datetime.utcnow()
+    t = models.DonationTotal.__table__
+
+    session_ids = {sid for _, _, sid, _ in items if sid}
+    seen = set((await db.scalars(
+        select(models.Donation.stripe_session_id).where(models.Donation.stripe_session_id.in_(session_ids))
+    )).all()) if session_ids else set()
+    users = {
+        row.id: row
+        for row in await db.execute(
+            select(models.User.id, models.User.username, models.User.avatar)
+            .where(models.User.id.in_({user_id for user_id, _, _, _ in items}))
+        )
+    }
+    campaign_ids = {campaign_id for _, _, _, campaign_id in items if campaign_id is not None}
+    known_campaigns = set((await db.scalars(
+        select(models.Campaign.id).where(models.Campaign.id.in_(campaign_ids))
+    )).all()) if campaign_ids else set()
+
+    ledger = []
+    sums = defaultdict(lambda: [0.0, 0])
+    campaign_sums = defaultdict(lambda: [0.0, 0])
+    user_campaigns = defaultdict(set)
+    for user_id, amount, sid, campaign_id in items:
+        if user_id not in users or (sid and sid in seen):
+            continue
+        if sid:
+            seen.add(sid)
+        # кампанию могли удалить, пока донат шёл через Stripe — донат всё равно засчитываем
+        if campaign_id not in known_campaigns:
+            campaign_id = None
+        ledger.append({"user_id": user_id, "amount": amount, "created_at": created_at, "stripe_session_id": sid, "campaign_id": campaign_id})
+        sums[user_id][0] += amount
+        sums[user_id][1] += 1
+        if campaign_id is not None:
+            user_campaigns[user_id].add(campaign_id)
+            campaign_sums[campaign_id][0] += amount
+            campaign_sums[campaign_id][1] += 1
+    if not ledger:
+        return []
+    await db.execute(insert(models.Donation), ledger)
+
+    if campaign_sums:
+        c = models.Campaign.__table__
+        await db.execute(
+            update(c)
+            .where(c.c.id == bindparam("b_id"))
+            .values(raised=c.c.raised + bindparam("b_amount"), donations_count=c.c.donations_count + bindparam("b_count")),
+            [{"b_id": campaign_id, "b_amount": amount, "b_count": count} for campaign_id, (amount, count) in campaign_sums.items()],
+        )
+
+    # Агрегаты: UPDATE существующих строк и INSERT недостающих — по одному executemany
+    starts = period_starts(created_at)
+    existing = await _current_totals(db, list(sums), starts)
+    updates, inserts = [], []
+    for user_id, (amount, count) in sums.items():
+        for period, start in starts.items():
+            if period in existing.get(user_id, {}):
+                updates.append({"b_user_id": user_id, "b_period": period, "b_start": start, "b_amount": amount, "b_count": count})
+            else:
+                inserts.append({"user_id": user_id, "period": period, "period_start": start, "total": amount, "count": count})
+    if updates:
+        await db.execute(
+            update(t)
+            .where(t.c.user_id == bindparam("b_user_id"), t.c.period == bindparam("b_period"), t.c.period_start == bindparam("b_start"))
+            .values(total=t.c.total + bindparam("b_amount"), count=t.c.count + bindparam("b_count")),
+            updates,
+        )
+    if inserts:
+        await db.execute(insert(t), inserts)
+
+    # users: копия суммы за всё время и уровень — один раз на пользователя
+    totals = await _current_totals(db, list(sums), starts)
+    credited = []
+    user_rows = []
+    for user_id in sums:
+        amount = totals[user_id]["all"]
+        level = philanthrop_level(amount)
+        user_rows.append({"id": user_id, "amount": amount, "last_donation_time": created_at, "philanthrop_level": level})
+        user = SimpleNamespace(
+            id=user_id, username=users[user_id].username, avatar=users[user_id].avatar,
+            amount=amount, philanthrop_level=level, last_donation_time=created_at,
+            campaigns=user_campaigns[user_id],
+        )
+        windows = {period: totals[user_id][period] for period in ("day", "week", "month")}
+        credited.append((user, windows, created_at))
+    await db.execute(update(models.User), user_rows)
+    return credited
@@ -1,16 +0,0 @@
-from fastapi_mail import ConnectionConfig
-import os
-from dotenv import load_dotenv
-
-load_dotenv()  # загружаем .env
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USER"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_FROM"),
-    MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
-    MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-    MAIL_STARTTLS=os.getenv("MAIL_STARTTLS", "True") == "True",
-    MAIL_SSL_TLS=os.getenv("MAIL_SSL_TLS", "False") == "True",
-    USE_CREDENTIALS=True
-)
@@ -0,0 +1,189 @@
+"""Push-события для открытых страниц (Server-Sent Events).
+
+Вместо того чтобы каждая вкладка опрашивала /api/check-auth, страница
+держит одно соединение /api/events (см. routers/events_api.py), а сервер
+сам присылает:
+
+- `session-expired` — срок сессии истёк, нужно войти заново;
+- `leaderboard` при подключении — снимок топа с номером версии, затем
+  `leaderboard-diff` — только изменившиеся строки, посчитанные один раз
+  на изменение (см. `publish_top`);
+- `donation-credited` — донат пользователя зачислен (из воркера вебхуков).
+
+События публикуются в один канал Redis, поэтому дойдут до страниц,
+открытых на любом процессе. В каждом процессе `EventHub` держит одну
+подписку на канал и раздаёт сообщения по очередям подключений в памяти;
+стоимость события для Redis не зависит от числа открытых вкладок.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, WatchError
+
+import leaderboard
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "events"
+QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "32"))
+
+FEED_KEY = "leaderboard:feed"
+FEED_LIMIT = 10
+
+
+async def publish(redis: Redis | None, event: str, data: dict, user_id: int | None = None) -> None:
+    """Отправляет событие пользователю `user_id` или всем, если он не задан."""
+    if redis is None:
+        return
+    message = json.dumps({"event": event, "data": data, "user_id": user_id}, default=str)
+    try:
+        await redis.publish(CHANNEL, message)
+    except RedisError:
+        logger.warning("Failed to publish %s event", event, exc_info=True)
+
+
+# --- Таблица лидеров: снимок и диффы ---
+def top_diff(old: list[dict], new: list[dict]) -> dict:
+    """Изменения топа между двумя снимками.
+
+    `set` — новые строки и строки, у которых изменилась сумма или данные
+    (целиком), `moves` — имя -> новое место для строк, которые только
+    сдвинулись, `remove` — имена, выбывшие из топа.
+    """
+    before = {entry["username"]: entry for entry in old}
+    changed, moves = [], {}
+    for entry in new:
+        previous = before.get(entry["username"])
+        if previous is None or {**previous, "rank": entry["rank"]} != entry:
+            changed.append(entry)
+        elif previous["rank"] != entry["rank"]:
+            moves[entry["username"]] = entry["rank"]
+    current = {entry["username"] for entry in new}
+    return {
+        "set": changed,
+        "moves": moves,
+        "remove": [username for username in before if username not in current],
+    }
+
+
+async def top_snapshot(redis: Redis | None) -> dict:
+    """Последний разосланный топ `{"version", "top"}`; при первом обращении — собирает его."""
+    if redis is None:
+        return {"version": 0, "top": []}
+    raw = await redis.get(FEED_KEY)
+    if raw is None:
+        await publish_top(redis)
+        raw = await redis.get(FEED_KEY)
+    return json.loads(raw) if raw else {"version": 0, "top": []}
+
+
+async def publish_top(redis: Redis | None, limit: int = FEED_LIMIT) -> None:
+    """Пересчитывает топ и рассылает всем страницам только разницу с прошлым снимком.
+
+    Топ читается из Redis и сравнивается один раз на изменение, а не на
+    каждого зрителя. Снимок, номер версии и публикация меняются в одной
+    транзакции (WATCH), поэтому диффы от нескольких воркеров идут по порядку.
+    """
+    if redis is None:
+        return
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(FEED_KEY)
+                    raw = await pipe.get(FEED_KEY)
+                    previous = json.loads(raw) if raw else {"version": 0, "top": []}
+                    top = [entry.model_dump(mode="json") for entry in await leaderboard.top(redis, limit)]
+                    diff = top_diff(previous["top"], top)
+                    if raw and not any(diff.values()):
+                        await pipe.reset()
+                        return
+                    version = previous["version"] + 1
+                    message = {"event": "leaderboard-diff", "data": {"version": version, "base": previous["version"], **diff}, "user_id": None}
+                    pipe.multi()
+                    pipe.set(FEED_KEY, json.dumps({"version": version, "top": top}))
+                    pipe.publish(CHANNEL, json.dumps(message))
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+    except RedisError:
+        logger.warning("Failed to publish leaderboard update", exc_info=True)
+
+
+class Subscription:
+    """Очередь событий одного соединения."""
+
+    def __init__(self, user_id: int | None):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event: str, payload: str) -> None:
+        try:
+            self.queue.put_nowait((event, payload))
+        except asyncio.QueueFull:
+            # клиент не успевает читать — соединение закроется, браузер переподключится
+            self.overflowed = True
+
+
+class EventHub:
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self._by_user: dict[int | None, set[Subscription]] = defaultdict(set)
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, user_id: int | None) -> Subscription:
+        """Подписка соединения; `None` — анонимный зритель, только общие события."""
+        subscription = Subscription(user_id)
+        self._by_user[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._by_user.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._by_user[subscription.user_id]
+
+    def connections(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._by_user.values())
+
+    def dispatch(self, message: str) -> None:
+        """Раздаёт сообщение из канала подключениям этого процесса."""
+        decoded = json.loads(message)
+        # payload сериализуется один раз на событие, а не на каждое соединение
+        event, payload = decoded["event"], json.dumps(decoded["data"])
+        user_id = decoded.get("user_id")
+        if user_id is not None:
+            targets = self._by_user.get(user_id, ())
+        else:
+            targets = (s for subscriptions in self._by_user.values() for s in subscriptions)
+        for subscription in list(targets):
+            subscription.put(event, payload)
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.dispatch(message["data"])
+            except RedisError:
+                logger.warning("Events channel lost, reconnecting", exc_info=True)
+                await asyncio.sleep(1)
+
+    def start(self):
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
@@ -0,0 +1,74 @@
+"""Кэш отрендеренных кусков HTML, общих для всех посетителей.
+
+Кусок хранится под именем и версией данных, из которых он построен
+(например, `top_table` и `leaderboard.version`): запись в данные меняет
+версию, и старый кусок просто перестаёт запрашиваться, явный сброс не
+нужен. Два уровня, как у user_cache: словарь в памяти процесса (несколько
+последних версий) и Redis с TTL, чтобы кусок, отрендеренный одним
+воркером, достался остальным без рендера.
+"""
+import logging
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from markupsafe import Markup
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+LOCAL_SIZE = int(os.getenv("FRAGMENT_CACHE_LOCAL_SIZE", "32"))
+REDIS_TTL = int(os.getenv("FRAGMENT_CACHE_REDIS_TTL", "3600"))
+
+KEY = "fragment:{}:{}"
+
+stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+_local: OrderedDict[tuple[str, int], Markup] = OrderedDict()
+
+
+def hit_ratio() -> float:
+    """Доля запросов, обслуженных без рендера (любым уровнем)."""
+    hits = stats["local_hits"] + stats["redis_hits"]
+    total = hits + stats["misses"]
+    return hits / total if total else 0.0
+
+
+def _local_put(name: str, version: int, html: Markup) -> None:
+    _local[(name, version)] = html
+    _local.move_to_end((name, version))
+    while len(_local) > LOCAL_SIZE:
+        _local.popitem(last=False)
+
+
+async def get(redis: Redis | None, name: str, version: int, render: Callable[[], Awaitable[str]]) -> Markup:
+    """Кусок `name` для версии `version`; при промахе вызывает `render()` и кэширует."""
+    html = _local.get((name, version))
+    if html is not None:
+        stats["local_hits"] += 1
+        return html
+
+    key = KEY.format(name, version)
+    if redis is not None:
+        try:
+            raw = await redis.get(key)
+        except RedisError:
+            logger.warning("Fragment cache unavailable in Redis", exc_info=True)
+            redis = None
+        else:
+            if raw is not None:
+                stats["redis_hits"] += 1
+                html = Markup(raw)
+                _local_put(name, version, html)
+                return html
+
+    stats["misses"] += 1
+    html = Markup(await render())
+    _local_put(name, version, html)
+    if redis is not None:
+        try:
+            await redis.set(key, str(html), ex=REDIS_TTL)
+        except RedisError:
+            logger.warning("Failed to cache fragment %s in Redis", key, exc_info=True)
+    return html
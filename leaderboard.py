@@ -0,0 +1,399 @@
+"""Таблица лидеров донатеров в Redis sorted set.
+
+Счёт участника — сумма донатов пользователя, член множества — его id
+(username может поменяться в профиле). Данные для отображения строки
+(username, аватар, уровень, время доната) лежат рядом в хэше, а индекс
+username -> id всех пользователей — в отдельном хэше, поэтому топ, место
+пользователя и его соседи читаются без обращения к базе за O(log N).
+Суммы пишет воркер вебхуков (`sync_user`), имена — регистрация и профиль
+(`sync_profile`).
+
+Кроме таблицы за всё время есть таблицы за текущий день, неделю и месяц:
+по одному sorted set на каждый календарный период (ключ содержит начало
+периода), с TTL чуть больше периода. Запрос окна читает ровно один ключ,
+поэтому его стоимость не зависит от объёма истории.
+
+Каждая запись в таблицы увеличивает счётчик версии (`version`): по нему
+кэшируется то, что построено из таблицы, например HTML топа на /welcome.
+
+Пересборку при старте запускает каждый процесс (`ensure`), поэтому она
+идёт под блокировкой `leaderboard:rebuild:{window}` (SET NX EX): второй
+процесс пропускает окно, пока первый его собирает. Донаты и смены имени,
+пришедшие во время пересборки, после подмены ключа применяются заново.
+
+Пересборка и проверка из командной строки:
+
+    python leaderboard.py rebuild
+    python leaderboard.py check
+"""
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from redis.asyncio import Redis
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from donations import period_starts
+from schemas import LeaderboardEntry
+
+logger = logging.getLogger(__name__)
+
+BOARD_KEY = "leaderboard:all"
+USER_KEY = "leaderboard:user:{}"
+USERNAMES_KEY = "leaderboard:usernames"
+VERSION_KEY = "leaderboard:version"
+# имена, менявшиеся в индексе за последние REBUILD_LOCK_TTL секунд (имя -> id)
+CHANGED_NAMES_KEY = "leaderboard:usernames:changed"
+LOCK_KEY = "leaderboard:rebuild:{}"
+REBUILD_CHUNK = 1000
+REBUILD_LOCK_TTL = int(os.getenv("LEADERBOARD_REBUILD_LOCK_TTL", "600"))
+# донаты с last_donation_time не раньше начала пересборки минус это окно применяются повторно
+REBUILD_OVERLAP = timedelta(seconds=60)
+
+WINDOWS = ("all", "day", "week", "month")
+WINDOW_TTL = {
+    "day": timedelta(days=2),
+    "week": timedelta(days=8),
+    "month": timedelta(days=32),
+}
+
+
+def board_key(window: str = "all", at: datetime | None = None) -> str:
+    """Ключ sorted set для окна; для day/week/month — текущего на момент `at`."""
+    if window == "all":
+        return BOARD_KEY
+    start = period_starts(at or datetime.utcnow())[window]
+    return f"leaderboard:{window}:{start.isoformat()}"
+
+
+def _user_fields(user) -> dict:
+    return {
+        "username": user.username,
+        "avatar": user.avatar or "",
+        "philanthrop_level": user.philanthrop_level or "",
+        "last_donation_time": user.last_donation_time.isoformat() if user.last_donation_time else "",
+    }
+
+
+def _entry(rank: int, amount: float, fields: dict) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        rank=rank,
+        username=fields.get("username", ""),
+        amount=amount,
+        avatar=fields.get("avatar") or None,
+        philanthrop_level=fields.get("philanthrop_level") or "",
+        last_donation_time=fields.get("last_donation_time") or None,
+    )
+
+
+# --- Запись ---
+async def sync_user(
+    redis: Redis,
+    user,
+    window_totals: dict[str, float] | None = None,
+    at: datetime | None = None,
+) -> None:
+    """Записывает сумму пользователя после доната в таблицы лидеров.
+
+    Суммы только растут, поэтому пишутся через ZADD GT: пачка, закоммиченная
+    раньше, но дошедшая до Redis позже, не откатит таблицу назад.
+    `window_totals` — суммы за day/week/month на момент `at` (после доната).
+    Имя и аватар из снимка воркера записываются, только если строки ещё нет:
+    их, как и индекс имён, ведёт профиль (`sync_profile`).
+    """
+    if not user.amount or user.amount <= 0:
+        return
+    key = USER_KEY.format(user.id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zadd(BOARD_KEY, {str(user.id): float(user.amount)}, gt=True)
+        for window, total in (window_totals or {}).items():
+            window_key = board_key(window, at)
+            pipe.zadd(window_key, {str(user.id): float(total)}, gt=True)
+            pipe.expire(window_key, WINDOW_TTL[window])
+        fields = _user_fields(user)
+        pipe.hset(key, mapping={name: fields[name] for name in ("philanthrop_level", "last_donation_time")})
+        pipe.hsetnx(key, "username", fields["username"])
+        pipe.hsetnx(key, "avatar", fields["avatar"])
+        pipe.incr(VERSION_KEY)
+        await pipe.execute()
+
+
+async def sync_profile(redis: Redis, user, old_username: str | None = None) -> None:
+    """Записывает имя и аватар пользователя: индекс имён и строку таблицы.
+
+    Вызывается после регистрации и изменения профиля; `old_username`
+    передаётся при смене имени, чтобы убрать старый индекс.
+    """
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(USERNAMES_KEY, user.username, str(user.id))
+        # пересборка, идущая сейчас, могла прочитать индекс до этой записи — она сверит эти имена с базой
+        changed = {user.username: str(user.id)}
+        if old_username and old_username != user.username:
+            pipe.hdel(USERNAMES_KEY, old_username)
+            changed[old_username] = str(user.id)
+        pipe.hset(CHANGED_NAMES_KEY, mapping=changed)
+        pipe.expire(CHANGED_NAMES_KEY, REBUILD_LOCK_TTL)
+        if user.amount and user.amount > 0:
+            fields = _user_fields(user)
+            pipe.hset(USER_KEY.format(user.id), mapping={"username": fields["username"], "avatar": fields["avatar"]})
+            pipe.incr(VERSION_KEY)
+        await pipe.execute()
+
+
+# --- Чтение ---
+async def _entries(redis: Redis, key: str, start: int, stop: int) -> list[LeaderboardEntry]:
+    members = await redis.zrevrange(key, start, stop, withscores=True)
+    if not members:
+        return []
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id, _ in members:
+            pipe.hgetall(USER_KEY.format(user_id))
+        details = await pipe.execute()
+    return [
+        _entry(rank, score, fields)
+        for rank, ((_, score), fields) in enumerate(zip(members, details), start=start + 1)
+    ]
+
+
+async def version(redis: Redis) -> int:
+    """Номер версии таблиц; меняется при каждой записи в них."""
+    return int(await redis.get(VERSION_KEY) or 0)
+
+
+async def top(redis: Redis, limit: int = 10, window: str = "all") -> list[LeaderboardEntry]:
+    return await _entries(redis, board_key(window), 0, limit - 1)
+
+
+async def rank(redis: Redis, user_id: int, window: str = "all") -> int | None:
+    """Место пользователя (с 1) или None, если он не донатил в этом окне."""
+    position = await redis.zrevrank(board_key(window), str(user_id))
+    return None if position is None else position + 1
+
+
+async def standing(redis: Redis, user_id: int, window: str = "all") -> tuple[int, float] | None:
+    """Место и сумма пользователя одним запросом."""
+    key = board_key(window)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zrevrank(key, str(user_id))
+        pipe.zscore(key, str(user_id))
+        position, amount = await pipe.execute()
+    return None if position is None else (position + 1, amount)
+
+
+async def around(redis: Redis, user_id: int, radius: int = 5, window: str = "all") -> list[LeaderboardEntry]:
+    """Пользователь и по `radius` соседей выше и ниже него."""
+    key = board_key(window)
+    position = await redis.zrevrank(key, str(user_id))
+    if position is None:
+        return []
+    return await _entries(redis, key, max(position - radius, 0), position + radius)
+
+
+async def user_id_by_username(redis: Redis, username: str) -> int | None:
+    user_id = await redis.hget(USERNAMES_KEY, username)
+    return int(user_id) if user_id else None
+
+
+def _totals(window: str = "all", at: datetime | None = None):
+    """Пользователи с предрасчитанной суммой за окно (см. donations.py)."""
+    start = period_starts(at or datetime.utcnow())[window]
+    return (
+        select(models.User, models.DonationTotal.total)
+        .join(models.DonationTotal, models.DonationTotal.user_id == models.User.id)
+        .where(
+            models.DonationTotal.period == window,
+            models.DonationTotal.period_start == start,
+            models.DonationTotal.total > 0,
+        )
+    )
+
+
+async def top_from_db(db: AsyncSession, limit: int = 10, window: str = "all") -> list[LeaderboardEntry]:
+    """Запасной путь, когда Redis недоступен."""
+    rows = (await db.execute(_totals(window).order_by(models.DonationTotal.total.desc()).limit(limit))).all()
+    return [_entry(rank, total, _user_fields(user)) for rank, (user, total) in enumerate(rows, start=1)]
+
+
+# --- Обслуживание ---
+# снимает блокировку, только если она всё ещё наша (могла истечь и достаться другому)
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+async def rebuild(redis: Redis, db: AsyncSession, window: str = "all") -> int | None:
+    """Пересобирает таблицу лидеров окна из базы.
+
+    Множество строится во временном ключе (свой на каждый запуск) и
+    подменяет рабочее через RENAME, так что читатели не видят наполовину
+    заполненную таблицу. Возвращает число донатеров или None, если окно
+    сейчас пересобирает другой процесс.
+    """
+    run_id = uuid.uuid4().hex
+    lock_key = LOCK_KEY.format(window)
+    if not await redis.set(lock_key, run_id, nx=True, ex=REBUILD_LOCK_TTL):
+        logger.info("Leaderboard %s is being rebuilt by another process, skipping", window)
+        return None
+    started = datetime.utcnow()
+    key = board_key(window, started)
+    tmp_key = f"{key}:rebuild:{run_id}"
+    tmp_usernames = f"{USERNAMES_KEY}:rebuild:{run_id}"
+    try:
+        count = await _fill(redis, db, window, started, tmp_key, tmp_usernames, lock_key)
+        if count:
+            await redis.rename(tmp_key, key)
+            if window != "all":
+                await redis.expire(key, WINDOW_TTL[window])
+        else:
+            await redis.delete(key)
+        if window == "all":
+            if await redis.exists(tmp_usernames):
+                await redis.rename(tmp_usernames, USERNAMES_KEY)
+            else:
+                await redis.delete(USERNAMES_KEY)
+        # снимок мог не увидеть то, что закоммитили во время чтения, — применяем ещё раз
+        await db.rollback()
+        await _catch_up(redis, db, window, started)
+        await redis.incr(VERSION_KEY)
+    finally:
+        await redis.delete(tmp_key, tmp_usernames)
+        await redis.eval(RELEASE_LOCK, 1, lock_key, run_id)
+    logger.info("Leaderboard %s rebuilt: %s donors", window, count)
+    return count
+
+
+async def _fill(redis: Redis, db: AsyncSession, window: str, now: datetime, tmp_key: str, tmp_usernames: str, lock_key: str) -> int:
+    count = 0
+    query = _totals(window, now).order_by(models.User.id).execution_options(yield_per=REBUILD_CHUNK)
+    pipe = redis.pipeline(transaction=False)
+    async for user, total in await db.stream(query):
+        pipe.zadd(tmp_key, {str(user.id): float(total)})
+        pipe.hset(USER_KEY.format(user.id), mapping=_user_fields(user))
+        count += 1
+        if count % REBUILD_CHUNK == 0:
+            pipe.expire(lock_key, REBUILD_LOCK_TTL)
+            await pipe.execute()
+    await pipe.execute()
+    if window == "all":
+        # индекс имён — по всем пользователям: место ищется и у тех, кто ещё не донатил
+        names = 0
+        query = select(models.User.id, models.User.username).order_by(models.User.id).execution_options(yield_per=REBUILD_CHUNK)
+        async for user_id, username in await db.stream(query):
+            pipe.hset(tmp_usernames, username, str(user_id))
+            names += 1
+            if names % REBUILD_CHUNK == 0:
+                pipe.expire(lock_key, REBUILD_LOCK_TTL)
+                await pipe.execute()
+        await pipe.execute()
+    return count
+
+
+async def _catch_up(redis: Redis, db: AsyncSession, window: str, started: datetime) -> None:
+    """Повторно применяет донаты и смены имени, случившиеся во время пересборки."""
+    key = board_key(window, started)
+    rows = (await db.execute(
+        _totals(window, started).where(models.User.last_donation_time >= started - REBUILD_OVERLAP)
+    )).all()
+    async with redis.pipeline(transaction=False) as pipe:
+        for user, total in rows:
+            # суммы только растут: GT не перетрёт более свежую запись вебхука
+            pipe.zadd(key, {str(user.id): float(total)}, gt=True)
+            pipe.hset(USER_KEY.format(user.id), mapping=_user_fields(user))
+        if rows and window != "all":
+            pipe.expire(key, WINDOW_TTL[window])
+        await pipe.execute()
+
+    if window != "all":
+        return
+    # имена из индекса сверяем с базой: старые удаляем, текущие записываем
+    changed = await redis.hgetall(CHANGED_NAMES_KEY)
+    if not changed:
+        return
+    ids = {int(user_id) for user_id in changed.values()}
+    current = (await db.execute(
+        select(models.User.id, models.User.username)
+        .where(or_(models.User.id.in_(ids), models.User.username.in_(list(changed))))
+    )).all()
+    taken = {username for _, username in current}
+    async with redis.pipeline(transaction=False) as pipe:
+        stale = [name for name in changed if name not in taken]
+        if stale:
+            pipe.hdel(USERNAMES_KEY, *stale)
+        for user_id, username in current:
+            pipe.hset(USERNAMES_KEY, username, str(user_id))
+        await pipe.execute()
+
+
+async def ensure(redis: Redis, db: AsyncSession) -> None:
+    """Собирает из базы отсутствующие в Redis таблицы и индекс имён (первый запуск, сброс Redis).
+
+    Окна, которые уже собирает другой процесс, пропускаются.
+    """
+    if await redis.exists(BOARD_KEY, USERNAMES_KEY) < 2:
+        await rebuild(redis, db, "all")
+    for window in WINDOWS[1:]:
+        if not await redis.exists(board_key(window)):
+            await rebuild(redis, db, window)
+
+
+async def check(redis: Redis, db: AsyncSession, window: str = "all") -> list[str]:
+    """Сравнивает таблицу лидеров окна с базой и возвращает список расхождений."""
+    now = datetime.utcnow()
+    problems = []
+    expected = {}
+    query = _totals(window, now).execution_options(yield_per=REBUILD_CHUNK)
+    async for user, total in await db.stream(query):
+        expected[str(user.id)] = float(total)
+
+    actual = {}
+    async for user_id, score in redis.zscan_iter(board_key(window, now), count=REBUILD_CHUNK):
+        actual[user_id] = score
+
+    for user_id, amount in expected.items():
+        if user_id not in actual:
+            problems.append(f"{window}: user {user_id}: missing (db amount {amount})")
+        elif abs(actual[user_id] - amount) > 1e-6:
+            problems.append(f"{window}: user {user_id}: redis {actual[user_id]} != db {amount}")
+    for user_id in actual.keys() - expected.keys():
+        problems.append(f"{window}: user {user_id}: in redis but not a donor in db")
+    return problems
+
+
+async def _main(command: str) -> int:
+    from database import SessionLocal
+
+    redis = Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), encoding="utf-8", decode_responses=True)
+    try:
+        async with SessionLocal() as db:
+            if command == "rebuild":
+                for window in WINDOWS:
+                    count = await rebuild(redis, db, window)
+                    if count is None:
+                        print(f"Skipped {window} leaderboard: another rebuild is running")
+                    else:
+                        print(f"Rebuilt {window} leaderboard with {count} donors")
+                return 0
+            problems = []
+            for window in WINDOWS:
+                problems += await check(redis, db, window)
+        for problem in problems:
+            print(problem)
+        print("Leaderboard is consistent" if not problems else f"{len(problems)} mismatches")
+        return 1 if problems else 0
+    finally:
+        await redis.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("rebuild", "check"):
+        print("Usage: python leaderboard.py rebuild|check")
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    sys.exit(asyncio.run(_main(sys.argv[1])))
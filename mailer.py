@@ -0,0 +1,323 @@
+"""Исходящая почта через очередь: обработчик только ставит письмо в очередь.
+
+Единственный путь отправки писем в приложении — и объявлений, и ссылок
+сброса пароля. Письмо собирается заранее (base64 вложений — в потоке, не в
+event loop) и сохраняется целиком в `mail_outbox`, после чего запрос сразу
+отвечает. Воркер забирает письма пачками и делит пачку между MAIL_POOL_SIZE
+SMTP-соединениями; каждое отправляет свою часть в одной сессии, держится
+открытым между пачками (TLS и логин — один раз, а не на каждое письмо) и
+закрывается после MAIL_IDLE_TIMEOUT без работы.
+
+Неудачная отправка повторяется с экспоненциальной задержкой до
+MAIL_MAX_ATTEMPTS раз; постоянные ошибки сервера (5xx) не повторяются.
+
+Глубина очереди и задержки (отправки по SMTP и от постановки в очередь до
+ухода письма) доступны через `MailWorker.metrics()` и раз в
+MAIL_REPORT_INTERVAL секунд пишутся в лог.
+
+Сервер настраивается переменными MAIL_SERVER, MAIL_PORT, MAIL_STARTTLS,
+MAIL_SSL_TLS, MAIL_USER, MAIL_PASSWORD, MAIL_FROM. Для разработки подойдёт
+локальный aiosmtpd:
+
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_STARTTLS=False uvicorn main:app
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage, Message
+
+import aiosmtplib
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import metrics
+import models
+
+logger = logging.getLogger(__name__)
+
+SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+PORT = int(os.getenv("MAIL_PORT", 587))
+STARTTLS = os.getenv("MAIL_STARTTLS", "True") == "True"
+SSL_TLS = os.getenv("MAIL_SSL_TLS", "False") == "True"
+USERNAME = os.getenv("MAIL_USER")
+PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM") or USERNAME
+
+BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", "2"))
+MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))
+POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", "5"))
+REPORT_INTERVAL = float(os.getenv("MAIL_REPORT_INTERVAL", "60"))
+LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+LATENCY_WINDOW = 1000  # сколько последних отправок учитывать в перцентилях
+
+
+# --- Очередь ---
+def text_message(recipient: str, subject: str, body: str) -> EmailMessage:
+    """Простое текстовое письмо от MAIL_FROM."""
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+async def enqueue(db: AsyncSession, message: Message, recipients: list[str] | None = None, sender: str | None = None) -> int:
+    """Сохраняет письмо в очередь и возвращает его id. Коммитит сессию."""
+    sender = sender or message["From"] or MAIL_FROM
+    recipients = recipients or [address.strip() for address in message["To"].split(",")]
+    data = await asyncio.to_thread(message.as_bytes)
+    mail = models.OutgoingMail(sender=sender, recipients=",".join(recipients), message=data)
+    db.add(mail)
+    await db.commit()
+    return mail.id
+
+
+async def claim_batch(db: AsyncSession, limit: int) -> list[int]:
+    """Берёт в аренду до `limit` писем, которым пора уходить, и возвращает их id."""
+    now = datetime.utcnow()
+    ready = (
+        models.OutgoingMail.sent_at.is_(None),
+        models.OutgoingMail.next_attempt_at <= now,
+        models.OutgoingMail.attempts < MAX_ATTEMPTS,
+    )
+    candidates = (await db.scalars(
+        select(models.OutgoingMail.id).where(*ready).order_by(models.OutgoingMail.id).limit(limit)
+    )).all()
+    if not candidates:
+        await db.rollback()
+        return []
+    token = uuid.uuid4().hex
+    await db.execute(
+        update(models.OutgoingMail)
+        .where(models.OutgoingMail.id.in_(candidates), *ready)
+        .values(
+            next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+            claim_token=token,
+            attempts=models.OutgoingMail.attempts + 1,
+        )
+    )
+    claimed = (await db.scalars(
+        select(models.OutgoingMail.id).where(models.OutgoingMail.claim_token == token).order_by(models.OutgoingMail.id)
+    )).all()
+    await db.commit()
+    return claimed
+
+
+async def queue_depth(db: AsyncSession) -> tuple[int, float]:
+    """Число неотправленных писем (без брошенных) и возраст самого старого в секундах."""
+    count, oldest = (await db.execute(
+        select(func.count(), func.min(models.OutgoingMail.created_at)).where(
+            models.OutgoingMail.sent_at.is_(None),
+            models.OutgoingMail.attempts < MAX_ATTEMPTS,
+        )
+    )).one()
+    age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return count, age
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def _is_permanent(error: Exception) -> bool:
+    # 5xx — адрес или письмо отвергнуты окончательно; 4xx, обрывы и неверный логин
+    # (его исправят в настройках) — временные
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(500 <= refused.code < 600 for refused in error.recipients)
+    return isinstance(error, aiosmtplib.SMTPResponseException) and 500 <= error.code < 600
+
+
+# --- SMTP ---
+class SmtpConnection:
+    """Одно переиспользуемое SMTP-соединение; переподключается при обрыве."""
+
+    def __init__(self, hostname: str = SERVER, port: int = PORT, username: str | None = USERNAME, password: str | None = PASSWORD, use_tls: bool = SSL_TLS, start_tls: bool = STARTTLS):
+        self.options = {"hostname": hostname, "port": port, "use_tls": use_tls, "start_tls": start_tls and not use_tls}
+        self.username = username
+        self.password = password
+        self._smtp: aiosmtplib.SMTP | None = None
+        self.connects = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(**self.options)
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        self.connects += 1
+        return smtp
+
+    async def send(self, sender: str, recipients: list[str], message: bytes) -> None:
+        for attempt in range(2):
+            if self._smtp is None or not self._smtp.is_connected:
+                self._smtp = await self._connect()
+            try:
+                await self._smtp.sendmail(sender, recipients, message)
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                # сервер закрыл простаивающее соединение — одна попытка с новым
+                self._smtp = None
+                if attempt:
+                    raise
+            except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                # письмо или все адреса отвергнуты, соединение при этом живо (aiosmtplib сделал RSET)
+                raise
+            except (aiosmtplib.SMTPException, OSError):
+                # таймаут или сбой посреди диалога — соединение больше не используем
+                self._smtp.close()
+                self._smtp = None
+                raise
+
+    async def close(self) -> None:
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                self._smtp.close()
+        self._smtp = None
+
+
+# --- Воркер ---
+class MailWorker:
+    def __init__(self, session_factory: async_sessionmaker, connections: list[SmtpConnection] | None = None, batch_size: int = BATCH_SIZE, pool_size: int = POOL_SIZE):
+        self.session_factory = session_factory
+        self.connections = connections or [SmtpConnection() for _ in range(pool_size)]
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "send_seconds": 0.0}
+        self.send_latency: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.queue_latency: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def notify(self):
+        """Будит воркер сразу после постановки письма в очередь."""
+        self._wakeup.set()
+
+    async def run_once(self) -> int:
+        async with self.session_factory() as db:
+            mail_ids = await claim_batch(db, self.batch_size)
+        if not mail_ids:
+            return 0
+        # пачка делится между соединениями пула, каждое шлёт свою часть подряд
+        chunks = [mail_ids[i::len(self.connections)] for i in range(len(self.connections))]
+        await asyncio.gather(*(
+            self._send_chunk(smtp, chunk) for smtp, chunk in zip(self.connections, chunks) if chunk
+        ))
+        return len(mail_ids)
+
+    async def drain(self) -> None:
+        """Отправляет все письма, которым уже пора уйти."""
+        while await self.run_once():
+            pass
+
+    async def _send_chunk(self, smtp: SmtpConnection, mail_ids: list[int]) -> None:
+        async with self.session_factory() as db:
+            # письма (с вложениями до десятков МБ) читаются по одному, а не пачкой
+            for mail_id in mail_ids:
+                await self._deliver(db, smtp, await db.get(models.OutgoingMail, mail_id))
+                db.expunge_all()
+
+    async def _deliver(self, db: AsyncSession, smtp: SmtpConnection, mail: models.OutgoingMail) -> None:
+        started = time.perf_counter()
+        try:
+            await smtp.send(mail.sender, mail.recipients.split(","), mail.message)
+        except (aiosmtplib.SMTPException, OSError) as e:
+            permanent = _is_permanent(e)
+            retry_in = min(RETRY_BASE_SECONDS * 2 ** (mail.attempts - 1), RETRY_MAX_SECONDS)
+            values = {"last_error": repr(e)[:1000], "next_attempt_at": datetime.utcnow() + timedelta(seconds=retry_in)}
+            if permanent:
+                values["attempts"] = MAX_ATTEMPTS
+            if permanent or mail.attempts >= MAX_ATTEMPTS:
+                self.stats["failed"] += 1
+                logger.error("Giving up on mail %s after %s attempts: %r", mail.id, mail.attempts, e)
+            else:
+                self.stats["retried"] += 1
+                logger.warning("Failed to send mail %s (attempt %s), retrying in %ss: %r", mail.id, mail.attempts, retry_in, e)
+        else:
+            elapsed = time.perf_counter() - started
+            now = datetime.utcnow()
+            values = {"sent_at": now, "last_error": None}
+            self.stats["sent"] += 1
+            self.stats["send_seconds"] += elapsed
+            self.send_latency.append(elapsed)
+            metrics.smtp_send.observe(elapsed)
+            self.queue_latency.append((now - mail.created_at).total_seconds())
+        await db.execute(update(models.OutgoingMail).where(models.OutgoingMail.id == mail.id).values(**values))
+        await db.commit()
+
+    @property
+    def connects(self) -> int:
+        """Сколько раз открывались SMTP-соединения (TLS + логин) за время работы."""
+        return sum(smtp.connects for smtp in self.connections)
+
+    async def metrics(self) -> dict:
+        async with self.session_factory() as db:
+            depth, oldest = await queue_depth(db)
+        return {
+            **self.stats,
+            "queue_depth": depth,
+            "oldest_pending_seconds": oldest,
+            "connects": self.connects,
+            "send_latency_p50": _percentile(self.send_latency, 0.5),
+            "send_latency_p99": _percentile(self.send_latency, 0.99),
+            "queue_latency_p50": _percentile(self.queue_latency, 0.5),
+            "queue_latency_p99": _percentile(self.queue_latency, 0.99),
+        }
+
+    async def _report(self):
+        m = await self.metrics()
+        logger.info(
+            "Mail: queue %s (oldest %.0fs), sent %s, retried %s, failed %s, "
+            "send p50 %.0fms p99 %.0fms, queued p50 %.1fs, connects %s",
+            m["queue_depth"], m["oldest_pending_seconds"], m["sent"], m["retried"], m["failed"],
+            m["send_latency_p50"] * 1e3, m["send_latency_p99"] * 1e3, m["queue_latency_p50"], m["connects"],
+        )
+
+    async def _close_connections(self):
+        await asyncio.gather(*(smtp.close() for smtp in self.connections))
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        idle_since = reported_at = loop.time()
+        while True:
+            self._wakeup.clear()
+            try:
+                if loop.time() - reported_at > REPORT_INTERVAL:
+                    reported_at = loop.time()
+                    await self._report()
+                if await self.run_once():
+                    idle_since = loop.time()
+                    continue
+            except Exception:
+                logger.exception("Mail worker iteration failed")
+            # долго нет писем — отпускаем SMTP-соединения
+            if loop.time() - idle_since > IDLE_TIMEOUT:
+                await self._close_connections()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._close_connections()
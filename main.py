@@ -1,24 +1,33 @@
+import asyncio
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi_limiter import FastAPILimiter
 from redis.asyncio import Redis
 import os
-from database import Base, engine
-from routers import auth, auth_api, password_reset
-from fastapi.templating import Jinja2Templates
+from database import engine, SessionLocal
+from routers import auth, auth_api, campaigns_api, events_api, leaderboard_api, metrics_api, password_reset
 import logging
 from models import User
+import leaderboard
+import events
+import passwords
+import avatars
+import uploads
+import user_cache
+import templating
+import static_assets
+import campaigns
+import boot
+import metrics
+from webhook_queue import WebhookWorker
+from mailer import MailWorker
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI()
-templates = Jinja2Templates(directory="templates")
 
 # --- Redis init ---
 redis_client: Redis | None = None
@@ -26,17 +35,68 @@ redis_client: Redis | None = None
 
 @app.on_event("startup")
 async def startup():
-    redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
-    redis_client = Redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
-    app.state.redis = redis_client  # сохраняем в app.state
-    await FastAPILimiter.init(redis_client)
+    # Схема базы здесь не создаётся: `alembic upgrade head` (или `python database.py create`) до запуска
+    with boot.step("redis"):
+        redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+        redis_client = Redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+        app.state.redis = redis_client  # сохраняем в app.state
+
+    # Первый запуск с пустым Redis — собираем таблицы лидеров из базы
+    with boot.step("leaderboard"):
+        async with SessionLocal() as db:
+            await leaderboard.ensure(redis_client, db)
+        await events.publish_top(redis_client)
+
+    # Страницы без данных запроса рендерятся один раз, до первого запроса
+    with boot.step("templates"):
+        templating.warm()
+
+    # Фоновые воркеры, применяющие сохранённые вебхуки Stripe
+    app.state.webhook_worker = WebhookWorker(SessionLocal, redis_client)
+    app.state.webhook_worker.start()
+
+    # Отправка писем из очереди mail_outbox
+    app.state.mail_worker = MailWorker(SessionLocal)
+    app.state.mail_worker.start()
+
+    # Снимок кампаний для /api/campaigns, перечитывается при смене версии
+    app.state.campaigns = campaigns.CampaignStore(SessionLocal, redis_client)
+
+    # Push-события: одна подписка на канал Redis на процесс
+    app.state.events = events.EventHub(redis_client)
+    app.state.events.start()
+
+    # Сброс кэша пользователей, опубликованный другими процессами
+    app.state.user_cache_listener = asyncio.create_task(user_cache.listen(redis_client))
+
+    # stripe, MIME и процессы PIL — в фоне, когда порт уже открыт
+    app.state.prewarm = asyncio.create_task(boot.prewarm()) if boot.PREWARM else None
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    if app.state.prewarm:
+        app.state.prewarm.cancel()
+    await app.state.webhook_worker.stop()
+    await app.state.mail_worker.stop()
+    app.state.user_cache_listener.cancel()
+    await app.state.events.stop()
     redis: Redis = app.state.redis
     if redis:
         await redis.close()
+    await engine.dispose()
+    passwords.shutdown()
+    avatars.shutdown()
+
+
+# --- Перегрузка пула хэширования паролей ---
+@app.exception_handler(passwords.Busy)
+async def password_pool_busy(request: Request, exc: passwords.Busy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 # --- CORS ---
@@ -52,15 +112,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Uploads ---
+# Лимиты тела multipart-запросов по путям; остальные формы — не больше 1 МБ
+app.add_middleware(
+    uploads.UploadLimitMiddleware,
+    limits={
+        "/auth/profile": avatars.MAX_AVATAR_SIZE + uploads.FORM_OVERHEAD,
+        "/auth/send_ad": auth.MAX_AD_SIZE,
+    },
+)
+
+# --- Metrics ---
+# Добавлен последним — внешний слой: время запроса целиком, включая остальные middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
 # --- Static files ---
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Хэшированные копии из `python static_assets.py build` кэшируются навсегда
+app.mount("/static", static_assets.AssetStaticFiles(directory="static"), name="static")
 
 # --- Routers ---
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(auth_api.router)
+app.include_router(campaigns_api.router, tags=["Campaigns"])
+app.include_router(events_api.router, tags=["Events"])
+app.include_router(leaderboard_api.router, tags=["Leaderboard"])
+app.include_router(metrics_api.router)
 app.include_router(password_reset.router, prefix="/auth", tags=["Password Reset"])
 
 # --- Root page ---
 @app.get("/")
 async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templating.render_static("index.html")
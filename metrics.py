@@ -0,0 +1,254 @@
+"""Метрики в текстовом формате Prometheus: GET /metrics.
+
+Свои счётчики и гистограммы без сторонних библиотек. Всё пишется из
+event loop, поэтому блокировки не нужны: счётчик — число, гистограмма —
+список корзин, в который `observe` прибавляет единицу (bisect по
+границам, без аллокаций). Серии по меткам создаются один раз при первом
+наблюдении; middleware находит серию маршрута по id объекта
+маршрута, без сборки ключа на каждый запрос. Отдача /metrics
+(`METRICS_TOKEN`, если задан, — Bearer-токен) собирает текст только при
+запросе.
+
+Что собирается:
+- `http_request_duration_seconds{method,route}` и ответы по классам
+  статуса, `http_requests_in_flight`;
+- `db_queries_per_request{route}` и `db_queries_total`;
+- `db_pool_wait_seconds` — ожидание свободного соединения пула
+  (database.TimedPool), `db_pool_checked_out`;
+- `bcrypt_seconds{op}`, `stripe_api_seconds{call}`,
+  `smtp_send_seconds`, `webhook_lag_seconds{stage}`;
+- на момент запроса /metrics — счётчики модулей (passwords, user_cache,
+  uploads, fragments, csrf, ratelimit), очередь писем, SSE-подключения,
+  перечитывания кампаний и время шагов старта (boot.timings).
+"""
+import contextvars
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "labels")
+
+    def __init__(self, size: int, labels: tuple):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.labels = labels
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: dict = {}
+        if not labelnames:
+            self._default = self.series(None, ())
+
+    def series(self, key, labels: tuple) -> _Series:
+        """Серия по ключу (любой хэшируемый объект) с метками `labels`."""
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(len(self.buckets) + 1, labels)
+        return series
+
+    def labels(self, *values) -> _Series:
+        return self.series(values, values)
+
+    def observe_series(self, series: _Series, value: float) -> None:
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+
+    def observe(self, value: float) -> None:
+        self.observe_series(self._default, value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for series in self._series.values():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                le = _labels(self.labelnames + ("le",), series.labels + (bound,))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series.counts[-1]
+            labels = _labels(self.labelnames, series.labels)
+            inf = _labels(self.labelnames + ("le",), series.labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{inf} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {series.sum}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Timer:
+    """`with metrics.Timer(histogram, series):` — наблюдает длительность блока."""
+    __slots__ = ("histogram", "series", "start")
+
+    def __init__(self, histogram: Histogram, series: _Series | None = None):
+        self.histogram = histogram
+        self.series = series if series is not None else histogram._default
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe_series(self.series, time.perf_counter() - self.start)
+
+
+def _simple(name: str, kind: str, help: str, values: dict[tuple, float], labelnames: tuple[str, ...] = ()) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labelnames, labels)} {value}" for labels, value in values.items()]
+    return lines
+
+
+# --- Метрики ---
+http_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+db_queries_per_request = Histogram("db_queries_per_request", "SQL statements executed per HTTP request.", ("method", "route"), COUNT_BUCKETS)
+db_pool_wait = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled database connection.")
+bcrypt_time = Histogram("bcrypt_seconds", "bcrypt hash/verify time including the wait for the password pool.", ("op",), SLOW_BUCKETS)
+stripe_time = Histogram("stripe_api_seconds", "Stripe API call latency.", ("call",), SLOW_BUCKETS)
+smtp_send = Histogram("smtp_send_seconds", "SMTP send time per message.", (), SLOW_BUCKETS)
+webhook_lag = Histogram(
+    "webhook_lag_seconds",
+    "Delay from Stripe event creation (created) or receipt (received) to being applied.",
+    ("stage",), SLOW_BUCKETS,
+)
+
+# (method, route) -> ответы по классам статуса [1xx, 2xx, 3xx, 4xx, 5xx]
+_responses: dict[tuple[str, str], list[int]] = {}
+# маршрут -> его серии (латентность, SQL, ответы)
+_routes: dict = {}
+in_flight = 0
+db_queries_total = 0
+
+_request_queries: contextvars.ContextVar[list | None] = contextvars.ContextVar("request_queries", default=None)
+
+
+# --- Middleware ---
+class MetricsMiddleware:
+    """Чистый ASGI: латентность по шаблону маршрута, статусы, запросы в работе, SQL на запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        global in_flight
+        status = 500
+        queries = [0]
+        token = _request_queries.set(queries)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight -= 1
+            _request_queries.reset(token)
+            self._record(scope, status, elapsed, queries[0])
+
+    @staticmethod
+    def _record(scope, status: int, elapsed: float, queries: int) -> None:
+        # маршрут FastAPI кладёт в scope при маршрутизации; у смонтированной статики его нет
+        route = scope.get("route")
+        # маршруты FastAPI не хэшируются, но живут всё время работы — ключ по id
+        key = id(route) if route is not None else scope.get("root_path") or "<unmatched>"
+        cached = _routes.get(key)
+        if cached is None:
+            path = route.path if route is not None else key
+            method = ",".join(sorted(getattr(route, "methods", None) or ())) or scope["method"]
+            responses = _responses.setdefault((method, path), [0] * len(STATUS_CLASSES))
+            cached = _routes[key] = (http_duration.labels(method, path), db_queries_per_request.labels(method, path), responses)
+        duration, sql, responses = cached
+        http_duration.observe_series(duration, elapsed)
+        db_queries_per_request.observe_series(sql, queries)
+        responses[min(max(status // 100, 1), 5) - 1] += 1
+
+
+# --- База ---
+def instrument_engine(engine) -> None:
+    """Считает SQL-запросы: всего и в пределах текущего HTTP-запроса."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        global db_queries_total
+        db_queries_total += 1
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+
+# --- Экспорт ---
+async def render(app) -> str:
+    import boot
+    import csrf
+    import fragments
+    import passwords
+    import ratelimit
+    import uploads
+    import user_cache
+    from database import engine
+
+    lines = []
+    for histogram in (http_duration, db_queries_per_request, db_pool_wait, bcrypt_time, stripe_time, smtp_send, webhook_lag):
+        lines += histogram.render()
+
+    responses = {}
+    for (method, path), counts in _responses.items():
+        for status_class, count in zip(STATUS_CLASSES, counts):
+            if count:
+                responses[(method, path, status_class)] = count
+    lines += _simple("http_responses_total", "counter", "HTTP responses by route and status class.", responses, ("method", "route", "status"))
+    lines += _simple("http_requests_in_flight", "gauge", "HTTP requests being processed.", {(): in_flight})
+    lines += _simple("db_queries_total", "counter", "SQL statements executed.", {(): db_queries_total})
+
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        lines += _simple("db_pool_checked_out", "gauge", "Connections checked out of the pool.", {(): pool.checkedout()})
+
+    for module, name in ((passwords, "passwords"), (user_cache, "user_cache"), (uploads, "uploads"),
+                         (fragments, "fragments"), (csrf, "csrf"), (ratelimit, "ratelimit")):
+        lines += _simple(f"{name}_events", "gauge", f"{name}.stats counters.",
+                         {(key,): value for key, value in module.stats.items()}, ("event",))
+    lines += _simple("passwords_pending", "gauge", "bcrypt operations running or queued.", {(): passwords.pending()})
+    lines += _simple("fragments_hit_ratio", "gauge", "Share of fragment requests served without rendering.", {(): fragments.hit_ratio()})
+    lines += _simple("ratelimit_rejections_total", "counter", "Rate limit rejections by rule and budget.",
+                     {tuple(key.split(":", 1)): value for key, value in ratelimit.rejections.items()}, ("rule", "scope"))
+
+    state = app.state
+    if getattr(state, "mail_worker", None) is not None:
+        mail = await state.mail_worker.metrics()
+        lines += _simple("mail", "gauge", "Mail worker counters and queue state.",
+                         {(key,): value for key, value in mail.items()}, ("metric",))
+    if getattr(state, "events", None) is not None:
+        lines += _simple("sse_connections", "gauge", "Open /api/events streams.", {(): state.events.connections()})
+    if getattr(state, "campaigns", None) is not None:
+        lines += _simple("campaign_snapshot_reloads_total", "counter", "Campaign snapshot reloads.", {(): state.campaigns.reloads})
+    lines += _simple("startup_step_seconds", "gauge", "Duration of startup and prewarm steps.",
+                     {(step,): seconds for step, seconds in boot.timings.items()}, ("step",))
+    return "\n".join(lines) + "\n"
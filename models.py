@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float
+from sqlalchemy import Column, Integer, String, DateTime, Float, Date, Text, LargeBinary, Boolean, ForeignKey, UniqueConstraint, Index
 from database import Base
 from datetime import datetime
 
@@ -9,7 +9,86 @@ class User(Base):
     username = Column(String(20), unique=True, index=True, nullable=False)
     email = Column(String(50), unique=True, index=True, nullable=False)
     hashed_password = Column(String(200), nullable=False)
-    amount = Column(Float, nullable=False, default=0.0)  # сумма донатов
+    amount = Column(Float, nullable=False, default=0.0, index=True)  # сумма донатов
     last_donation_time = Column(DateTime, default=None)  # время последнего доната
     avatar = Column(String(255), nullable=True)         # поле аватара
     philanthrop_level = Column(String(20), nullable=False, default="0")
+
+
+class Donation(Base):
+    """Журнал донатов: строки только добавляются, никогда не меняются."""
+    __tablename__ = "donations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    amount = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    stripe_session_id = Column(String(255), unique=True, nullable=True)  # защита от повторов Stripe
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True, index=True)  # донат на кампанию
+
+
+class Campaign(Base):
+    """Кампания сбора (карточка на /welcome); `raised` и `donations_count` растут вместе с журналом."""
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(120), nullable=False)
+    description = Column(String(255), nullable=False)  # подпись на лицевой стороне карточки
+    text = Column(Text, nullable=False, default="")
+    image = Column(String(255), nullable=True)  # путь внутри static/ или полный URL
+    link = Column(String(255), nullable=True)
+    goal = Column(Float, nullable=True)
+    raised = Column(Float, nullable=False, default=0.0)
+    donations_count = Column(Integer, nullable=False, default=0)
+    position = Column(Integer, nullable=False, default=0)  # порядок на странице
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DonationTotal(Base):
+    """Предрасчитанные суммы донатов пользователя за период (day/week/month/all)."""
+    __tablename__ = "donation_totals"
+    __table_args__ = (
+        UniqueConstraint("user_id", "period", "period_start", name="uq_donation_totals_user_period"),
+        Index("ix_donation_totals_period_total", "period", "period_start", "total"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    period = Column(String(8), nullable=False)
+    period_start = Column(Date, nullable=False)  # для "all" — 1970-01-01
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class StripeEvent(Base):
+    """Принятые вебхуки Stripe; id события — ключ дедупликации повторных доставок."""
+    __tablename__ = "stripe_events"
+
+    id = Column(String(255), primary_key=True)  # evt_...
+    type = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)  # сырое тело запроса
+    event_created_at = Column(DateTime, nullable=True)  # время события на стороне Stripe
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True, index=True)
+    locked_until = Column(DateTime, nullable=True)  # аренда события воркером
+    claim_token = Column(String(32), nullable=True, index=True)  # какой выборкой взято
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+
+class OutgoingMail(Base):
+    """Исходящая почта: письмо сохраняется целиком, отправляет воркер из mailer.py."""
+    __tablename__ = "mail_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sender = Column(String(255), nullable=False)
+    recipients = Column(Text, nullable=False)  # адреса через запятую
+    message = Column(LargeBinary, nullable=False)  # готовое письмо RFC 5322
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True, index=True)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # и аренда воркером
+    claim_token = Column(String(32), nullable=True, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
@@ -0,0 +1,87 @@
+"""Хэширование паролей bcrypt вне event loop.
+
+Один bcrypt занимает 100–300 мс процессора, поэтому хэш и проверка идут
+в ограниченном пуле потоков (bcrypt отпускает GIL на время вычисления).
+Очередь к пулу тоже ограничена: если в работе и в ожидании уже
+PASSWORD_QUEUE_LIMIT операций, новая сразу получает `Busy` (503 с
+Retry-After), а не ждёт секундами, пока истечёт таймаут у клиента.
+
+Стоимость задаётся BCRYPT_ROUNDS. При её изменении старые хэши
+пересчитываются прозрачно при следующем успешном входе
+(см. `verify_and_update`).
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", str(WORKERS * 8)))
+RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "1"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=ROUNDS)
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+_hash_time = metrics.bcrypt_time.labels("hash")
+_verify_time = metrics.bcrypt_time.labels("verify")
+
+
+class Busy(Exception):
+    """Пул хэширования переполнен — запрос стоит повторить позже."""
+
+    retry_after = RETRY_AFTER
+
+
+async def _run(func, *args):
+    global _pending
+    if _pending >= QUEUE_LIMIT:
+        stats["rejected"] += 1
+        raise Busy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+def pending() -> int:
+    """Операции в работе и в очереди к пулу."""
+    return _pending
+
+
+async def hash_password(password: str) -> str:
+    with metrics.Timer(metrics.bcrypt_time, _hash_time):
+        hashed = await _run(pwd_context.hash, password)
+    stats["hashed"] += 1
+    return hashed
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    with metrics.Timer(metrics.bcrypt_time, _verify_time):
+        ok = await _run(pwd_context.verify, password, hashed)
+    stats["verified"] += 1
+    return ok
+
+
+async def verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    """Проверяет пароль; вторым элементом — новый хэш, если стоимость устарела."""
+    with metrics.Timer(metrics.bcrypt_time, _verify_time):
+        ok, new_hash = await _run(pwd_context.verify_and_update, password, hashed)
+    stats["verified"] += 1
+    if new_hash:
+        stats["rehashed"] += 1
+    return ok, new_hash
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
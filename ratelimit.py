@@ -0,0 +1,252 @@
+"""Ограничение частоты запросов: скользящее окно в Redis и ведро в процессе.
+
+Правило (`RULES`) — несколько бюджетов вида «не больше N запросов за
+T секунд» по IP, по пользователю и общий на маршрут. Все бюджеты правила
+проверяются одним вызовом Lua-скрипта: в каждом ключе хранится журнал
+времён запросов (sorted set), запрос пропускается, только если есть место
+во всех окнах, и тогда записывается во все сразу.
+
+Перед Redis стоит token bucket в памяти процесса с теми же бюджетами: он
+никогда не строже окна (процесс видит лишь часть запросов, а ведро после
+всплеска пополняется равномерно), но поток запросов с одного адреса
+отбрасывается, не доходя до Redis. Если Redis недоступен, остаётся только
+локальное ведро.
+
+Отказ — 429 с Retry-After. Счётчики отказов — в `stats` и `rejections`
+(по правилу и бюджету).
+
+    @router.post("/login", dependencies=[Depends(ratelimit.limit("login"))])
+"""
+import ipaddress
+import logging
+import math
+import os
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
+
+import sessions
+
+logger = logging.getLogger(__name__)
+
+KEY = "ratelimit:{}:{}:{}"
+LOCAL_SIZE = 10000
+# Адреса и сети прокси, которым верим в X-Forwarded-For (на Render — сеть балансировщика)
+TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv("TRUSTED_PROXIES", "").split(",") if network.strip()
+)
+
+
+@dataclass(frozen=True)
+class Limit:
+    scope: str  # ip | user | global
+    times: int
+    seconds: int
+
+
+@dataclass(frozen=True)
+class Rule:
+    limits: tuple[Limit, ...]
+    # поле тела запроса, по которому считается пользователь без сессии (вход, сброс пароля)
+    user_field: str | None = None
+
+
+RULES = {
+    # bcrypt на каждую попытку; по имени — против перебора пароля с разных адресов
+    "login": Rule((Limit("ip", 20, 60), Limit("user", 10, 300), Limit("global", 50, 1)), user_field="username"),
+    "register": Rule((Limit("ip", 5, 3600), Limit("global", 20, 1))),
+    # вызов Stripe API на каждый запрос
+    "checkout": Rule((Limit("user", 10, 60), Limit("ip", 20, 60), Limit("global", 25, 1))),
+    # только вебхуки с неверной подписью (проверяется до лимита): мусор не вытесняет Stripe
+    "webhook_invalid": Rule((Limit("ip", 30, 60), Limit("global", 100, 1))),
+    "forgot_password": Rule((Limit("ip", 3, 3600), Limit("user", 3, 3600)), user_field="email"),
+}
+
+stats = {"allowed": 0, "rejected_local": 0, "rejected_redis": 0, "redis_errors": 0}
+rejections: dict[str, int] = {}
+
+_script = None
+
+# KEYS — ключи бюджетов; ARGV[1] — id запроса, дальше пары (лимит, окно в мс).
+# Возвращает {0, 0} или {номер исчерпанного бюджета, мс до освобождения места}.
+SLIDING_WINDOW = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local retry, tier = 0, 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i])
+    local window = tonumber(ARGV[2 * i + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local count = redis.call('ZCARD', key)
+    if count >= limit then
+        local oldest = redis.call('ZRANGE', key, count - limit, count - limit, 'WITHSCORES')
+        local wait = math.max(tonumber(oldest[2]) + window - now, 1)
+        if wait > retry then
+            retry, tier = wait, i
+        end
+    end
+end
+if tier > 0 then
+    return {tier, retry}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[1])
+    redis.call('PEXPIRE', key, ARGV[2 * i + 1])
+end
+return {0, 0}
+"""
+
+
+# --- Локальное ведро ---
+class Bucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, limit: Limit):
+        self.rate = limit.times / limit.seconds
+        self.capacity = float(limit.times)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait(self) -> float:
+        """Секунд до следующего токена; 0 — токен есть."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+_buckets: OrderedDict[tuple[str, str, str], Bucket] = OrderedDict()
+
+
+def _bucket(key: tuple[str, str, str], limit: Limit) -> Bucket:
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = _buckets[key] = Bucket(limit)
+        while len(_buckets) > LOCAL_SIZE:
+            _buckets.popitem(last=False)
+    else:
+        _buckets.move_to_end(key)
+    return bucket
+
+
+# --- Кто делает запрос ---
+def _trusted(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(request: Request) -> str:
+    """Адрес клиента: соединения, а за доверенным прокси — из X-Forwarded-For.
+
+    Левые записи заголовка клиент пишет сам, поэтому он читается справа
+    налево: первый адрес, добавленный не нашим прокси, — клиент.
+    """
+    host = request.client.host if request.client else "unknown"
+    if not _trusted(host):
+        return host
+    hops = [hop.strip() for hop in ",".join(request.headers.getlist("X-Forwarded-For")).split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else host
+
+
+async def _user(request: Request, rule: Rule) -> str | None:
+    token = request.cookies.get(sessions.COOKIE)
+    session = sessions.verify(token) if token else None
+    if session is not None:
+        return f"id:{session.user_id}"
+    if rule.user_field and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        value = body.get(rule.user_field) if isinstance(body, dict) else None
+        if isinstance(value, str) and value.strip():
+            return f"name:{value.strip().lower()}"
+    return None
+
+
+async def _identities(request: Request, rule: Rule) -> list[tuple[Limit, str]]:
+    tiers = []
+    for limit in rule.limits:
+        if limit.scope == "ip":
+            ident = client_ip(request)
+        elif limit.scope == "user":
+            ident = await _user(request, rule)
+        else:
+            ident = "*"
+        if ident is not None:
+            tiers.append((limit, ident))
+    return tiers
+
+
+# --- Проверка ---
+def _sliding_window(redis):
+    global _script
+    if _script is None:
+        # EVALSHA; текст скрипта уходит в Redis, только если его там нет (NOSCRIPT)
+        _script = redis.register_script(SLIDING_WINDOW)
+    return _script
+
+
+def _reject(name: str, limit: Limit, retry_after: float, source: str) -> HTTPException:
+    stats[f"rejected_{source}"] += 1
+    key = f"{name}:{limit.scope}"
+    rejections[key] = rejections.get(key, 0) + 1
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests. Please try again later.",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def check(request: Request, name: str) -> None:
+    """Пропускает запрос или бросает 429 с Retry-After."""
+    rule = RULES[name]
+    tiers = await _identities(request, rule)
+
+    buckets = [(limit, _bucket((name, limit.scope, ident), limit)) for limit, ident in tiers]
+    for limit, bucket in buckets:
+        wait = bucket.wait()
+        if wait:
+            raise _reject(name, limit, wait, "local")
+
+    redis = getattr(request.app.state, "redis", None)
+    if redis is not None:
+        args = [secrets.token_hex(8)]
+        for limit, _ in tiers:
+            args += [limit.times, limit.seconds * 1000]
+        try:
+            tier, retry_ms = await _sliding_window(redis)(
+                keys=[KEY.format(name, limit.scope, ident) for limit, ident in tiers], args=args, client=redis
+            )
+        except RedisError:
+            stats["redis_errors"] += 1
+            logger.warning("Rate limiter unavailable in Redis, using local limits only", exc_info=True)
+        else:
+            if tier:
+                raise _reject(name, tiers[int(tier) - 1][0], int(retry_ms) / 1000, "redis")
+
+    for _, bucket in buckets:
+        bucket.tokens -= 1
+    stats["allowed"] += 1
+
+
+def limit(name: str):
+    """Зависимость FastAPI для правила `name` из RULES."""
+    if name not in RULES:
+        raise ValueError(f"Unknown rate limit rule: {name}")
+
+    async def dependency(request: Request) -> None:
+        await check(request, name)
+
+    return dependency
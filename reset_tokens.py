@@ -0,0 +1,73 @@
+"""Сброс пароля: пауза между письмами и одноразовые токены в Redis.
+
+- `reset:cooldown:{email}` — не чаще одного письма в COOLDOWN секунд на
+  адрес. Ставится до запроса в базу и для несуществующих адресов тоже,
+  поэтому ответ не выдаёт, есть ли такой пользователь.
+- `reset:token:{jti}` — выданные и ещё не использованные токены (jti из
+  JWT) с тем же сроком, что и сам JWT. `consume` удаляет запись атомарно
+  (GETDEL), так что ссылка из письма срабатывает один раз, а повторный
+  JWT отбрасывается без обращения к базе.
+- `reset:latest:{email}` — jti последнего выданного адресу токена:
+  новая ссылка гасит предыдущую, действует только последнее письмо.
+"""
+import os
+import secrets
+
+from redis.asyncio import Redis
+
+COOLDOWN = int(os.getenv("RESET_COOLDOWN", "600"))
+TOKEN_TTL = int(os.getenv("RESET_TOKEN_TTL", "3600"))
+
+COOLDOWN_KEY = "reset:cooldown:{}"
+TOKEN_KEY = "reset:token:{}"
+LATEST_KEY = "reset:latest:{}"
+
+# KEYS — последний токен адреса и новый токен; ARGV — jti, email, срок, префикс ключей токенов
+ISSUE = """
+local previous = redis.call('GET', KEYS[1])
+if previous and previous ~= ARGV[1] then
+    redis.call('DEL', ARGV[4] .. previous)
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+"""
+
+# Возвращает токен, только если после него адресу не выдали новый
+RESTORE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+async def start_cooldown(redis: Redis, email: str) -> int:
+    """Начинает паузу для адреса; 0 — можно отправлять, иначе секунд до конца паузы."""
+    key = COOLDOWN_KEY.format(email)
+    if await redis.set(key, 1, nx=True, ex=COOLDOWN):
+        return 0
+    return max(await redis.ttl(key), 1)
+
+
+def new_token_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+async def register(redis: Redis, jti: str, email: str, ttl: int = TOKEN_TTL) -> None:
+    """Регистрирует новый токен адреса; предыдущий перестаёт действовать."""
+    await redis.eval(ISSUE, 2, LATEST_KEY.format(email), TOKEN_KEY.format(jti), jti, email, ttl, TOKEN_KEY.format(""))
+
+
+async def restore(redis: Redis, jti: str, email: str, ttl: int) -> bool:
+    """Возвращает забранный `consume` токен (пароль не сменился), если он всё ещё последний."""
+    return bool(await redis.eval(RESTORE, 2, LATEST_KEY.format(email), TOKEN_KEY.format(jti), jti, email, ttl))
+
+
+async def is_active(redis: Redis, jti: str) -> bool:
+    return bool(await redis.exists(TOKEN_KEY.format(jti)))
+
+
+async def consume(redis: Redis, jti: str) -> str | None:
+    """Забирает токен: email, если он был выдан и ещё не использован, иначе None."""
+    return await redis.getdel(TOKEN_KEY.format(jti))
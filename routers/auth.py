@@ -1,55 +1,46 @@
-import sys
-import os, re, smtplib, stripe
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import os, re
+import asyncio
+import contextlib
 
 from fastapi import (
-    APIRouter, Depends, HTTPException, Request, Cookie, Form, File, UploadFile, Query
+    APIRouter, Depends, HTTPException, Request, Form, File, UploadFile, Query
 )
 from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional, List
-from passlib.context import CryptContext
-from datetime import datetime
-from dotenv import load_dotenv
-from itsdangerous import URLSafeTimedSerializer
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+from redis.exceptions import RedisError
+from markupsafe import Markup
 import models, schemas
+import leaderboard
+import events
+import webhook_queue
+import passwords
+import avatars
+import uploads
+import mailer
+import templating
+import fragments
+from templating import templates
+import user_cache
+import sessions
+import csrf
+import ratelimit
+import metrics
+from user_cache import CachedUser
 from database import get_db
-import time
+import logging
 # --- Router init ---
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
 
 # --- Load env ---
-load_dotenv()
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# .env загружает database.py, который импортируется раньше роутеров
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 YOUR_DOMAIN = os.getenv("YOUR_DOMAIN", "https://top-donators.onrender.com")
-UPLOAD_AVATAR_DIR = "/static/avatars"
-MAX_AVATAR_SIZE = 10 * 1024 * 1024
-os.makedirs(UPLOAD_AVATAR_DIR, exist_ok=True)
-
-
-# --- CSRF ---
-def get_csrf_serializer():
-    secret = os.getenv("CSRF_SECRET", "dev-secret")
-    return URLSafeTimedSerializer(secret)
-
-def generate_csrf_token():
-    return get_csrf_serializer().dumps("token")
-
-def validate_csrf_token(token: str):
-    try:
-        get_csrf_serializer().loads(token, max_age=3600)
-        return True
-    except Exception:
-        return False
+MAX_AD_SIZE = 18 * 1024 * 1024  # вложения письма после base64 должны уложиться в 25 МБ Gmail
 
 
 # --- Models ---
@@ -64,105 +55,119 @@ class DonateRequest(BaseModel):
 
 
 # --- Utils ---
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def is_username_valid(username: str) -> bool:
     return bool(re.match(r'^[a-zA-Z0-9_]+$', username))
 
 
 # --- Endpoints ---
-@router.post("/register")
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", dependencies=[Depends(ratelimit.limit("register"))])
+async def register(request: Request, user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     if not is_username_valid(user.username):
         raise HTTPException(status_code=400, detail="The username must contain only English letters, numbers, and '_'")
 
-    db_user = db.query(models.User).filter(
+    db_user = await db.scalar(select(models.User).where(
         (models.User.username == user.username) | (models.User.email == user.email)
-    ).first()
+    ))
     if db_user:
         raise HTTPException(status_code=400, detail="A user with this username or email already exists")
 
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await passwords.hash_password(user.password)
     new_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return {"message": "You have successfully registered"}
+    await db.commit()
+    await db.refresh(new_user)
 
+    # Индекс имён таблицы лидеров: место пользователя ищется по имени
+    try:
+        await leaderboard.sync_profile(request.app.state.redis, new_user)
+    except RedisError:
+        logger.warning("Failed to add user %s to leaderboard index", new_user.id, exc_info=True)
+    return {"message": "You have successfully registered"}
 
-@router.post("/login")
-async def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
-    cookie_token = request.cookies.get("csrf_token")
-    if not cookie_token or data.csrf_token != cookie_token or not validate_csrf_token(data.csrf_token):
-        raise HTTPException(status_code=403, detail="Invalid or expired CSRF token")
 
+@router.post("/login", dependencies=[Depends(csrf.require), Depends(ratelimit.limit("login"))])
+async def login(data: LoginRequest, request: Request, db: AsyncSession = Depends(get_db)):
     if not is_username_valid(data.username):
         raise HTTPException(status_code=400, detail="The username is invalid")
 
-    db_user = db.query(models.User).filter(models.User.username == data.username).first()
-    if not db_user or not verify_password(data.password, db_user.hashed_password):
+    db_user = await db.scalar(select(models.User).where(models.User.username == data.username))
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    ok, new_hash = await passwords.verify_and_update(data.password, db_user.hashed_password)
+    if not ok:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if new_hash:
+        # Стоимость bcrypt поменялась — пересохраняем хэш, пока пароль известен
+        db_user.hashed_password = new_hash
+        await db.commit()
 
     response = JSONResponse(content={"redirect_url": "/auth/welcome"})
-    response.set_cookie("username", db_user.username, httponly=True, samesite="lax", secure=True)
-    response.set_cookie("csrf_token", generate_csrf_token(), httponly=True, samesite="lax", secure=True)
+    sessions.set_cookie(response, db_user)
+    csrf.set_cookie(response, csrf.generate())
     return response
 
 
 @router.get("/welcome", response_class=HTMLResponse)
-def welcome(request: Request, db: Session = Depends(get_db), username: str | None = Cookie(default=None), donation: str | None = Query(default=None)):
-    if not username:
-        return RedirectResponse(url="/", status_code=303)
-    users = db.query(models.User).order_by(models.User.amount.desc()).limit(10).all()
-    current_user = db.query(models.User).filter(models.User.username == username).first()
+async def welcome(request: Request, db: AsyncSession = Depends(get_db), current_user: CachedUser | None = Depends(user_cache.current_user), donation: str | None = Query(default=None)):
     if not current_user:
         return RedirectResponse(url="/", status_code=303)
-    return templates.TemplateResponse("welcome.html", {"request": request, "top_users": users, "current_user": current_user, "donation": donation})
+
+    redis = request.app.state.redis
+
+    async def render_top(users=None) -> str:
+        users = users if users is not None else await leaderboard.top(redis, 10)
+        return templates.get_template("_top_table.html").render(top_users=users)
+
+    # Топ и место пользователя берём из Redis, база — только если Redis недоступен.
+    # HTML топа общий для всех и кэшируется по версии таблицы лидеров
+    nearby_users = []
+    try:
+        top_table = await fragments.get(redis, "top_table", await leaderboard.version(redis), render_top)
+        current_rank = await leaderboard.rank(redis, current_user.id)
+        # Если пользователь не в топ-10 — показываем его и ±5 соседей
+        if current_rank and current_rank > 10:
+            nearby_users = await leaderboard.around(redis, current_user.id, 5)
+    except RedisError:
+        logger.warning("Leaderboard unavailable in Redis, falling back to database", exc_info=True)
+        top_table = Markup(await render_top(await leaderboard.top_from_db(db, 10)))
+        current_rank = None
+    return templates.TemplateResponse("welcome.html", {"request": request, "top_table": top_table, "current_user": current_user, "current_rank": current_rank, "nearby_users": nearby_users, "donation": donation})
 
 
 @router.get("/login", response_class=HTMLResponse)
 async def get_login(request: Request):
-    csrf_token = generate_csrf_token()
-    response = templates.TemplateResponse("login.html", {"request": request, "csrf_token": csrf_token})
-    response.set_cookie("csrf_token", csrf_token, httponly=True, secure=True, samesite="lax")
+    csrf_token = csrf.generate()
+    response = templating.render_static("login.html", csrf_token)
+    csrf.set_cookie(response, csrf_token)
     return response
 
 
 @router.get("/register", response_class=HTMLResponse)
 async def get_register(request: Request):
-    csrf_token = generate_csrf_token()
-    response = templates.TemplateResponse("register.html", {"request": request, "csrf_token": csrf_token})
-    response.set_cookie("csrf_token", csrf_token, httponly=True, secure=True, samesite="lax")
+    csrf_token = csrf.generate()
+    response = templating.render_static("register.html", csrf_token)
+    csrf.set_cookie(response, csrf_token)
     return response
 
 
-@router.post("/donate")
-async def donate(data: DonateRequest, request: Request, username: str | None = Cookie(default=None), db: Session = Depends(get_db)):
-    cookie_token = request.cookies.get("csrf_token")
-    if not cookie_token or data.csrf_token != cookie_token or not validate_csrf_token(data.csrf_token):
-        raise HTTPException(status_code=403, detail="Invalid or expired CSRF token")
+@router.post("/donate", dependencies=[Depends(csrf.require)])
+async def donate(data: DonateRequest, request: Request, db: AsyncSession = Depends(get_db)):
     raise HTTPException(status_code=403, detail="Balance top-up is only available via Stripe")
 
 
 @router.get("/profile", response_class=HTMLResponse)
-def profile(
+async def profile(
     request: Request,
-    db: Session = Depends(get_db),
-    username: str | None = Cookie(default=None)
+    session: sessions.Session | None = Depends(sessions.current_session),
+    user: CachedUser | None = Depends(user_cache.current_user)
 ):
-    if not username:
+    if not session:
         return RedirectResponse(url="/", status_code=303)
-
-    user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
-    avatar_url = f"/static/avatars/{user.avatar}" if user.avatar else None
-    csrf_token = generate_csrf_token()
+    avatar_url = avatars.avatar_url(user.avatar, 256) if user.avatar else None
+    csrf_token = csrf.generate()
 
     # Передаём csrf_token в шаблон (чтобы вставить в hidden input)
     response = templates.TemplateResponse(
@@ -175,31 +180,23 @@ def profile(
         }
     )
     # Кладём CSRF в httponly-куку (невидимую для JS)
-    response.set_cookie(
-        "csrf_token",
-        csrf_token,
-        httponly=True,
-        secure=True,
-        samesite="lax"
-    )
+    csrf.set_cookie(response, csrf_token)
     return response
 
 
 @router.get("/profile", response_class=HTMLResponse)
-def profile(
+async def profile(
     request: Request,
-    db: Session = Depends(get_db),
-    username: str | None = Cookie(default=None)
+    session: sessions.Session | None = Depends(sessions.current_session),
+    user: CachedUser | None = Depends(user_cache.current_user)
 ):
-    if not username:
+    if not session:
         raise HTTPException(status_code=401, detail="Unauthorized")
-
-    user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    avatar_url = f"/static/avatars/{user.avatar}" if user.avatar else None
-    csrf_token = generate_csrf_token()
+    avatar_url = avatars.avatar_url(user.avatar, 256) if user.avatar else None
+    csrf_token = csrf.generate()
 
     # Передаём csrf_token в шаблон (чтобы вставить в hidden input)
     response = templates.TemplateResponse(
@@ -212,110 +209,85 @@ def profile(
         }
     )
     # Кладём CSRF в httponly-куку (невидимую для JS)
-    response.set_cookie(
-        "csrf_token",
-        csrf_token,
-        httponly=True,
-        secure=True,
-        samesite="lax"
-    )
+    csrf.set_cookie(response, csrf_token)
     return response
 
 
-@router.post("/profile")
+@router.post("/profile", dependencies=[Depends(csrf.require)])
 async def update_profile(
     request: Request,
     username: Optional[str] = Form(None),
     email: Optional[str] = Form(None),
     password: Optional[str] = Form(None),
     avatar: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
-    current_username: str = Cookie(..., alias="username")
+    db: AsyncSession = Depends(get_db),
+    session: sessions.Session | None = Depends(sessions.current_session)
 ):
-    form = await request.form()
-    csrf_token_form = form.get("csrf_token")
-    csrf_token_cookie = request.cookies.get("csrf_token")
-
-    # Проверка CSRF
-    if not csrf_token_form or not csrf_token_cookie:
-        raise HTTPException(status_code=403, detail="CSRF token missing")
-    if csrf_token_form != csrf_token_cookie:
-        raise HTTPException(status_code=403, detail="Invalid CSRF token")
-    if not validate_csrf_token(csrf_token_form):
-        raise HTTPException(status_code=403, detail="Expired or invalid CSRF token")
-
-    if not current_username:
+    if not session:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    user = db.query(models.User).filter(models.User.username == current_username).first()
+    user = await db.get(models.User, session.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    current_username = user.username
 
     # --- обновления ---
     if username and username != current_username:
-        if db.query(models.User).filter(models.User.username == username).first():
+        if await db.scalar(select(models.User).where(models.User.username == username)):
             raise HTTPException(status_code=400, detail="Username is already taken")
         user.username = username
 
     if email and email != user.email:
-        if db.query(models.User).filter(models.User.email == email).first():
+        if await db.scalar(select(models.User).where(models.User.email == email)):
             raise HTTPException(status_code=400, detail="Email is already in use")
         user.email = email
 
     if password:
-        user.hashed_password = get_password_hash(password)
+        user.hashed_password = await passwords.hash_password(password)
 
     # --- аватар ---
-    if avatar and avatar.filename:
-        contents = await avatar.read()
-        if len(contents) > MAX_AVATAR_SIZE:
-            raise HTTPException(status_code=413, detail="The file size is too large (maximum 10 MB)")
-
-        from PIL import Image
-        from io import BytesIO
-
-        try:
-            img = Image.open(BytesIO(contents))
-            img.verify()
-        except Exception:
-            raise HTTPException(status_code=400, detail="The file is not an image")
-
-        safe_filename = os.path.basename(avatar.filename)
-        ext = os.path.splitext(safe_filename)[1].lower()
-        ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg"}
-        if ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(status_code=400, detail="Unsupported file extension")
-
-        avatar_filename = f"user_{user.id}_{int(time.time())}{ext}"
-        avatar_path = os.path.join(UPLOAD_AVATAR_DIR, avatar_filename)
-
-        if user.avatar:
-            old_avatar_path = os.path.join(UPLOAD_AVATAR_DIR, user.avatar)
-            if os.path.exists(old_avatar_path):
-                try:
-                    os.remove(old_avatar_path)
-                except Exception as e:
-                    print(f"Error deleting old avatar: {e}")
-
-        with open(avatar_path, "wb") as buffer:
-            buffer.write(contents)
-
-        user.avatar = avatar_filename
-
-    db.commit()
+    # Блокировка хэша нового аватара держится до коммита ссылки на него (avatars.save_upload)
+    old_avatar = user.avatar
+    async with contextlib.AsyncExitStack() as upload:
+        if avatar and avatar.filename:
+            try:
+                user.avatar = await upload.enter_async_context(avatars.save_upload(request.app.state.redis, avatar))
+            except avatars.TooLarge:
+                raise HTTPException(status_code=413, detail="The file size is too large (maximum 10 MB)")
+            except avatars.InvalidImage:
+                raise HTTPException(status_code=400, detail="The file is not an image")
+
+        # Смена пароля или имени завершает остальные сессии; эта получает новый токен ниже.
+        # Отзыв — до коммита: без него изменения не сохраняются
+        reissue = bool(password) or user.username != current_username
+        not_before = None
+        if reissue:
+            try:
+                not_before = await sessions.revoke_user(request.app.state.redis, user.id)
+            except RedisError:
+                logger.error("Failed to revoke sessions of user %s", user.id, exc_info=True)
+                raise HTTPException(status_code=503, detail="Could not sign out other sessions, please try again")
+
+        await db.commit()
+    await user_cache.invalidate(request.app.state.redis, current_username, user.username)
+
+    # Файлы старого аватара удаляем, только если такой же картинкой никто больше не пользуется
+    if old_avatar and old_avatar != user.avatar:
+        await avatars.remove_unused(request.app.state.redis, db, old_avatar)
+
+    # Обновляем индекс имён и строку пользователя в таблице лидеров (имя/аватар)
+    try:
+        await leaderboard.sync_profile(request.app.state.redis, user, old_username=current_username)
+    except RedisError:
+        logger.warning("Failed to sync user %s to leaderboard", user.id, exc_info=True)
+    else:
+        if user.amount and user.amount > 0:
+            await events.publish_top(request.app.state.redis)
 
     response = JSONResponse(content={"message": "Profile updated successfully"})
 
-    # если юзер сменил username → обновляем cookie
-    if username and username != current_username:
-        response.set_cookie(
-            key="username",
-            value=username,
-            path="/",
-            httponly=True,
-            samesite="lax",
-            secure=True
-        )
+    if reissue:
+        sessions.set_cookie(response, user, issued_at=not_before)
 
     return response
 
@@ -325,90 +297,106 @@ async def update_profile(
 #end
 @router.get("/send_ad", response_class=HTMLResponse)
 async def get_send_ad_form(request: Request):
-    csrf_token = generate_csrf_token()
-    response = templates.TemplateResponse(
-        "send_ad.html",  # <-- отдаём именно форму объявления
-        {"request": request, "csrf_token": csrf_token}
-    )
+    csrf_token = csrf.generate()
+    response = templating.render_static("send_ad.html", csrf_token)  # <-- отдаём именно форму объявления
     # Устанавливаем csrf_token в куки
-    response.set_cookie("csrf_token", csrf_token, httponly=True, secure=True, samesite="lax")
+    csrf.set_cookie(response, csrf_token)
     return response
 
 
 
-@router.post("/send_ad")
-async def send_ad(request: Request):
-    form_data = await request.form()
+_checkout_create_time = metrics.stripe_time.labels("checkout.Session.create")
 
-    # CSRF Проверка
-    csrf_token_form = form_data.get("csrf_token")
-    csrf_token_cookie = request.cookies.get("csrf_token")
-    if not csrf_token_form or not csrf_token_cookie:
-        raise HTTPException(status_code=403, detail="CSRF token missing")
-    if csrf_token_form != csrf_token_cookie:
-        raise HTTPException(status_code=403, detail="Invalid CSRF token")
-    if not validate_csrf_token(csrf_token_form):
-        raise HTTPException(status_code=403, detail="Expired or invalid CSRF token")
 
-    title = form_data.get("title")
-    message = form_data.get("message")
-    photos = form_data.getlist("photo")  # Получаем список файлов
+def get_stripe():
+    """stripe импортируется ~100 мс — при первом платеже или в фоне после старта (boot.prewarm)."""
+    import stripe
+
+    stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
 
-    sender_email = os.getenv("MAIL_USER")
-    receiver_email = os.getenv("MAIL_USER")
-    password = os.getenv("MAIL_PASSWORD")
 
+def build_ad_message(title: str, message: str, attachments: list):
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    receiver_email = os.getenv("MAIL_USER")
     msg = MIMEMultipart()
-    msg["From"] = sender_email
+    msg["From"] = mailer.MAIL_FROM
     msg["To"] = receiver_email
     msg["Subject"] = f"Новое объявление: {title}"
     msg.attach(MIMEText(message, "plain"))
 
     # Прикрепляем все фото
+    for file, kind in attachments:
+        file.file.seek(0)
+        part = MIMEBase("image", kind)
+        part.set_payload(file.file.read())
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", "attachment", filename=os.path.basename(file.filename))
+        msg.attach(part)
+    return msg
+
+
+@router.post("/send_ad", dependencies=[Depends(csrf.require)])
+async def send_ad(request: Request, db: AsyncSession = Depends(get_db)):
+    form_data = await request.form()
+
+    title = form_data.get("title")
+    message = form_data.get("message")
+    photos = form_data.getlist("photo")  # Получаем список файлов
+
+    # Тип вложений — по первым байтам файла, а не по расширению
+    attachments = []
     for file in photos:
         if file.filename:
-            data = await file.read()
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(data)
-            encoders.encode_base64(part)
-            part.add_header("Content-Disposition", f"attachment; filename={file.filename}")
-            msg.attach(part)
+            kind = uploads.sniff_image(await file.read(16))
+            if kind is None:
+                raise HTTPException(status_code=400, detail="Only images can be attached")
+            attachments.append((file, kind))
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(sender_email, password)
-        server.send_message(msg)
+    # Письмо (с base64 вложений) собирается в потоке и уходит в очередь mailer
+    msg = await asyncio.to_thread(build_ad_message, title, message, attachments)
+    await mailer.enqueue(db, msg)
+    request.app.state.mail_worker.notify()
 
     return HTMLResponse("<h1>Объявление отправлено!</h1><a href='/auth/welcome'>Вернуться</a>")
 
 @router.post("/logout")
-async def logout():
+async def logout(request: Request, session: sessions.Session | None = Depends(sessions.current_session)):
+    if session:
+        try:
+            await sessions.revoke(request.app.state.redis, session)
+        except RedisError:
+            logger.warning("Failed to revoke session of user %s", session.user_id, exc_info=True)
     response = RedirectResponse(url="/", status_code=303)
-    response.delete_cookie("username", path="/")
-    response.delete_cookie("csrf_token", path="/")
+    sessions.delete_cookie(response)
+    response.delete_cookie("username", path="/")  # cookie до подписанных сессий
+    response.delete_cookie(csrf.COOKIE, path="/")
     response.delete_cookie("__stripe_mid", path="/")
     response.delete_cookie("__stripe_sid", path="/")
     return response
 
 @router.post("/payment")
-async def process_payment(request: Request, amount: int = Form(...)):
-    return RedirectResponse(url=f"/auth/payment?amount={amount}", status_code=303)
+async def process_payment(request: Request, amount: int = Form(...), project_id: int = Form(0)):
+    return RedirectResponse(url=f"/auth/payment?amount={amount}&project_id={project_id}", status_code=303)
 
 @router.get("/payment", response_class=HTMLResponse)
-async def payment_page(request: Request, amount: int):
-    return templates.TemplateResponse("payment.html", {"request": request, "amount": amount})
+async def payment_page(request: Request, amount: int, project_id: int = 0):
+    return templates.TemplateResponse("payment.html", {"request": request, "amount": amount, "project_id": project_id})
 
 
 
-@router.post("/create-checkout-session")
+@router.post("/create-checkout-session", dependencies=[Depends(ratelimit.limit("checkout"))])
 async def create_checkout_session(
     request: Request,
-    username: str | None = Cookie(default=None),
-    db: Session = Depends(get_db)
+    session: sessions.Session | None = Depends(sessions.current_session),
+    user: CachedUser | None = Depends(user_cache.current_user)
 ):
-    if not username:
+    if not session:
         raise HTTPException(status_code=401, detail="Not authorized")
-
-    user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -417,24 +405,33 @@ async def create_checkout_session(
     if amount < 1:
         raise HTTPException(status_code=400, detail="Invalid amount")
 
-    try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{
-                "price_data": {
-                    "currency": "eur",
-                    "product_data": {"name": "Donate to the project"},
-                    "unit_amount": int(amount * 100),  # Stripe требует целое число в центах
-                },
-                "quantity": 1,
-            }],
-            mode="payment",
-            success_url=f"{YOUR_DOMAIN}/auth/welcome?donation=success",
-            cancel_url=f"{YOUR_DOMAIN}/cancel",
-            customer_email=user.email,
-            client_reference_id=user.id
-        )
+    # Кампания, на которую идёт донат; вебхук прибавит сумму к её прогрессу
+    project_id = data.get("project_id") or 0
+    snapshot = await request.app.state.campaigns.snapshot()
+    metadata = {"campaign_id": str(project_id)} if project_id in snapshot.ids else {}
 
+    stripe = get_stripe()
+    try:
+        # Клиент Stripe синхронный: запрос к API — в потоке, чтобы не стоял event loop
+        with metrics.Timer(metrics.stripe_time, _checkout_create_time):
+            session = await asyncio.to_thread(
+                stripe.checkout.Session.create,
+                payment_method_types=["card"],
+                line_items=[{
+                    "price_data": {
+                        "currency": "eur",
+                        "product_data": {"name": "Donate to the project"},
+                        "unit_amount": int(amount * 100),  # Stripe требует целое число в центах
+                    },
+                    "quantity": 1,
+                }],
+                mode="payment",
+                success_url=f"{YOUR_DOMAIN}/auth/welcome?donation=success",
+                cancel_url=f"{YOUR_DOMAIN}/cancel",
+                customer_email=user.email,
+                client_reference_id=user.id,
+                metadata=metadata,
+            )
 
         return {"url": session.url}
     except Exception as e:
@@ -442,73 +439,31 @@ async def create_checkout_session(
 
 
 
-def update_philanthrop_level(user):
-    amount = user.amount
-
-    # Пороговые суммы для одного цикла уровней
-    thresholds = [50, 90, 150, 250, 350, 450, 550, 650, 750, 850]
-
-    # Определяем, сколько полных циклов пользователь прошёл
-    cycles = 0
-    while amount >= thresholds[-1]:
-        amount -= thresholds[-1]
-        cycles += 1
-
-    # Определяем уровень в текущем цикле
-    level = 0
-    for threshold in thresholds:
-        if amount >= threshold:
-            level += 1
-        else:
-            break
-
-    # Название уровня
-    if cycles == 0:
-        user.philanthrop_level = f"F{level}"
-    else:
-        user.philanthrop_level = f"Elite-{level + (cycles - 1) * 10}"
-
-
 WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_db)):
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
+    stripe = get_stripe()
+    # Подписанные Stripe запросы не ограничиваются; лимит — только на провалившие проверку
     try:
         event = stripe.Webhook.construct_event(payload, sig_header, WEBHOOK_SECRET)
     except ValueError:
+        await ratelimit.check(request, "webhook_invalid")
         raise HTTPException(status_code=400, detail="Invalid payload")
     except stripe.error.SignatureVerificationError:
+        await ratelimit.check(request, "webhook_invalid")
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        customer_email = session.get("customer_details", {}).get("email")
-        amount_total = session.get("amount_total", 0) // 100
-
-    
-
-        if customer_email and amount_total > 0:
-            user_id = session.get("client_reference_id")
-            user = db.query(models.User).filter(models.User.id == user_id).first()
-
-            
-            if user:
-                
-                user.amount += amount_total
-                user.last_donation_time = datetime.utcnow()
-                update_philanthrop_level(user)  # <-- вызов функции обновления уровня
-                db.commit()
-                
+    # Только сохраняем событие — применяют его воркеры из webhook_queue
+    if event["type"] in webhook_queue.HANDLED_EVENTS:
+        if await webhook_queue.store_event(db, event, payload.decode("utf-8")):
+            request.app.state.webhook_worker.notify()
 
     return {"status": "success"}
 
 
-
-
-
-
 @router.get("/cancel", response_class=HTMLResponse)
 async def cancel_page(request: Request):
     return HTMLResponse("<h1>Payment canceled ❌</h1><a href='/auth/welcome'>Back</a>")
@@ -1,26 +1,25 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from database import get_db
-import models
-from routers.auth import validate_csrf_token
+import csrf
+import sessions
 
 router = APIRouter()
 
 @router.get("/api/check-auth")
-def check_auth(request: Request, db: Session = Depends(get_db)):
-    cookie_username = request.cookies.get("username")
-    cookie_token = request.cookies.get("csrf_token")
-
-    if not cookie_username or not cookie_token:
+async def check_auth(request: Request, session: sessions.Session | None = Depends(sessions.current_session)):
+    # Хватает подписанной сессии, база не нужна; отказ — только если сессии нет или она отозвана
+    if not session:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    db_user = db.query(models.User).filter(models.User.username == cookie_username).first()
-    if not db_user:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    content = {"status": "ok", "user": {"username": session.username}}
 
-    # validate_csrf_token должна быть где-то импортирована
-    if not validate_csrf_token(cookie_token):
-        raise HTTPException(status_code=403, detail="Invalid or expired CSRF token")
+    # CSRF-токен живёт час, сессия — дольше: истёкший токен заменяем, а не выходим
+    cookie_token = request.cookies.get(csrf.COOKIE)
+    token = None
+    if not cookie_token or not csrf.validate(cookie_token):
+        token = content["csrf_token"] = csrf.generate()
 
-    return JSONResponse(content={"status": "ok", "user": {"username": db_user.username}})
+    response = JSONResponse(content=content)
+    if token:
+        csrf.set_cookie(response, token)
+    return response
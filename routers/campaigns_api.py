@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Request, Query, Response
+
+router = APIRouter(prefix="/api/campaigns")
+
+# Клиент всегда перепроверяет список, но при неизменном снимке получает 304 без тела
+CACHE_CONTROL = "no-cache"
+
+
+@router.get("")
+async def list_campaigns(request: Request, offset: int = Query(default=0, ge=0), limit: int = Query(default=6, ge=1, le=50)):
+    """Страница активных кампаний `{items, total, offset, next_offset}` с собранными суммами."""
+    snapshot = await request.app.state.campaigns.snapshot()
+    etag, body = snapshot.page(offset, limit)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
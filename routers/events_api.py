@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from redis.exceptions import RedisError
+import asyncio
+import json
+import logging
+import os
+import time
+import events
+import sessions
+import user_cache
+from user_cache import CachedUser
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+
+def _format(event: str, payload: str) -> str:
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def event_stream(hub: events.EventHub, user_id: int | None, expires_at: float | None = None):
+    """Поток событий соединения: снимок топа, затем события из EventHub.
+
+    `user_id=None` — анонимный зритель таблицы лидеров, `expires_at=None` —
+    без срока сессии.
+    """
+    subscription = hub.subscribe(user_id)
+    try:
+        # браузер переподключится через 5 с, если соединение оборвётся
+        yield "retry: 5000\n\n"
+        # снимок читается после подписки: диффы старше него клиент пропустит по версии
+        try:
+            yield _format("leaderboard", json.dumps(await events.top_snapshot(hub.redis)))
+        except RedisError:
+            logger.warning("Leaderboard snapshot unavailable", exc_info=True)
+        while not subscription.overflowed:
+            timeout = HEARTBEAT_SECONDS
+            if expires_at is not None:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield _format("session-expired", "{}")
+                    return
+                timeout = min(timeout, remaining)
+            try:
+                async with asyncio.timeout(timeout):
+                    event, payload = await subscription.queue.get()
+            except asyncio.TimeoutError:
+                # комментарий не даёт прокси закрыть простаивающее соединение
+                yield ": ping\n\n"
+                continue
+            yield _format(event, payload)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.get("/api/events")
+async def stream_events(
+    request: Request,
+    user: CachedUser | None = Depends(user_cache.current_user),
+    session: sessions.Session | None = Depends(sessions.current_session),
+):
+    if not user or not session:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    # поток живёт, пока действует сессия (`session-expired` по её сроку)
+    return StreamingResponse(
+        event_stream(request.app.state.events, user.id, session.expires_at),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
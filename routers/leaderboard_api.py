@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from redis.exceptions import RedisError
+from typing import Literal
+import leaderboard
+from schemas import LeaderboardEntry, LeaderboardRank
+from routers.events_api import event_stream
+
+router = APIRouter(prefix="/api/leaderboard")
+
+# all — за всё время, day/week/month — текущий календарный период (UTC)
+Window = Literal["all", "day", "week", "month"]
+
+
+@router.get("/top", response_model=list[LeaderboardEntry])
+async def top(request: Request, limit: int = Query(default=10, ge=1, le=100), window: Window = "all"):
+    try:
+        return await leaderboard.top(request.app.state.redis, limit, window)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Leaderboard is temporarily unavailable")
+
+
+@router.get("/rank/{username}", response_model=LeaderboardRank)
+async def rank(request: Request, username: str, window: Window = "all"):
+    redis = request.app.state.redis
+    try:
+        user_id = await leaderboard.user_id_by_username(redis, username)
+        result = await leaderboard.standing(redis, user_id, window) if user_id is not None else None
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Leaderboard is temporarily unavailable")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="User is not on the leaderboard")
+    return LeaderboardRank(username=username, rank=result[0], amount=result[1])
+
+
+@router.get("/around/{username}", response_model=list[LeaderboardEntry])
+async def around(request: Request, username: str, radius: int = Query(default=5, ge=0, le=25), window: Window = "all"):
+    redis = request.app.state.redis
+    try:
+        user_id = await leaderboard.user_id_by_username(redis, username)
+        entries = await leaderboard.around(redis, user_id, radius, window) if user_id is not None else []
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Leaderboard is temporarily unavailable")
+
+    if not entries:
+        raise HTTPException(status_code=404, detail="User is not on the leaderboard")
+    return entries
+
+
+@router.get("/stream")
+async def stream(request: Request):
+    """SSE-поток топа за всё время: снимок `leaderboard`, затем `leaderboard-diff`."""
+    return StreamingResponse(
+        event_stream(request.app.state.events, None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
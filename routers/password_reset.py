@@ -1,25 +1,31 @@
 # password_reset.py
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Request
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from fastapi import APIRouter, HTTPException, Depends, Request
 from jose import jwt, JWTError, ExpiredSignatureError
+from redis.exceptions import RedisError
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
+import mailer
 import models
-from passlib.context import CryptContext
-from fastapi.templating import Jinja2Templates
+import passwords
+import ratelimit
+import reset_tokens
+import sessions
+import user_cache
+import templating
+from templating import templates
 from fastapi.responses import HTMLResponse
-from fastapi_limiter.depends import RateLimiter
+import logging
 import time
 import os
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # --- Pydantic модели ---
 class ForgotPasswordRequest(BaseModel):
@@ -29,26 +35,10 @@ class ResetPasswordRequest(BaseModel):
     token: str
     new_password: str
 
-# --- Конфиг для почты ---
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USER"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_FROM"),
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True
-)
-
-# --- Хэширование пароля ---
-def hash_password(password: str):
-    return pwd_context.hash(password)
-
 # --- HTML формы ---
 @router.get("/forgot-password", response_class=HTMLResponse)
 async def forgot_password_form(request: Request):
-    return templates.TemplateResponse("forgot_password.html", {"request": request})
+    return templating.render_static("forgot_password.html")
 
 from typing import Optional
 
@@ -73,57 +63,81 @@ async def reset_password_form(request: Request, token: Optional[str] = None):
             {"request": request, "error": "Token is invalid"}
         )
 
+    # Ссылку уже использовали — не показываем форму, которую всё равно отклонят
+    try:
+        active = bool(payload.get("jti")) and await reset_tokens.is_active(request.app.state.redis, payload["jti"])
+    except RedisError:
+        logger.warning("Reset token registry unavailable in Redis", exc_info=True)
+        active = True
+    if not active:
+        return templates.TemplateResponse(
+            "reset_password.html",
+            {"request": request, "error": "Token has already been used"}
+        )
+
     return templates.TemplateResponse("reset_password.html", {"request": request, "token": token})
 
 
 # --- API ---
 @router.post(
     "/forgot-password",
-    dependencies=[Depends(RateLimiter(times=3, seconds=3600))]  # до 3 запросов в час с одного IP
+    dependencies=[Depends(ratelimit.limit("forgot_password"))]  # до 3 запросов в час с одного IP и на один email
 )
 async def forgot_password(
     request_data: ForgotPasswordRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
     email = request_data.email.strip().lower()
-    now = int(time.time())
+    redis = request.app.state.redis
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    # Антиспам: не чаще раза в 10 минут на адрес, до запроса в базу и для любых адресов
+    try:
+        retry_after = await reset_tokens.start_cooldown(redis, email)
+    except RedisError:
+        logger.error("Reset cooldown unavailable in Redis", exc_info=True)
+        raise HTTPException(status_code=503, detail="Password recovery is temporarily unavailable")
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please try again later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    user = await db.scalar(select(models.User).where(models.User.email == email))
 
     # Даже если пользователя нет — не раскрываем
     if not user:
         return {"message": "If an account with this email exists, a recovery link has been sent to it"}
 
-    # Антиспам: не чаще 10 минут
-    if getattr(user, "last_reset_request", None) and now - int(user.last_reset_request) < 600:
-        raise HTTPException(status_code=429, detail="Too many requests. Please try again later.")
-
-    # Генерация токена
+    # Генерация токена; jti регистрируется в Redis и гасится при использовании
+    jti = reset_tokens.new_token_id()
+    ttl = reset_tokens.TOKEN_TTL
     token = jwt.encode(
-        {"sub": user.email, "exp": datetime.utcnow() + timedelta(hours=1)},
+        {"sub": user.email, "jti": jti, "exp": datetime.utcnow() + timedelta(seconds=ttl)},
         SECRET_KEY,
         algorithm=ALGORITHM
     )
+    try:
+        await reset_tokens.register(redis, jti, user.email, ttl)
+    except RedisError:
+        logger.error("Failed to register reset token in Redis", exc_info=True)
+        raise HTTPException(status_code=503, detail="Password recovery is temporarily unavailable")
     reset_link = f"{os.getenv('YOUR_DOMAIN', 'https://top-donators1.onrender.com')}/auth/reset-password?token={token}"
 
-    message = MessageSchema(
-        subject="Password recovery",
-        recipients=[user.email],
-        body=f"To reset your password, follow this link:\n{reset_link}",
-        subtype="plain"
+    message = mailer.text_message(
+        user.email,
+        "Password recovery",
+        f"To reset your password, follow this link:\n{reset_link}",
     )
-    fm = FastMail(conf)
-    background_tasks.add_task(fm.send_message, message)
 
-    # Сохраняем время последнего запроса
-    user.last_reset_request = now
-    db.commit()
+    await mailer.enqueue(db, message)
+    request.app.state.mail_worker.notify()
 
     return {"message": "If an account with this email exists, a recovery link has been sent to it"}
 
 @router.post("/reset-password")
-async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_db)):
+async def reset_password(data: ResetPasswordRequest, request: Request, db: AsyncSession = Depends(get_db)):
     try:
         payload = jwt.decode(data.token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
@@ -131,11 +145,40 @@ async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_d
         raise HTTPException(status_code=400, detail="Token has expired")
     except JWTError:
         raise HTTPException(status_code=400, detail="Token is invalid")
+    jti = payload.get("jti")
+    if not jti:
+        raise HTTPException(status_code=400, detail="Token is invalid")
 
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Одноразовость: токен гасится атомарно, повторный JWT отклоняется без базы
+    redis = request.app.state.redis
+    try:
+        registered_email = await reset_tokens.consume(redis, jti)
+    except RedisError:
+        logger.error("Reset token registry unavailable in Redis", exc_info=True)
+        raise HTTPException(status_code=503, detail="Password recovery is temporarily unavailable")
+    if registered_email != email:
+        raise HTTPException(status_code=400, detail="Token has already been used")
 
-    user.hashed_password = hash_password(data.new_password)
-    db.commit()
+    try:
+        user = await db.scalar(select(models.User).where(models.User.email == email))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user.hashed_password = await passwords.hash_password(data.new_password)
+        # Сессии, открытые со старым паролем, больше не действуют; без отзыва пароль не меняем
+        try:
+            await sessions.revoke_user(redis, user.id)
+        except RedisError:
+            logger.error("Failed to revoke sessions of user %s", user.id, exc_info=True)
+            raise HTTPException(status_code=503, detail="Password recovery is temporarily unavailable")
+        await db.commit()
+    except Exception:
+        # пароль не сменился (например, пул bcrypt занят) — ссылка остаётся рабочей до своего срока
+        remaining = int(payload["exp"] - time.time())
+        if remaining > 0:
+            try:
+                await reset_tokens.restore(redis, jti, email, remaining)
+            except RedisError:
+                logger.warning("Failed to restore reset token %s", jti, exc_info=True)
+        raise
+    await user_cache.invalidate(redis, user.username)
     return {"message": "Password changed successfully"}
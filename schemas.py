@@ -1,4 +1,6 @@
 from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from typing import Optional
 
 class UserBase(BaseModel):
     username: str
@@ -18,3 +20,16 @@ class UserRead(BaseModel):
 class UserLogin(BaseModel):
     username: str
     password: str
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    username: str
+    amount: float
+    avatar: Optional[str] = None
+    philanthrop_level: str = ""
+    last_donation_time: Optional[datetime] = None
+
+class LeaderboardRank(BaseModel):
+    username: str
+    rank: int
+    amount: float
@@ -0,0 +1,182 @@
+"""Сессия в подписанной cookie `session` без обращения к базе.
+
+Токен — `kid.payload.signature`:
+- `payload` — base64url компактного JSON: id, username и уровень
+  пользователя, время выдачи, срок и id сессии;
+- `signature` — HMAC-SHA256 от `kid.payload` ключом `kid`, так что id
+  ключа тоже подписан и его нельзя подменить.
+
+Проверка — split, один HMAC и json.loads, единицы микросекунд. Страницам,
+которым хватает id и имени (/api/check-auth), база и кэш пользователей не
+нужны; остальные берут пользователя из user_cache по имени из токена.
+
+Ключи — SESSION_KEYS=`kid:secret,kid:secret`: первым подписываются новые
+сессии, остальные только принимаются. Ротация: добавить новый ключ
+первым, старый убрать не раньше чем через SESSION_TTL.
+
+Отзыв — в Redis, ключи живут не дольше самих токенов:
+- `session:revoked:{sid}` — одна сессия (выход);
+- `session:not_before:{user_id}` — все сессии пользователя, выданные
+  раньше этого времени (сброс и смена пароля).
+Оба проверяются одним MGET. Если Redis недоступен, подписанный токен
+принимается до истечения срока, а смена и сброс пароля, не записавшие
+границу, отвечают 503 и ничего не меняют.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass
+
+from fastapi import Request
+from fastapi.responses import Response
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+COOKIE = "session"
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+REVOKED_KEY = "session:revoked:{}"
+NOT_BEFORE_KEY = "session:not_before:{}"
+
+# KEYS[1] — граница пользователя; ARGV — текущее время, срок ключа.
+# max и запись — одним шагом: параллельный отзыв не опустит уже выданную границу
+RAISE_NOT_BEFORE = """
+local not_before = math.max(tonumber(ARGV[1]), tonumber(redis.call('GET', KEYS[1]) or '0')) + 1
+redis.call('SET', KEYS[1], not_before, 'EX', ARGV[2])
+return not_before
+"""
+
+
+def _load_keys(raw: str) -> dict[str, bytes]:
+    keys = {}
+    for item in raw.split(","):
+        kid, sep, secret = item.strip().partition(":")
+        if not sep or not kid or not secret or "." in kid:
+            raise ValueError(f"Invalid SESSION_KEYS entry: {item.strip()!r}, expected kid:secret")
+        keys[kid] = secret.encode()
+    return keys
+
+
+KEYS = _load_keys(os.getenv("SESSION_KEYS") or "dev:" + os.getenv("CSRF_SECRET", "dev-secret"))
+CURRENT_KID = next(iter(KEYS))
+
+# HMAC с уже применённым ключом: на токен остаётся copy() и update()
+_macs = {kid: hmac.new(key, digestmod=hashlib.sha256) for kid, key in KEYS.items()}
+
+
+@dataclass(frozen=True)
+class Session:
+    user_id: int
+    username: str
+    level: str
+    issued_at: int
+    expires_at: int
+    sid: str
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(kid: str, signed: str) -> str:
+    mac = _macs[kid].copy()
+    mac.update(signed.encode())
+    return _b64encode(mac.digest())
+
+
+# --- Выдача и проверка ---
+def issue(user, ttl: int = SESSION_TTL, issued_at: int | None = None) -> tuple[str, Session]:
+    """Новый токен для пользователя (models.User или CachedUser)."""
+    now = int(time.time())
+    issued_at = max(now, issued_at or 0)
+    session = Session(user.id, user.username, user.philanthrop_level, issued_at, now + ttl, secrets.token_urlsafe(12))
+    payload = _b64encode(json.dumps(
+        {"uid": session.user_id, "u": session.username, "lvl": session.level,
+         "iat": session.issued_at, "exp": session.expires_at, "sid": session.sid},
+        separators=(",", ":"),
+    ).encode())
+    signed = f"{CURRENT_KID}.{payload}"
+    return f"{signed}.{_sign(CURRENT_KID, signed)}", session
+
+
+def verify(token: str) -> Session | None:
+    """Сессия из токена, если подпись верна и срок не вышел; отзыв не проверяет."""
+    signed, _, signature = token.rpartition(".")
+    kid, _, payload = signed.partition(".")
+    if kid not in _macs or not payload:
+        return None
+    if not hmac.compare_digest(signature, _sign(kid, signed)):
+        return None
+    try:
+        data = json.loads(_b64decode(payload))
+        session = Session(data["uid"], data["u"], data["lvl"], data["iat"], data["exp"], data["sid"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    if session.expires_at <= time.time():
+        return None
+    return session
+
+
+async def is_revoked(redis: Redis | None, session: Session) -> bool:
+    if redis is None:
+        return False
+    try:
+        revoked, not_before = await redis.mget(
+            REVOKED_KEY.format(session.sid), NOT_BEFORE_KEY.format(session.user_id)
+        )
+    except RedisError:
+        logger.warning("Session revocation list unavailable in Redis", exc_info=True)
+        return False
+    return revoked is not None or (not_before is not None and session.issued_at < int(not_before))
+
+
+async def current_session(request: Request) -> Session | None:
+    """Зависимость: действующая сессия из cookie или None."""
+    token = request.cookies.get(COOKIE)
+    if not token:
+        return None
+    session = verify(token)
+    if session is None or await is_revoked(getattr(request.app.state, "redis", None), session):
+        return None
+    return session
+
+
+# --- Cookie ---
+def set_cookie(response: Response, user, issued_at: int | None = None) -> Session:
+    token, session = issue(user, issued_at=issued_at)
+    response.set_cookie(COOKIE, token, max_age=SESSION_TTL, path="/", httponly=True, samesite="lax", secure=True)
+    return session
+
+
+def delete_cookie(response: Response) -> None:
+    response.delete_cookie(COOKIE, path="/")
+
+
+# --- Отзыв ---
+async def revoke(redis: Redis, session: Session) -> None:
+    """Отзывает одну сессию (выход)."""
+    ttl = session.expires_at - int(time.time())
+    if ttl > 0:
+        await redis.set(REVOKED_KEY.format(session.sid), 1, ex=ttl)
+
+
+async def revoke_user(redis: Redis, user_id: int) -> int:
+    """Отзывает все сессии пользователя, выданные до этого момента.
+
+    Возвращает границу: токен, выданный с `issued_at` не меньше неё
+    (`set_cookie(..., issued_at=...)`), действует. Граница — следующая
+    секунда, чтобы отозвать и токены, выданные в текущую, и не меньше
+    прошлой границы + 1: токен, выданный по ней, тоже отзывается.
+    """
+    return int(await redis.eval(RAISE_NOT_BEFORE, 1, NOT_BEFORE_KEY.format(user_id), int(time.time()), SESSION_TTL + 1))
@@ -78,55 +78,155 @@ if (document.getElementById("fireworks")) {
   window.addEventListener('resize', () => { canvas.width = window.innerWidth; canvas.height = window.innerHeight; });
 }
 
-// === Ads Loader ===
+// === Campaigns ===
+// Кампании приходят с сервера постранично вместе с собранными суммами
 const adsContainer = document.getElementById("ads-section");
-if (adsContainer) {
-  fetch('/static/ads.json')
-    .then(r => r.json())
-    .then(ads => {
-      ads.forEach((ad, index) => {
-        const card = document.createElement("div");
-        card.classList.add("ad-card");
-        card.innerHTML = `
-        <div class="ad-card-inner">
-          <div class="ad-card-front">
-            <img src="${ad.image}" class="ad-image" alt="Ad Image" />
-            <div class="ad-description">${ad.description}</div>
-          </div>
-          <div class="ad-card-back" style="background:white;color:black;padding:20px;">
-            <h3>${ad.title || 'Объявление'}</h3>
-            <p>${ad.text || 'Подробности отсутствуют.'}</p>
-            <input type="number" id="donate-amount-${index}" placeholder="Сумма" min="1"/>
-            <button onclick="makeDonation(${index})">Donate</button>
-          </div>
-        </div>`;
-        card.addEventListener("click", e => {
-          if (!e.target.closest("button") && !e.target.closest("input")) card.classList.toggle("flipped");
-        });
-        adsContainer.appendChild(card);
-      });
-    })
-    .catch(err => console.error('Error loading ads:', err));
+const CAMPAIGNS_PAGE = 6;
+
+function campaignCard(campaign) {
+  const card = document.createElement("div");
+  card.classList.add("ad-card");
+  const progress = campaign.goal
+    ? `<div class="campaign-progress"><div class="campaign-progress-bar" style="width:${Math.min(100, campaign.raised / campaign.goal * 100)}%"></div></div>
+       <div class="campaign-raised">€${escapeHtml(campaign.raised)} / €${escapeHtml(campaign.goal)}</div>`
+    : `<div class="campaign-raised">€${escapeHtml(campaign.raised)} raised</div>`;
+  card.innerHTML = `
+  <div class="ad-card-inner">
+    <div class="ad-card-front">
+      <img src="${escapeHtml(campaign.image || '')}" class="ad-image" alt="Ad Image" loading="lazy" />
+      <div class="ad-description">${escapeHtml(campaign.description)}</div>
+    </div>
+    <div class="ad-card-back" style="background:white;color:black;padding:20px;">
+      <h3>${escapeHtml(campaign.title || 'Объявление')}</h3>
+      <p>${escapeHtml(campaign.text || 'Подробности отсутствуют.')}</p>
+      ${progress}
+      <input type="number" id="donate-amount-${campaign.id}" placeholder="Сумма" min="1"/>
+      <button onclick="makeDonation(${campaign.id})">Donate</button>
+    </div>
+  </div>`;
+  card.addEventListener("click", e => {
+    if (!e.target.closest("button") && !e.target.closest("input")) card.classList.toggle("flipped");
+  });
+  return card;
+}
+
+async function loadCampaigns(offset) {
+  try {
+    const r = await fetch(`/api/campaigns?offset=${offset}&limit=${CAMPAIGNS_PAGE}`);
+    if (!r.ok) throw new Error(r.status);
+    const page = await r.json();
+    page.items.forEach(campaign => adsContainer.appendChild(campaignCard(campaign)));
+    document.getElementById("ads-more")?.remove();
+    if (page.next_offset !== null) {
+      const more = document.createElement("button");
+      more.id = "ads-more";
+      more.className = "ads-more";
+      more.textContent = "Show more";
+      more.addEventListener("click", () => loadCampaigns(page.next_offset));
+      adsContainer.after(more);
+    }
+  } catch (err) { console.error('Error loading campaigns:', err); }
 }
 
-function makeDonation(index) {
-  const amountInput = document.getElementById(`donate-amount-${index}`);
+if (adsContainer) loadCampaigns(0);
+
+function makeDonation(campaignId) {
+  const amountInput = document.getElementById(`donate-amount-${campaignId}`);
   if (!amountInput || amountInput.value <= 0) { alert("Enter a valid amount"); return; }
-  window.location.href = `/auth/payment?amount=${encodeURIComponent(amountInput.value)}`;
+  window.location.href = `/auth/payment?amount=${encodeURIComponent(amountInput.value)}&project_id=${campaignId}`;
 }
 
 // === Auth check ===
 async function checkAuth() {
   try {
     const r = await fetch('/api/check-auth', { method: 'GET', credentials: 'include' });
-    if (!r.ok) {
-      const data = await r.json();
-      if (data.detail === "Not authorized") window.location.href = "/";
-    }
-  } catch (err) { console.error('Authorization check error', err); }
+    if (r.status === 401) { window.location.href = "/"; return false; }
+    if (!r.ok) return false;
+    // сессия действует, а CSRF-токен истёк — сервер выдал новый, обновляем формы
+    const data = await r.json();
+    if (data.csrf_token) document.querySelectorAll('input[name="csrf_token"]').forEach(input => { input.value = data.csrf_token; });
+    return true;
+  } catch (err) { console.error('Authorization check error', err); return false; }
+}
+
+// === Live updates (SSE) ===
+// Одно соединение вместо опроса /api/check-auth: сервер сам сообщает об
+// окончании сессии, изменениях топа и зачислении доната.
+function escapeHtml(value) {
+  const div = document.createElement('div');
+  div.textContent = value == null ? '' : String(value);
+  return div.innerHTML;
+}
+
+// Как avatars.avatar_url: у новых аватаров есть рендиции, старые — исходным файлом
+function avatarSrc(avatar) {
+  if (!avatar) return '/static/default-avatar.png';
+  return avatar.includes('.') ? `/static/avatars/${encodeURIComponent(avatar)}` : `/static/avatars/${avatar}-64.webp`;
+}
+
+function renderTop(top) {
+  const tbody = document.querySelector('#top-table tbody');
+  if (!tbody) return;
+  tbody.innerHTML = top.map(user => `
+    <tr>
+      <td>
+        <span class="${user.rank <= 3 ? 'rank' : 'rank-normal'}">${user.rank}</span>
+        <img class="avatar-small" src="${avatarSrc(user.avatar)}" alt="Avatar" />
+        ${escapeHtml(user.username)}
+        <span class="philanthrop-level">${escapeHtml(user.philanthrop_level)}</span>
+      </td>
+      <td>${user.amount}</td>
+      <td>${user.last_donation_time ? escapeHtml(user.last_donation_time.slice(0, 16).replace('T', ' ')) : '—'}</td>
+    </tr>`).join('');
+}
+
+function showRank(rank) {
+  if (!rank) return;
+  let line = document.querySelector('.your-rank');
+  if (!line) {
+    line = document.createElement('p');
+    line.className = 'your-rank';
+    document.querySelector('.container h1').after(line);
+  }
+  line.textContent = `Your place: #${rank}`;
+}
+
+// Топ приходит снимком при подключении, дальше — только диффы с номером версии
+let leaderboard = { version: 0, top: [] };
+
+function applyTopDiff(diff) {
+  if (diff.version <= leaderboard.version) return true;  // уже учтён в снимке
+  if (diff.base !== leaderboard.version) return false;    // пропустили дифф — нужен новый снимок
+  const rows = new Map(leaderboard.top.map(user => [user.username, user]));
+  diff.remove.forEach(username => rows.delete(username));
+  Object.entries(diff.moves).forEach(([username, rank]) => { rows.get(username).rank = rank; });
+  diff.set.forEach(user => rows.set(user.username, user));
+  leaderboard = { version: diff.version, top: [...rows.values()].sort((a, b) => a.rank - b.rank) };
+  renderTop(leaderboard.top);
+  return true;
+}
+
+function connectEvents() {
+  const source = new EventSource('/api/events', { withCredentials: true });
+  source.addEventListener('leaderboard', e => {
+    leaderboard = JSON.parse(e.data);
+    renderTop(leaderboard.top);
+  });
+  source.addEventListener('leaderboard-diff', e => {
+    if (!applyTopDiff(JSON.parse(e.data))) { source.close(); connectEvents(); }
+  });
+  source.addEventListener('donation-credited', e => showRank(JSON.parse(e.data).rank));
+  source.addEventListener('session-expired', async () => {
+    source.close();
+    // cookie могла обновиться в другой вкладке — тогда просто переподключаемся
+    if (await checkAuth()) connectEvents();
+  });
+  source.onerror = async () => {
+    // на 401 EventSource не переподключается сам
+    if (source.readyState === EventSource.CLOSED && await checkAuth()) setTimeout(connectEvents, 5000);
+  };
 }
-setInterval(checkAuth, 5000);
-document.addEventListener('visibilitychange', () => { if (!document.hidden) checkAuth(); });
+if (document.getElementById('top-table')) connectEvents();
 
 // === Auto resize textarea ===
 function autoResizeTextarea(el) {
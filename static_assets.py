@@ -0,0 +1,264 @@
+"""Статика: отпечатки в именах, предсжатые копии и долгий кэш.
+
+Сборка (при сборке образа, см. Dockerfile):
+
+    python static_assets.py build
+
+копирует файлы из static/ в static/build/ под именами с хэшем содержимого
+(`css/welcome.css` -> `css/welcome.3f9a1c2b7d.css`), кладёт рядом с
+текстовыми файлами `.gz` и `.br` (brotli — если установлен пакет brotli)
+и пишет static/build/manifest.json: исходный путь -> путь с хэшем. Ссылки
+`/static/...` внутри css/js/json переписываются на хэшированные, поэтому
+изменение картинки меняет и хэш ссылающегося на неё ads.json. Аватары
+(static/avatars) не обрабатываются: они уже названы по хэшу и пишутся во
+время работы.
+
+В шаблонах URL берётся через `static_url("css/welcome.css")`; без
+манифеста (разработка без сборки) это просто `/static/css/welcome.css`.
+
+`AssetStaticFiles` отдаёт:
+- файлы из build/ и рендиции аватаров с `Cache-Control: public,
+  max-age=31536000, immutable`, остальные — с `no-cache` (браузер перепроверяет по ETag и получает 304);
+- предсжатую копию по Accept-Encoding (br, затем gzip) с Vary;
+- один диапазон байтов по Range (206, 416), с учётом If-Range.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import stat
+import sys
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: тогда только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = "static"
+STATIC_URL = "/static"
+BUILD_DIR = "build"
+MANIFEST = os.path.join(STATIC_DIR, BUILD_DIR, "manifest.json")
+SKIP_DIRS = {BUILD_DIR, "avatars"}
+
+COMPRESSIBLE = {".css", ".js", ".json", ".svg", ".html", ".txt"}
+# Текстовые файлы обрабатываются после остальных и в этом порядке: так
+# ссылки в них уже указывают на хэшированные картинки и друг на друга
+REWRITE_ORDER = (".json", ".css", ".js")
+ASSET_REF = re.compile(re.escape(STATIC_URL) + r"/([\w./-]+)")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# рендиции аватаров тоже названы по хэшу содержимого (avatars.py)
+IMMUTABLE_PATHS = re.compile(rf"^(?:{BUILD_DIR}/|avatars/[0-9a-f]{{32}}-\d+\.\w+$)")
+REVALIDATE = "no-cache"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+CHUNK_SIZE = 64 * 1024
+
+_manifest: dict[str, str] | None = None
+
+
+# --- URL в шаблонах ---
+def load_manifest() -> dict[str, str]:
+    global _manifest
+    try:
+        with open(MANIFEST) as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def static_url(path: str) -> str:
+    """URL файла из static/: хэшированный, если статика собрана."""
+    manifest = _manifest if _manifest is not None else load_manifest()
+    path = path.lstrip("/")
+    return f"{STATIC_URL}/{manifest.get(path, path)}"
+
+
+# --- Сборка ---
+def _fingerprint(path: str, data: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build(static_dir: str = STATIC_DIR) -> dict[str, str]:
+    out_dir = os.path.join(static_dir, BUILD_DIR)
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not (root == static_dir and d in SKIP_DIRS))
+        for name in sorted(files):
+            sources.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+
+    def order(path: str):
+        ext = os.path.splitext(path)[1]
+        return (REWRITE_ORDER.index(ext) + 1 if ext in REWRITE_ORDER else 0, path)
+
+    manifest = {}
+    for path in sorted(sources, key=order):
+        with open(os.path.join(static_dir, path), "rb") as f:
+            data = f.read()
+        ext = os.path.splitext(path)[1]
+        if ext in REWRITE_ORDER:
+            text = ASSET_REF.sub(
+                lambda m: f"{STATIC_URL}/{manifest.get(m.group(1), m.group(1))}",
+                data.decode("utf-8"),
+            )
+            data = text.encode("utf-8")
+        hashed = _fingerprint(path, data)
+        target = os.path.join(out_dir, hashed)
+        _write(target, data)
+        if ext in COMPRESSIBLE:
+            _write(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(target + ".br", brotli.compress(data, quality=11))
+        manifest[path] = f"{BUILD_DIR}/{hashed}"
+
+    _write(os.path.join(out_dir, "manifest.json"), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    if brotli is None:
+        logger.warning("brotli is not installed, only gzip copies were written")
+    return manifest
+
+
+# --- Отдача ---
+def _parse_range(value: str, size: int) -> tuple[int, int] | None:
+    """Один диапазон `bytes=a-b` -> (start, end) включительно; None — отдать целиком.
+
+    Бросает ValueError для диапазона за пределами файла.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        if not start:
+            # последние N байт
+            length = int(end)
+            if length <= 0:
+                raise ValueError(value)
+            return max(size - length, 0), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if first >= size or last < first:
+        raise ValueError(value)
+    return first, min(last, size - 1)
+
+
+async def _read_range(path: str, start: int, end: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class AssetStaticFiles(StaticFiles):
+    def _cache_control(self, path: str) -> str:
+        return IMMUTABLE if IMMUTABLE_PATHS.match(path) else REVALIDATE
+
+    async def _compressed(self, full_path: str, request_headers: Headers):
+        accepted = {
+            token.split(";")[0].strip()
+            for token in request_headers.get("accept-encoding", "").split(",")
+        }
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                try:
+                    stat_result = await anyio.to_thread.run_sync(os.stat, full_path + suffix)
+                except FileNotFoundError:
+                    continue
+                if stat.S_ISREG(stat_result.st_mode):
+                    return encoding, full_path + suffix, stat_result
+        return None
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        cache_control = self._cache_control(path)
+        compressible = os.path.splitext(path)[1] in COMPRESSIBLE
+        if response.status_code == 304:
+            # совпал ETag несжатого файла; заголовки кэша нужны и в 304
+            response.headers["Cache-Control"] = cache_control
+            if compressible:
+                response.headers["Vary"] = "Accept-Encoding"
+            return response
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        request_headers = Headers(scope=scope)
+        full_path = response.path
+
+        if "range" in request_headers and scope["method"] == "GET":
+            # диапазоны — только по несжатому представлению
+            ranged = self._range_response(response, request_headers, cache_control)
+            if ranged is not None:
+                return ranged
+
+        variant = await self._compressed(full_path, request_headers) if compressible else None
+        if variant is not None:
+            encoding, variant_path, stat_result = variant
+            response = FileResponse(variant_path, stat_result=stat_result, media_type=response.media_type)
+            response.headers["Content-Encoding"] = encoding
+            if self.is_not_modified(response.headers, request_headers):
+                response = Response(status_code=304, headers={"ETag": response.headers["etag"]})
+        if compressible:
+            response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = cache_control
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
+
+    def _range_response(self, response: FileResponse, request_headers: Headers, cache_control: str) -> Response | None:
+        if_range = request_headers.get("if-range")
+        if if_range and if_range != response.headers["etag"] and if_range != response.headers["last-modified"]:
+            return None
+        size = int(response.headers["content-length"])
+        try:
+            byte_range = _parse_range(request_headers["range"], size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is None:
+            return None
+        start, end = byte_range
+        return StreamingResponse(
+            _read_range(response.path, start, end),
+            status_code=206,
+            media_type=response.media_type,
+            headers={
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+                "Accept-Ranges": "bytes",
+                "ETag": response.headers["etag"],
+                "Last-Modified": response.headers["last-modified"],
+                "Cache-Control": cache_control,
+            },
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if sys.argv[1:] != ["build"]:
+        print("usage: python static_assets.py build")
+        sys.exit(2)
+    manifest = build()
+    logger.info("Built %s static assets into %s", len(manifest), os.path.join(STATIC_DIR, BUILD_DIR))
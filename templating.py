@@ -0,0 +1,63 @@
+"""Общее окружение Jinja2 и предрендеренные страницы.
+
+Все роутеры берут `templates` отсюда, а не создают своё окружение: шаблоны
+компилируются один раз на процесс, а скомпилированный байткод кладётся в
+FileSystemBytecodeCache (TEMPLATE_CACHE_DIR, по умолчанию во временном
+каталоге), так что следующий запуск и другие воркеры не разбирают шаблоны
+заново. Проверка mtime файлов на каждом рендере отключена; для правки
+шаблонов без перезапуска есть TEMPLATES_AUTO_RELOAD=True.
+
+Страницы, у которых от запроса зависит только CSRF-токен (вход,
+регистрация, главная), рендерятся один раз с меткой вместо токена и дальше
+собираются склейкой кусков — см. `render_static`.
+"""
+import os
+import uuid
+
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import escape
+
+import avatars
+import static_assets
+
+TEMPLATE_DIR = "templates"
+CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or None
+AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "False") == "True"
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,
+    auto_reload=AUTO_RELOAD,
+    bytecode_cache=FileSystemBytecodeCache(CACHE_DIR),
+)
+env.globals["avatar_url"] = avatars.avatar_url
+env.globals["static_url"] = static_assets.static_url
+templates = Jinja2Templates(env=env)
+
+# --- Предрендеренные страницы ---
+# Метка не содержит символов, которые экранирует autoescape
+_CSRF_SLOT = f"csrf-slot-{uuid.uuid4().hex}"
+_pages: dict[str, list[str]] = {}
+
+STATIC_PAGES = ("index.html", "login.html", "register.html", "forgot_password.html", "send_ad.html")
+
+
+def _prerender(name: str) -> list[str]:
+    # страница не должна зависеть от request: рендер идёт без него
+    return env.get_template(name).render(csrf_token=_CSRF_SLOT).split(_CSRF_SLOT)
+
+
+def render_static(name: str, csrf_token: str = "", status_code: int = 200) -> HTMLResponse:
+    """HTML страницы, зависящей от запроса только CSRF-токеном."""
+    parts = _pages.get(name)
+    if parts is None or AUTO_RELOAD:
+        parts = _pages[name] = _prerender(name)
+    return HTMLResponse(str(escape(csrf_token)).join(parts), status_code=status_code)
+
+
+def warm(names=STATIC_PAGES) -> None:
+    """Рендерит страницы заранее, при старте, а не на первом запросе."""
+    for name in names:
+        _pages[name] = _prerender(name)
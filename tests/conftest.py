@@ -0,0 +1,33 @@
+"""Общие фикстуры: база SQLite во временном файле и fakeredis вместо Redis."""
+import os
+
+# database.py читает DATABASE_URL при импорте; рабочая база в тестах не нужна
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+import fakeredis
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import database
+import models  # noqa: F401  регистрирует таблицы в Base.metadata
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+async def redis():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    yield client
+    await client.aclose()
@@ -0,0 +1,52 @@
+import hashlib
+import io
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import avatars
+import models
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"\0" * 100
+NAME = hashlib.sha256(IMAGE).hexdigest()[:32]
+
+
+@pytest.fixture
+def avatar_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_DIR", str(tmp_path))
+    # рендиции уже есть: загрузка той же картинки идёт по короткому пути, без PIL
+    for path in avatars._rendition_paths(NAME):
+        open(path, "wb").close()
+    return tmp_path
+
+
+def rendered() -> bool:
+    return all(os.path.exists(path) for path in avatars._rendition_paths(NAME))
+
+
+async def test_removal_waits_for_upload_commit(avatar_dir, redis, session_factory):
+    # у A этот аватар уже заменён, а B как раз загружает ту же картинку
+    async with session_factory() as db:
+        bob = models.User(username="bob", email="bob@example.com", hashed_password="x")
+        db.add(bob)
+        await db.commit()
+
+        async with avatars.save_upload(redis, UploadFile(io.BytesIO(IMAGE), filename="a.png")) as name:
+            assert name == NAME
+            async with session_factory() as other:
+                assert not await avatars.remove_unused(redis, other, NAME)
+            bob.avatar = name
+            await db.commit()
+
+    async with session_factory() as db:
+        assert not await avatars.remove_unused(redis, db, NAME)
+    assert rendered()
+
+
+async def test_unreferenced_avatar_removed(avatar_dir, redis, session_factory):
+    async with session_factory() as db:
+        assert await avatars.remove_unused(redis, db, NAME)
+    assert not rendered()
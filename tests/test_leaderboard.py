@@ -0,0 +1,37 @@
+"""Запись в таблицу лидеров: вебхук и профиль пишут каждый своё."""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import leaderboard
+
+pytestmark = pytest.mark.anyio
+
+
+def donor(amount: float, username: str = "alice", level: str = "F1") -> SimpleNamespace:
+    return SimpleNamespace(
+        id=1, username=username, avatar=None, amount=amount,
+        philanthrop_level=level, last_donation_time=datetime.utcnow(),
+    )
+
+
+async def test_late_batch_does_not_lower_totals(redis):
+    at = datetime.utcnow()
+    await leaderboard.sync_user(redis, donor(150), window_totals={"day": 150}, at=at)
+    # более ранняя пачка того же пользователя дошла до Redis позже
+    await leaderboard.sync_user(redis, donor(100), window_totals={"day": 100}, at=at)
+
+    assert await redis.zscore(leaderboard.BOARD_KEY, "1") == 150
+    assert await redis.zscore(leaderboard.board_key("day", at), "1") == 150
+
+
+async def test_webhook_snapshot_does_not_undo_rename(redis):
+    await leaderboard.sync_user(redis, donor(100))
+    await leaderboard.sync_profile(redis, donor(100, username="bob"), old_username="alice")
+    # воркер прочитал пользователя до смены имени
+    await leaderboard.sync_user(redis, donor(120, username="alice"))
+
+    assert await redis.hgetall(leaderboard.USERNAMES_KEY) == {"bob": "1"}
+    assert (await leaderboard.top(redis))[0].username == "bob"
+    assert (await leaderboard.top(redis))[0].amount == 120
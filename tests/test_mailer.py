@@ -0,0 +1,153 @@
+"""Очередь писем против локального SMTP-сервера (aiosmtpd на свободном порту)."""
+import socket
+from datetime import datetime
+
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import select
+
+import mailer
+import models
+
+pytestmark = pytest.mark.anyio
+
+
+class Recorder:
+    """Принимает письма; адреса bounce@ отвергаются навсегда (550), later@ — временно (451)."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce@"):
+            return "550 5.1.1 No such user"
+        if address.startswith("later@"):
+            return "451 4.3.0 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session.peer, envelope.rcpt_tos))
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class SmtpServer:
+    def __init__(self):
+        self.recorder = Recorder()
+        self.port = free_port()
+        self.controller = None
+
+    def start(self):
+        self.controller = Controller(self.recorder, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+
+    def stop(self):
+        # остановка закрывает и открытые клиентами соединения
+        if self.controller is not None:
+            self.controller.stop()
+            self.controller = None
+
+    @property
+    def recipients(self) -> list[list[str]]:
+        return [rcpt for _, rcpt in self.recorder.messages]
+
+
+@pytest.fixture
+def smtp_server():
+    server = SmtpServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def connection(port: int) -> mailer.SmtpConnection:
+    return mailer.SmtpConnection("127.0.0.1", port, username=None, use_tls=False, start_tls=False)
+
+
+async def enqueue(session_factory, *recipients: str) -> list[int]:
+    async with session_factory() as db:
+        return [
+            await mailer.enqueue(db, mailer.text_message(recipient, "Hello", "Body"), sender="noreply@example.com")
+            for recipient in recipients
+        ]
+
+
+async def outbox(session_factory) -> dict[int, models.OutgoingMail]:
+    async with session_factory() as db:
+        return {mail.id: mail for mail in await db.scalars(select(models.OutgoingMail))}
+
+
+async def test_batch_reuses_one_connection(session_factory, smtp_server):
+    await enqueue(session_factory, *(f"user{i}@example.com" for i in range(5)))
+    worker = mailer.MailWorker(session_factory, connections=[connection(smtp_server.port)])
+
+    await worker.drain()
+    await worker.stop()
+
+    assert len(smtp_server.recipients) == 5
+    assert len({peer for peer, _ in smtp_server.recorder.messages}) == 1
+    assert worker.connects == 1
+    assert all(mail.sent_at is not None for mail in (await outbox(session_factory)).values())
+
+
+async def test_reconnects_after_dropped_connection(session_factory, smtp_server):
+    worker = mailer.MailWorker(session_factory, connections=[connection(smtp_server.port)])
+    await enqueue(session_factory, "first@example.com")
+    await worker.drain()
+
+    # сервер перезапустился и оборвал соединение, которое держит воркер
+    smtp_server.stop()
+    smtp_server.start()
+    await enqueue(session_factory, "second@example.com")
+    await worker.drain()
+    await worker.stop()
+
+    assert smtp_server.recipients == [["first@example.com"], ["second@example.com"]]
+    assert worker.connects == 2
+    assert worker.stats["retried"] == 0
+    assert all(mail.sent_at is not None for mail in (await outbox(session_factory)).values())
+
+
+async def test_delivery_failures_are_reported(session_factory, smtp_server):
+    ok, bounced, deferred = await enqueue(session_factory, "ok@example.com", "bounce@example.com", "later@example.com")
+    worker = mailer.MailWorker(session_factory, connections=[connection(smtp_server.port)])
+
+    await worker.drain()
+    metrics = await worker.metrics()
+    await worker.stop()
+    mails = await outbox(session_factory)
+
+    assert mails[ok].sent_at is not None
+    # 5xx — окончательный отказ: попытки исчерпаны, письмо больше не берётся
+    assert mails[bounced].sent_at is None
+    assert mails[bounced].attempts == mailer.MAX_ATTEMPTS
+    assert "550" in mails[bounced].last_error
+    # 4xx — повтор позже
+    assert mails[deferred].sent_at is None
+    assert mails[deferred].attempts == 1
+    assert "451" in mails[deferred].last_error
+    assert mails[deferred].next_attempt_at > datetime.utcnow()
+
+    assert (metrics["sent"], metrics["failed"], metrics["retried"]) == (1, 1, 1)
+    assert metrics["queue_depth"] == 1
+    assert smtp_server.recipients == [["ok@example.com"]]
+    assert worker.connects == 1  # отказ в адресе не рвёт соединение
+
+
+async def test_unreachable_server_is_retried(session_factory):
+    (mail_id,) = await enqueue(session_factory, "user@example.com")
+    worker = mailer.MailWorker(session_factory, connections=[connection(free_port())])
+
+    await worker.drain()
+
+    mail = (await outbox(session_factory))[mail_id]
+    assert mail.sent_at is None
+    assert mail.last_error
+    assert mail.next_attempt_at > datetime.utcnow()
+    assert worker.stats["retried"] == 1
@@ -0,0 +1,133 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+import database
+import mailer
+import models
+import ratelimit
+import reset_tokens
+import sessions
+from routers import password_reset
+
+pytestmark = pytest.mark.anyio
+
+EMAIL = "alice@example.com"
+
+
+@pytest.fixture
+async def client(monkeypatch, session_factory, redis):
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+
+    # письма не уходят в очередь: ссылку из них забирает тест
+    outbox = []
+
+    async def enqueue(db, message, *args, **kwargs):
+        outbox.append(message.get_content())
+        return len(outbox)
+
+    monkeypatch.setattr(mailer, "enqueue", enqueue)
+    monkeypatch.setattr(ratelimit, "_buckets", ratelimit.OrderedDict())
+
+    async with session_factory() as db:
+        db.add(models.User(username="alice", email=EMAIL, hashed_password="x"))
+        await db.commit()
+
+    app = FastAPI()
+    app.include_router(password_reset.router, prefix="/auth")
+    app.dependency_overrides[database.get_db] = get_db
+    app.state.redis = redis
+    app.state.mail_worker = SimpleNamespace(notify=lambda: None)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        client.outbox = outbox
+        yield client
+
+
+async def request_token(client, redis) -> str:
+    await redis.delete(reset_tokens.COOLDOWN_KEY.format(EMAIL))
+    response = await client.post("/auth/forgot-password", json={"email": EMAIL})
+    assert response.status_code == 200
+    return re.search(r"token=(\S+)", client.outbox[-1]).group(1)
+
+
+async def reset(client, token: str) -> httpx.Response:
+    return await client.post("/auth/reset-password", json={"token": token, "new_password": "newpass123"})
+
+
+async def test_cooldown_returns_retry_after(client):
+    assert (await client.post("/auth/forgot-password", json={"email": EMAIL})).status_code == 200
+
+    response = await client.post("/auth/forgot-password", json={"email": EMAIL.upper()})
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= reset_tokens.COOLDOWN
+    assert len(client.outbox) == 1
+
+
+async def test_token_works_once(client, redis):
+    token = await request_token(client, redis)
+
+    assert (await reset(client, token)).status_code == 200
+    response = await reset(client, token)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Token has already been used"
+
+
+async def test_token_expires(client, redis, monkeypatch):
+    monkeypatch.setattr(reset_tokens, "TOKEN_TTL", 1)
+    token = await request_token(client, redis)
+
+    await asyncio.sleep(2.1)
+    assert not await redis.keys(reset_tokens.TOKEN_KEY.format("*"))
+    response = await reset(client, token)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Token has expired"
+
+
+async def test_new_token_revokes_previous(client, redis):
+    first = await request_token(client, redis)
+    second = await request_token(client, redis)
+
+    response = await reset(client, first)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Token has already been used"
+    assert (await reset(client, second)).status_code == 200
+
+
+async def test_failed_reset_keeps_token_unless_superseded(redis):
+    await reset_tokens.register(redis, "a", EMAIL)
+    assert await reset_tokens.consume(redis, "a") == EMAIL
+    assert await reset_tokens.restore(redis, "a", EMAIL, 60)
+    assert await reset_tokens.is_active(redis, "a")
+
+    await reset_tokens.consume(redis, "a")
+    await reset_tokens.register(redis, "b", EMAIL)
+    assert not await reset_tokens.restore(redis, "a", EMAIL, 60)
+    assert not await reset_tokens.is_active(redis, "a")
+
+
+async def test_reset_fails_closed_without_revocation(client, redis, session_factory, monkeypatch):
+    token = await request_token(client, redis)
+
+    revoke_user = sessions.revoke_user
+
+    async def unavailable(redis, user_id):
+        raise RedisError("down")
+
+    monkeypatch.setattr(sessions, "revoke_user", unavailable)
+    response = await reset(client, token)
+    assert response.status_code == 503
+    async with session_factory() as db:
+        assert (await db.scalar(select(models.User.hashed_password))) == "x"
+
+    # пароль не сменился — ссылка из письма остаётся рабочей
+    monkeypatch.setattr(sessions, "revoke_user", revoke_user)
+    assert (await reset(client, token)).status_code == 200
@@ -0,0 +1,86 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+
+import database
+import ratelimit
+
+
+def make_request(peer: str, *forwarded: str) -> Request:
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded]
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers, "client": (peer, 4321)})
+
+
+@pytest.fixture
+def proxies(monkeypatch):
+    monkeypatch.setattr(ratelimit, "TRUSTED_PROXIES", (ipaddress.ip_network("10.0.0.0/8"),))
+
+
+def test_forwarded_header_ignored_without_trusted_proxy():
+    assert ratelimit.client_ip(make_request("203.0.113.5", "1.2.3.4")) == "203.0.113.5"
+
+
+def test_spoofed_leftmost_hop_ignored(proxies):
+    # клиент прислал «1.2.3.4», балансировщик дописал его настоящий адрес
+    request = make_request("10.1.2.3", "1.2.3.4, 203.0.113.5")
+    assert ratelimit.client_ip(request) == "203.0.113.5"
+
+
+def test_trusted_hops_skipped(proxies):
+    request = make_request("10.1.2.3", "1.2.3.4, 203.0.113.5", "10.9.9.9")
+    assert ratelimit.client_ip(request) == "203.0.113.5"
+
+
+def test_untrusted_peer_cannot_spoof(proxies):
+    assert ratelimit.client_ip(make_request("198.51.100.7", "10.1.1.1")) == "198.51.100.7"
+
+
+# --- Вебхук Stripe ---
+SECRET = "whsec_test"
+
+
+def sign(payload: bytes, secret: str = SECRET) -> str:
+    timestamp = int(time.time())
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+@pytest.fixture
+async def webhook_client(monkeypatch, session_factory):
+    from routers import auth
+
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+
+    monkeypatch.setattr(auth, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(ratelimit, "_buckets", ratelimit.OrderedDict())
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/auth")
+    app.dependency_overrides[database.get_db] = get_db
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+async def test_unsigned_flood_does_not_block_stripe(webhook_client):
+    budget = ratelimit.RULES["webhook_invalid"].limits[0].times
+    codes = [
+        (await webhook_client.post("/auth/webhook", content=b"{}", headers={"stripe-signature": "t=1,v1=bad"})).status_code
+        for _ in range(budget + 1)
+    ]
+    assert codes[:budget] == [400] * budget
+    assert codes[-1] == 429
+
+    # событие без обработчика: принимается, но в очередь не сохраняется
+    payload = json.dumps({"id": "evt_1", "object": "event", "type": "customer.created", "data": {"object": {}}}).encode()
+    response = await webhook_client.post("/auth/webhook", content=payload, headers={"stripe-signature": sign(payload)})
+    assert response.status_code == 200
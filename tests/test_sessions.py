@@ -0,0 +1,14 @@
+import asyncio
+
+import pytest
+
+import sessions
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_revocations_only_raise_boundary(redis):
+    # смена пароля в одной вкладке и сброс в другой: каждая граница выше предыдущей
+    boundaries = await asyncio.gather(*(sessions.revoke_user(redis, 7) for _ in range(20)))
+    assert len(set(boundaries)) == len(boundaries)
+    assert int(await redis.get(sessions.NOT_BEFORE_KEY.format(7))) == max(boundaries)
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+
+import pytest
+
+import models
+import user_cache
+
+pytestmark = pytest.mark.anyio
+
+
+def row(avatar: str) -> models.User:
+    return models.User(id=1, username="alice", email="alice@example.com", hashed_password="x",
+                       amount=0.0, avatar=avatar, philanthrop_level="0")
+
+
+class Db:
+    """Вместо AsyncSession: отдаёт строку, а перед этим может выполнить `before`."""
+
+    def __init__(self, avatar: str, before=None):
+        self.avatar = avatar
+        self.before = before
+        self.reads = 0
+
+    async def scalar(self, statement):
+        self.reads += 1
+        if self.before is not None:
+            await self.before()
+        return row(self.avatar)
+
+
+@pytest.fixture(autouse=True)
+def local(monkeypatch):
+    monkeypatch.setattr(user_cache, "_local", OrderedDict())
+
+
+async def test_miss_is_cached(redis):
+    db = Db("a.webp")
+    assert (await user_cache.get_user(redis, db, "alice")).avatar == "a.webp"
+    assert (await user_cache.get_user(redis, db, "alice")).avatar == "a.webp"
+    assert db.reads == 1
+    assert await redis.get(user_cache.KEY.format("alice"))
+
+
+async def test_invalidate_during_miss_keeps_old_row_out(redis):
+    # строка прочитана до коммита профиля, а invalidate прошёл до записи в кэш
+    async def profile_updated():
+        await user_cache.invalidate(redis, "alice")
+
+    stale = Db("old.webp", before=profile_updated)
+    assert (await user_cache.get_user(redis, stale, "alice")).avatar == "old.webp"
+    assert await redis.get(user_cache.KEY.format("alice")) is None
+    assert "alice" not in user_cache._local
+
+    fresh = Db("new.webp")
+    assert (await user_cache.get_user(redis, fresh, "alice")).avatar == "new.webp"
+    assert fresh.reads == 1
+    assert (await user_cache.get_user(redis, fresh, "alice")).avatar == "new.webp"
+    assert fresh.reads == 1
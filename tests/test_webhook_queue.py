@@ -0,0 +1,153 @@
+"""Очередь вебхуков на локальном источнике событий: события кладутся через
+`store_event`, как это делает /auth/webhook, и применяются `drain()`."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+import donations
+import leaderboard
+import models
+import webhook_queue
+from webhook_queue import WebhookWorker
+
+pytestmark = pytest.mark.anyio
+
+
+def checkout_event(event_id: str, user_id: int, amount: int, session_id: str | None = None) -> dict:
+    return {
+        "id": event_id,
+        "type": "checkout.session.completed",
+        "created": int(datetime.utcnow().timestamp()),
+        "data": {"object": {
+            "id": session_id or f"cs_{event_id}",
+            "customer_details": {"email": f"user{user_id}@example.com"},
+            "amount_total": amount * 100,
+            "client_reference_id": str(user_id),
+        }},
+    }
+
+
+async def deliver(session_factory, event: dict) -> bool:
+    async with session_factory() as db:
+        return await webhook_queue.store_event(db, event, json.dumps(event))
+
+
+@pytest.fixture
+async def users(session_factory):
+    async with session_factory() as db:
+        for user_id in (1, 2, 3):
+            db.add(models.User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com", hashed_password="x"))
+        await db.commit()
+
+
+async def user_amounts(session_factory) -> dict[int, float]:
+    async with session_factory() as db:
+        return dict((await db.execute(select(models.User.id, models.User.amount))).all())
+
+
+async def pending(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(
+            select(func.count()).select_from(models.StripeEvent).where(models.StripeEvent.processed_at.is_(None))
+        )
+
+
+async def donations_count(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(models.Donation))
+
+
+async def test_duplicate_event_is_applied_once(session_factory, users, redis):
+    event = checkout_event("evt_1", user_id=1, amount=60)
+    assert await deliver(session_factory, event)
+    assert not await deliver(session_factory, event)
+    # повтор с новым id события, но той же checkout session
+    assert await deliver(session_factory, checkout_event("evt_2", user_id=1, amount=60, session_id="cs_evt_1"))
+
+    await WebhookWorker(session_factory, redis).drain()
+
+    assert (await user_amounts(session_factory))[1] == 60
+    async with session_factory() as db:
+        assert await db.scalar(select(func.count()).select_from(models.Donation)) == 1
+        assert await db.scalar(select(func.count()).select_from(models.StripeEvent)) == 2
+    assert await pending(session_factory) == 0
+
+
+async def test_lease_of_crashed_worker_is_retried(session_factory, users, redis):
+    await deliver(session_factory, checkout_event("evt_1", user_id=2, amount=100))
+
+    # воркер забрал событие и упал до коммита
+    async with session_factory() as db:
+        claimed = await webhook_queue.claim_batch(db, 10)
+    assert claimed == ["evt_1"]
+
+    worker = WebhookWorker(session_factory, redis)
+    assert await worker.run_once() == 0  # аренда ещё действует
+    assert (await user_amounts(session_factory))[2] == 0
+
+    async with session_factory() as db:
+        await db.execute(update(models.StripeEvent).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+    await worker.drain()
+
+    assert (await user_amounts(session_factory))[2] == 100
+    async with session_factory() as db:
+        event = await db.get(models.StripeEvent, "evt_1")
+    assert event.processed_at is not None
+    assert event.attempts == 2
+
+
+async def test_failed_batch_is_released_for_retry(session_factory, users, redis, monkeypatch):
+    await deliver(session_factory, checkout_event("evt_1", user_id=3, amount=40))
+
+    async def broken(db, items, created_at=None):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(donations, "record_donations", broken)
+    worker = WebhookWorker(session_factory, redis)
+    assert await worker.run_once() == 1
+
+    async with session_factory() as db:
+        event = await db.get(models.StripeEvent, "evt_1")
+    assert event.processed_at is None
+    assert "database went away" in event.last_error
+    assert event.locked_until > datetime.utcnow()  # отложено с задержкой, не потеряно
+    assert await donations_count(session_factory) == 0
+
+    monkeypatch.undo()
+    async with session_factory() as db:
+        await db.execute(update(models.StripeEvent).values(locked_until=None))
+        await db.commit()
+    await worker.drain()
+
+    assert (await user_amounts(session_factory))[3] == 40
+    assert await pending(session_factory) == 0
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 50])
+async def test_drain_credits_totals(session_factory, users, redis, batch_size):
+    deliveries = [("evt_1", 1, 30), ("evt_2", 1, 40), ("evt_3", 2, 100), ("evt_4", 3, 20), ("evt_5", 1, 5), ("evt_6", 99, 70)]
+    for event_id, user_id, amount in deliveries:
+        await deliver(session_factory, checkout_event(event_id, user_id, amount))
+
+    await WebhookWorker(session_factory, redis, batch_size=batch_size).drain()
+
+    expected = {1: 75, 2: 100, 3: 20}
+    assert await user_amounts(session_factory) == expected
+    assert await pending(session_factory) == 0
+    assert await donations_count(session_factory) == 5  # событие несуществующего пользователя пропущено
+
+    async with session_factory() as db:
+        totals = (await db.execute(
+            select(models.DonationTotal.user_id, models.DonationTotal.period, models.DonationTotal.total)
+        )).all()
+        levels = dict((await db.execute(select(models.User.id, models.User.philanthrop_level))).all())
+    for period in donations.PERIODS:
+        assert {user_id: total for user_id, p, total in totals if p == period} == expected
+    assert levels == {user_id: donations.philanthrop_level(amount) for user_id, amount in expected.items()}
+
+    board = dict(await redis.zrange(leaderboard.BOARD_KEY, 0, -1, withscores=True))
+    assert board == {str(user_id): amount for user_id, amount in expected.items()}
+    assert dict(await redis.zrange(leaderboard.board_key("day"), 0, -1, withscores=True)) == board
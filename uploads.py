@@ -0,0 +1,105 @@
+"""Приём загрузок: ранний отказ по размеру, глобальный лимит, спул на диск.
+
+`UploadLimitMiddleware` стоит перед роутерами и для multipart-запросов:
+
+- отвечает 413, не читая тело, если Content-Length больше лимита пути;
+- считает байты по мере чтения и обрывает разбор формы (413), как только
+  лимит превышен — для запросов без Content-Length или с неверным;
+- резервирует размер тела в общем на процесс бюджете
+  UPLOAD_INFLIGHT_BYTES; если бюджета нет, сразу отвечает 503 с
+  Retry-After, а не принимает ещё десяток файлов по 10 МБ.
+
+Файлы формы Starlette держит в SpooledTemporaryFile; порог, после которого
+они уходят из памяти на диск, снижен до UPLOAD_SPOOL_BYTES.
+
+`sniff_image` определяет тип картинки по первым байтам, не доверяя
+расширению и Content-Type клиента.
+"""
+import os
+
+from fastapi import HTTPException
+from starlette.formparsers import MultiPartParser
+from starlette.responses import JSONResponse
+
+DEFAULT_LIMIT = int(os.getenv("UPLOAD_DEFAULT_LIMIT", str(1024 * 1024)))
+INFLIGHT_LIMIT = int(os.getenv("UPLOAD_INFLIGHT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(64 * 1024)))
+FORM_OVERHEAD = 64 * 1024  # поля формы и заголовки частей сверх самих файлов
+RETRY_AFTER = 2
+
+# Порог спула файлов формы в память (по умолчанию в Starlette — 1 МБ)
+MultiPartParser.max_file_size = SPOOL_BYTES
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+stats = {"inflight_bytes": 0, "rejected_too_large": 0, "rejected_busy": 0}
+
+
+def sniff_image(head: bytes) -> str | None:
+    """Тип картинки (png/jpeg/gif/webp) по первым 12+ байтам или None."""
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _too_large(limit: int) -> str:
+    return f"Request body is too large (maximum {limit // (1024 * 1024)} MB)"
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, limits: dict[str, int] | None = None, default_limit: int = DEFAULT_LIMIT, inflight_limit: int = INFLIGHT_LIMIT):
+        self.app = app
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.inflight_limit = inflight_limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        limit = self.limits.get(scope["path"], self.default_limit)
+        length = headers.get(b"content-length")
+        length = int(length) if length and length.isdigit() else None
+        if length is not None and length > limit:
+            stats["rejected_too_large"] += 1
+            return await JSONResponse({"detail": _too_large(limit)}, status_code=413)(scope, receive, send)
+
+        reserved = length if length is not None else limit
+        if stats["inflight_bytes"] + reserved > self.inflight_limit:
+            stats["rejected_busy"] += 1
+            response = JSONResponse(
+                {"detail": "Too many uploads in progress, please try again"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    stats["rejected_too_large"] += 1
+                    # HTTPException из receive FastAPI не превращает в 400 и отдаёт как есть
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        stats["inflight_bytes"] += reserved
+        try:
+            await self.app(scope, limited_receive, send)
+        finally:
+            stats["inflight_bytes"] -= reserved
@@ -0,0 +1,216 @@
+"""Кэш пользователя по username из сессии.
+
+Страницы и API, которым нужен не только id и имя из токена сессии
+(welcome, profile, create-checkout-session, /api/events), берут
+пользователя через зависимость `current_user`, а не отдельным SELECT на
+каждый запрос.
+
+Два уровня: LRU с TTL в памяти процесса и JSON в Redis с более длинным
+TTL. Промах по обоим идёт в базу. В кэше лежит `CachedUser` — снимок
+без хэша пароля; код, который меняет пользователя, читает строку из базы
+сам и после коммита вызывает `invalidate`. Сброс публикуется в канал
+Redis, и каждый процесс убирает запись из своего локального уровня.
+
+`invalidate` увеличивает поколение пользователя (`user_cache:gen:`).
+Промах запоминает поколение до SELECT и пишет строку в Redis, только
+если оно не изменилось (Lua, `STORE`), — иначе чтение, начатое до
+коммита, вернуло бы в кэш старую строку.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from fastapi import Depends, Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import sessions
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TTL = float(os.getenv("USER_CACHE_LOCAL_TTL", "60"))
+LOCAL_SIZE = int(os.getenv("USER_CACHE_LOCAL_SIZE", "10000"))
+REDIS_TTL = int(os.getenv("USER_CACHE_REDIS_TTL", "600"))
+
+KEY = "user_cache:{}"
+GEN_KEY = "user_cache:gen:{}"
+CHANNEL = "user_cache:invalidate"
+
+# KEYS — запись и поколение; ARGV — поколение до SELECT ('' — не было), JSON, TTL
+STORE = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    username: str
+    email: str
+    amount: float
+    last_donation_time: datetime | None
+    avatar: str | None
+    philanthrop_level: str
+
+    @classmethod
+    def from_model(cls, user: models.User) -> "CachedUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            amount=user.amount or 0.0,
+            last_donation_time=user.last_donation_time,
+            avatar=user.avatar,
+            philanthrop_level=user.philanthrop_level,
+        )
+
+    def dumps(self) -> str:
+        data = asdict(self)
+        if self.last_donation_time:
+            data["last_donation_time"] = self.last_donation_time.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, raw: str) -> "CachedUser":
+        data = json.loads(raw)
+        if data["last_donation_time"]:
+            data["last_donation_time"] = datetime.fromisoformat(data["last_donation_time"])
+        return cls(**data)
+
+
+# --- Локальный уровень ---
+_local: OrderedDict[str, tuple[float, CachedUser]] = OrderedDict()
+# сбросы локального уровня: промах, во время которого был сброс, строку не кладёт
+_drops = 0
+
+
+def _local_get(username: str) -> CachedUser | None:
+    entry = _local.get(username)
+    if entry is None:
+        return None
+    expires, user = entry
+    if expires < time.monotonic():
+        del _local[username]
+        return None
+    _local.move_to_end(username)
+    return user
+
+
+def _local_put(user: CachedUser) -> None:
+    _local[user.username] = (time.monotonic() + LOCAL_TTL, user)
+    _local.move_to_end(user.username)
+    while len(_local) > LOCAL_SIZE:
+        _local.popitem(last=False)
+
+
+def _local_drop(usernames) -> None:
+    global _drops
+    _drops += 1
+    for username in usernames:
+        _local.pop(username, None)
+
+
+# --- Чтение ---
+async def get_user(redis: Redis | None, db: AsyncSession, username: str) -> CachedUser | None:
+    user = _local_get(username)
+    if user is not None:
+        stats["local_hits"] += 1
+        return user
+
+    drops = _drops
+    generation = None
+    if redis is not None:
+        try:
+            raw, generation = await redis.mget(KEY.format(username), GEN_KEY.format(username))
+        except RedisError:
+            logger.warning("User cache unavailable in Redis", exc_info=True)
+            redis = None
+        else:
+            if raw:
+                stats["redis_hits"] += 1
+                user = CachedUser.loads(raw)
+                _local_put(user)
+                return user
+
+    stats["misses"] += 1
+    row = await db.scalar(select(models.User).where(models.User.username == username))
+    if row is None:
+        return None
+    user = CachedUser.from_model(row)
+    if redis is not None:
+        try:
+            await redis.eval(
+                STORE, 2, KEY.format(username), GEN_KEY.format(username), generation or "", user.dumps(), REDIS_TTL
+            )
+        except RedisError:
+            logger.warning("Failed to cache user %s in Redis", username, exc_info=True)
+    if drops == _drops:
+        _local_put(user)
+    return user
+
+
+async def current_user(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    session: sessions.Session | None = Depends(sessions.current_session),
+) -> CachedUser | None:
+    """Зависимость: пользователь текущей сессии или None."""
+    if session is None:
+        return None
+    user = await get_user(getattr(request.app.state, "redis", None), db, session.username)
+    # имя из старого токена могло достаться другому пользователю после переименования
+    return user if user is not None and user.id == session.user_id else None
+
+
+# --- Сброс ---
+async def invalidate(redis: Redis | None, *usernames: str) -> None:
+    """Убирает пользователей из кэша всех процессов. Вызывать после коммита."""
+    usernames = [name for name in usernames if name]
+    if not usernames:
+        return
+    stats["invalidations"] += len(usernames)
+    _local_drop(usernames)
+    if redis is None:
+        return
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            # поколение — до удаления: промах, записавший строку между ними, её не переживёт
+            for name in usernames:
+                pipe.incr(GEN_KEY.format(name))
+                pipe.expire(GEN_KEY.format(name), REDIS_TTL)
+            pipe.delete(*(KEY.format(name) for name in usernames))
+            pipe.publish(CHANNEL, json.dumps(usernames))
+            await pipe.execute()
+    except RedisError:
+        # остальные процессы увидят изменения не позже USER_CACHE_LOCAL_TTL
+        logger.warning("Failed to invalidate cached users %s", usernames, exc_info=True)
+
+
+async def listen(redis: Redis) -> None:
+    """Фоновая задача: сбрасывает локальный уровень по сообщениям других процессов."""
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _local_drop(json.loads(message["data"]))
+        except RedisError:
+            logger.warning("User cache invalidation channel lost, reconnecting", exc_info=True)
+            _local.clear()
+            await asyncio.sleep(1)
@@ -0,0 +1,271 @@
+"""Очередь вебхуков Stripe: принять быстро, применить в фоне ровно один раз.
+
+Обработчик /auth/webhook только проверяет подпись и сохраняет сырое событие
+в `stripe_events` (id события — первичный ключ, повторная доставка
+отбрасывается) и сразу отвечает 200. Пул воркеров забирает необработанные
+события пачками и применяет их через асинхронную сессию.
+
+Доставка — «хотя бы один раз»: событие берётся в аренду (`locked_until`), и
+если воркер упал до коммита, после окончания аренды его заберёт другой.
+Эффект — ровно один: донат и отметка `processed_at` коммитятся в одной
+транзакции, а журнал донатов дополнительно уникален по checkout session.
+
+Пачка применяется одной транзакцией: донаты одного пользователя
+складываются (см. `donations.record_donations`), а после пробуждения воркер
+ждёт до WEBHOOK_BATCH_WAIT_MS, чтобы во время всплеска собрать пачку
+побольше. Если пачка падает, события применяются по одному, чтобы одно
+«ядовитое» событие не блокировало остальные.
+
+Источник событий для тестов — любая фабрика сессий (например, SQLite в
+памяти): события кладутся через `store_event`, а `WebhookWorker.drain()`
+обрабатывает очередь до конца без фоновых задач.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from redis.exceptions import RedisError
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import campaigns
+import donations
+import events
+import leaderboard
+import metrics
+import models
+import user_cache
+
+logger = logging.getLogger(__name__)
+
+HANDLED_EVENTS = {"checkout.session.completed"}
+
+WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "200"))
+BATCH_WAIT = int(os.getenv("WEBHOOK_BATCH_WAIT_MS", "50")) / 1000
+POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "1.0"))
+LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "10"))
+
+_received_lag = metrics.webhook_lag.labels("received")
+_created_lag = metrics.webhook_lag.labels("created")
+
+
+# --- Приём ---
+async def store_event(db: AsyncSession, event: dict, payload: str) -> bool:
+    """Сохраняет событие. False — событие уже было принято раньше (повтор Stripe)."""
+    created = event.get("created")
+    db.add(models.StripeEvent(
+        id=event["id"],
+        type=event["type"],
+        payload=payload,
+        event_created_at=datetime.utcfromtimestamp(created) if created else None,
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    return True
+
+
+# --- Применение ---
+async def claim_batch(db: AsyncSession, limit: int) -> list[str]:
+    """Берёт в аренду до `limit` необработанных событий и возвращает их id.
+
+    События захватываются одним условным UPDATE с уникальным токеном,
+    поэтому несколько процессов не получат одно и то же событие.
+    """
+    now = datetime.utcnow()
+    available = (
+        models.StripeEvent.processed_at.is_(None),
+        or_(models.StripeEvent.locked_until.is_(None), models.StripeEvent.locked_until < now),
+    )
+    candidates = (await db.scalars(
+        select(models.StripeEvent.id)
+        .where(models.StripeEvent.attempts < MAX_ATTEMPTS, *available)
+        .order_by(models.StripeEvent.received_at)
+        .limit(limit)
+    )).all()
+    if not candidates:
+        await db.rollback()
+        return []
+
+    token = uuid.uuid4().hex
+    await db.execute(
+        update(models.StripeEvent)
+        .where(models.StripeEvent.id.in_(candidates), *available)
+        .values(
+            locked_until=now + timedelta(seconds=LEASE_SECONDS),
+            claim_token=token,
+            attempts=models.StripeEvent.attempts + 1,
+        )
+    )
+    claimed = (await db.scalars(
+        select(models.StripeEvent.id).where(models.StripeEvent.claim_token == token)
+    )).all()
+    await db.commit()
+    return claimed
+
+
+def _checkout_credit(event: dict) -> tuple[int, float, str | None, int | None] | None:
+    """(user_id, сумма, checkout session, кампания) из checkout.session.completed или None."""
+    session = event["data"]["object"]
+    customer_email = (session.get("customer_details") or {}).get("email")
+    amount_total = (session.get("amount_total") or 0) // 100
+    user_id = session.get("client_reference_id")
+    if not customer_email or amount_total <= 0 or not str(user_id or "").isdigit():
+        return None
+    campaign_id = str((session.get("metadata") or {}).get("campaign_id") or "")
+    return int(user_id), amount_total, session.get("id"), int(campaign_id) if campaign_id.isdigit() else None
+
+
+async def apply_batch(db: AsyncSession, event_ids: list[str]) -> list:
+    """Применяет пачку событий одной транзакцией и отмечает их обработанными."""
+    events = (await db.execute(
+        select(
+            models.StripeEvent.id, models.StripeEvent.type, models.StripeEvent.payload,
+            models.StripeEvent.event_created_at, models.StripeEvent.received_at,
+        )
+        .where(models.StripeEvent.id.in_(event_ids))
+    )).all()
+    items = []
+    for _, event_type, payload, _, _ in events:
+        if event_type == "checkout.session.completed":
+            credit = _checkout_credit(json.loads(payload))
+            if credit:
+                items.append(credit)
+
+    credited = await donations.record_donations(db, items) if items else []
+    await db.execute(
+        update(models.StripeEvent)
+        .where(models.StripeEvent.id.in_(event_ids))
+        .values(processed_at=datetime.utcnow(), last_error=None)
+    )
+    await db.commit()
+    now = datetime.utcnow()
+    for *_, created_at, received_at in events:
+        metrics.webhook_lag.observe_series(_received_lag, (now - received_at).total_seconds())
+        if created_at:
+            metrics.webhook_lag.observe_series(_created_lag, (now - created_at).total_seconds())
+    return credited
+
+
+async def apply_one(db: AsyncSession, event_id: str) -> list:
+    """Применяет одно событие; при ошибке откладывает его с экспоненциальной задержкой."""
+    attempts = await db.scalar(select(models.StripeEvent.attempts).where(models.StripeEvent.id == event_id))
+    try:
+        return await apply_batch(db, [event_id])
+    except Exception as e:
+        await db.rollback()
+        logger.exception("Failed to apply Stripe event %s (attempt %s)", event_id, attempts)
+        # повтор с экспоненциальной задержкой, пока не кончатся попытки
+        retry_at = datetime.utcnow() + timedelta(seconds=min(2 ** attempts, LEASE_SECONDS * 10))
+        await db.execute(
+            update(models.StripeEvent)
+            .where(models.StripeEvent.id == event_id)
+            .values(last_error=repr(e)[:1000], locked_until=retry_at)
+        )
+        await db.commit()
+        return []
+
+
+async def process_batch(session_factory: async_sessionmaker, limit: int = BATCH_SIZE) -> tuple[int, list]:
+    """Забирает и применяет пачку событий. Возвращает (число событий, зачисления)."""
+    async with session_factory() as db:
+        event_ids = await claim_batch(db, limit)
+        if not event_ids:
+            return 0, []
+        try:
+            return len(event_ids), await apply_batch(db, event_ids)
+        except Exception:
+            await db.rollback()
+            logger.warning("Batch of %s Stripe events failed, applying one by one", len(event_ids), exc_info=True)
+        credited = []
+        for event_id in event_ids:
+            credited += await apply_one(db, event_id)
+        return len(event_ids), credited
+
+
+# --- Воркеры ---
+class WebhookWorker:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        redis=None,
+        workers: int = WORKERS,
+        batch_size: int = BATCH_SIZE,
+        batch_wait: float = BATCH_WAIT,
+    ):
+        self.session_factory = session_factory
+        self.redis = redis
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self):
+        """Будит воркеры сразу после приёма события, не дожидаясь опроса."""
+        self._wakeup.set()
+
+    async def run_once(self) -> int:
+        count, credited = await process_batch(self.session_factory, self.batch_size)
+        for user, totals, donated_at in credited:
+            await self._after_credit(user, totals, donated_at)
+        if credited:
+            # один пересчёт топа на пачку, а не на каждый донат
+            await events.publish_top(self.redis)
+        if any(user.campaigns for user, _, _ in credited):
+            await campaigns.bump(self.redis)
+        return count
+
+    async def drain(self) -> None:
+        """Обрабатывает очередь, пока в ней есть готовые события."""
+        while await self.run_once():
+            pass
+
+    async def _after_credit(self, user, totals, donated_at):
+        await user_cache.invalidate(self.redis, user.username)
+        if self.redis is None:
+            return
+        try:
+            await leaderboard.sync_user(self.redis, user, window_totals=totals, at=donated_at)
+            rank = await leaderboard.rank(self.redis, user.id)
+        except RedisError:
+            # база уже обновлена; расхождение исправит `python leaderboard.py rebuild`
+            logger.warning("Failed to sync user %s to leaderboard", user.id, exc_info=True)
+            rank = None
+        await events.publish(self.redis, "donation-credited", {
+            "amount": user.amount,
+            "philanthrop_level": user.philanthrop_level,
+            "rank": rank,
+        }, user_id=user.id)
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Webhook worker iteration failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+                # даём пачке набраться, пока идёт всплеск событий
+                await asyncio.sleep(self.batch_wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []